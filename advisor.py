@@ -0,0 +1,76 @@
+"""Index advisor: propose indexes from the recorded query workload and prove them on a copy.
+
+Usage:
+    python advisor.py
+    python advisor.py --top 100 --repeat 7 --min-gain 0.2
+    python advisor.py --promote
+
+Queries run through the app are logged by fingerprint with their latency.
+The advisor mines the heaviest ones' plans for full scans, automatic indexes
+and temp B-tree sorts, proposes plain, covering and expression indexes, and
+replays the workload against a sidecar copy of the database with and without
+each one. Only indexes that clear --min-gain, and that still win when applied
+together, are reported as winners; --promote creates them on the real database.
+"""
+
+import argparse
+import json
+import sys
+
+import config
+from database.advisor import advise
+from database.workload import get_workload_log
+
+
+def print_report(report):
+    print(f"{report.queries} logged queries analysed")
+    if report.hot_scans:
+        print("Full scans (weighted by executions): "
+              + ", ".join(f"{table} x{count}" for table, count in report.hot_scans.items()))
+    if report.hot_sorts:
+        print("Temp B-tree sorts: " + ", ".join(f"{purpose} x{count}" for purpose, count in report.hot_sorts.items()))
+
+    if not report.candidates:
+        print("No index candidates found")
+        return
+
+    print()
+    for candidate in report.candidates:
+        marker = "*" if candidate in report.winners else " "
+        print(f"{marker} {candidate.gain:7.1%}  {candidate.before_ms:9.2f} -> {candidate.after_ms:9.2f} ms  "
+              f"[{candidate.reason}, {candidate.affected} queries]  {candidate.ddl}")
+
+    if report.winners:
+        change = 1 - report.workload_after_ms / report.workload_before_ms if report.workload_before_ms else 0.0
+        print(f"\nWhole workload: {report.workload_before_ms:.2f} -> {report.workload_after_ms:.2f} ms ({change:.1%})")
+    if report.promoted:
+        print("Promoted: " + ", ".join(report.promoted))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recommend and verify indexes for the logged query workload")
+    parser.add_argument("--top", type=int, default=50, help="Analyse the N queries with the most total time")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per query (the median is used)")
+    parser.add_argument("--min-gain", type=float, default=config.ADVISOR_MIN_GAIN,
+                        help="Minimum fractional latency reduction on affected queries")
+    parser.add_argument("--promote", action="store_true", help="Create the winning indexes on the database")
+    parser.add_argument("--clear", action="store_true", help="Empty the workload log and exit")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.clear:
+        get_workload_log().clear()
+        return 0
+
+    report = advise(top=args.top, repeat=max(1, args.repeat), min_gain=args.min_gain, apply=args.promote)
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2))
+    else:
+        print_report(report)
+    if args.promote and report.winners and not report.promoted:
+        print("Winners did not improve the whole workload together; nothing promoted", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,17 @@
 """Text-to-SQL Data Query Assistant"""
 
+import json
+import queue
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
 import streamlit as st
-import pandas as pd
 
 import config
-from database import execute_query, get_table_names
-from llm import generate_sql_response
-from utils import validate_sql, sanitize_sql
-from visualization import create_chart
+from utils.tracing import start_metrics_server
+
+# pandas, database and pipeline (and through it the LLM and chart modules)
+# are imported inside the functions below, after the header has been sent
+# to the browser
 
 st.set_page_config(
     page_title="Text-to-SQL Data Query Assistant",
@@ -125,15 +129,43 @@ EXAMPLE_QUERIES = {
 }
 
 
+@st.cache_resource(show_spinner=False)
+def load_engine():
+    # The engine's event loop owns the async LLM clients, so they live as
+    # long as this resource does
+    from pipeline import get_engine
+    return get_engine()
+
+
+def database_version():
+    from database import get_database_version
+    return get_database_version()
+
+
+@st.cache_data(show_spinner=False)
+def load_table_names(version):
+    # Keyed on the database version: reruns reuse the list until the data changes
+    from database import get_table_names
+    return get_table_names()
+
+
 def init_session_state():
     if "query_history" not in st.session_state:
-        st.session_state.query_history = []
+        st.session_state.query_history = None
     if "last_result" not in st.session_state:
         st.session_state.last_result = None
     if "run_query" not in st.session_state:
         st.session_state.run_query = None
 
 
+def query_history():
+    # Created on first use, after the header: the history module loads pandas
+    if st.session_state.query_history is None:
+        from history import QueryHistory
+        st.session_state.query_history = QueryHistory()
+    return st.session_state.query_history
+
+
 def check_api_keys():
     provider = st.session_state.get("llm_provider", config.LLM_PROVIDER)
     if provider == "anthropic" and not config.ANTHROPIC_API_KEY:
@@ -143,45 +175,45 @@ def check_api_keys():
     return True, ""
 
 
-def process_query(user_question):
-    result = {
-        "success": False, "sql": None, "data": None,
-        "chart": None, "explanation": None, "error": None,
-        "question": user_question
-    }
-
-    try:
-        provider = st.session_state.get("llm_provider", config.LLM_PROVIDER)
-        llm_response = generate_sql_response(user_question, provider=provider)
-
-        sql = llm_response["sql"]
-        result["sql"] = sql
-        result["explanation"] = llm_response.get("explanation", "")
-
-        is_valid, error_msg = validate_sql(sql)
-        if not is_valid:
-            result["error"] = f"SQL validation failed: {error_msg}"
-            return result
+def process_query(user_question, on_sql_delta=None):
+    from pipeline import run_pipeline
 
-        df = execute_query(sanitize_sql(sql))
-        result["data"] = df
-        result["success"] = True
-
-        viz_config = llm_response.get("visualization", {})
-        result["viz_config"] = viz_config
-        if viz_config.get("needed"):
-            result["chart"] = create_chart(df, viz_config)
+    provider = st.session_state.get("llm_provider", config.LLM_PROVIDER)
 
-    except Exception as e:
-        result["error"] = str(e)
+    # The pipeline runs on the engine's event loop; SQL previews come back
+    # through a queue because Streamlit calls must stay on this thread.
+    deltas = queue.Queue()
+    future = load_engine().submit(run_pipeline(
+        user_question, provider,
+        on_sql_delta=deltas.put if on_sql_delta else None,
+        defer_chart=True
+    ))
 
-    return result
+    while True:
+        try:
+            return future.result(timeout=0.05)
+        except FutureTimeoutError:
+            latest = None
+            while not deltas.empty():
+                latest = deltas.get_nowait()
+            if latest is not None:
+                on_sql_delta(latest)
 
 
 def run_example_query(query):
     st.session_state.run_query = query
 
 
+def reopen_history_entry(entry):
+    # Shows the stored result without asking the LLM again; re-runs the
+    # question only if its frame can no longer be read back
+    result = query_history().reopen(entry["id"])
+    if result is None:
+        run_example_query(entry["question"])
+    else:
+        st.session_state.last_result = result
+
+
 def render_social_links():
     st.markdown("""
     <div class="social-bar">
@@ -235,7 +267,7 @@ def render_sidebar():
         st.markdown("### Database")
 
         try:
-            tables = get_table_names()
+            tables = load_table_names(database_version())
             st.caption(f"Chinook Music Store - {len(tables)} tables")
             with st.expander("View Schema", expanded=False):
                 for table in tables:
@@ -246,11 +278,12 @@ def render_sidebar():
         st.markdown("---")
         st.markdown("### Recent Queries")
 
-        if st.session_state.query_history:
-            for i, item in enumerate(reversed(st.session_state.query_history[-5:])):
-                q = item["question"][:35] + "..." if len(item["question"]) > 35 else item["question"]
-                if st.button(q, key=f"history_{i}", use_container_width=True):
-                    run_example_query(item["question"])
+        history = query_history()
+        if len(history):
+            for entry in reversed(history.recent(5)):
+                q = entry["question"][:35] + "..." if len(entry["question"]) > 35 else entry["question"]
+                if st.button(q, key=f"history_{entry['id']}", use_container_width=True):
+                    reopen_history_entry(entry)
         else:
             st.caption("No queries yet")
 
@@ -289,14 +322,17 @@ def render_query_input():
 
 
 def render_results(result):
+    from pipeline import resolve_chart
+
     if result["error"]:
         st.error(f"Error: {result['error']}")
+        if result.get("sql"):
+            render_sql(result)
+        render_timings(result)
         return
 
     st.markdown(f"**Question:** {result.get('question', 'N/A')}")
-
-    with st.expander("Generated SQL", expanded=False):
-        st.code(result["sql"], language="sql")
+    render_sql(result)
 
     if result["explanation"]:
         st.info(result['explanation'])
@@ -315,26 +351,168 @@ def render_results(result):
 
         st.markdown('<div class="divider"></div>', unsafe_allow_html=True)
 
-        if result["chart"]:
+        if result["chart"] or result.get("chart_future"):
             chart_col, table_col = st.columns([3, 2])
-            with chart_col:
-                st.markdown("#### Visualization")
-                st.plotly_chart(result["chart"], use_container_width=True)
+            # Table first: the figure may still be building on the chart executor
             with table_col:
                 st.markdown("#### Data")
                 st.dataframe(df, use_container_width=True, height=400)
+            with chart_col:
+                st.markdown("#### Visualization")
+                chart = resolve_chart(result)
+                if chart:
+                    st.plotly_chart(chart, use_container_width=True)
+                    render_reduction(chart)
+                else:
+                    render_chart_error(result)
         else:
             st.markdown("#### Results")
             st.dataframe(df, use_container_width=True)
+            if result.get("chart_error"):
+                render_chart_error(result)
+
+        render_export(result)
 
-        st.download_button("Download CSV", df.to_csv(index=False),
-                          "query_results.csv", "text/csv")
+        if df.attrs.get("truncated"):
+            render_pager(result)
 
     elif result["data"] is not None and result["data"].empty:
         st.warning("Query executed successfully but returned no results.")
 
+    render_timings(result)
+
+
+def render_chart_error(result):
+    error = result.get("chart_error")
+    st.caption(f"The chart could not be built: {error}" if error else "No chart could be built for this result.")
+
+
+def render_reduction(chart):
+    meta = chart.layout.meta
+    reduction = meta.get("reduction") if isinstance(meta, dict) else None
+    if reduction:
+        method = {"lttb": "LTTB", "minmax": "min/max", "top_n": "top categories + Other",
+                  "top_rows": "top categories"}[reduction["method"]]
+        st.caption(
+            f"Plotted {reduction['points']:,} of {reduction['rows']:,} rows ({method}); "
+            f"chart data {reduction['bytes_before'] / 1024:,.1f} KB → {reduction['bytes_after'] / 1024:,.1f} KB"
+        )
+
+
+def render_sql(result):
+    with st.expander("Generated SQL", expanded=False):
+        st.code(result["sql"], language="sql")
+        usage = result.get("usage")
+        if usage:
+            st.caption(
+                f"Tokens: {usage['input_tokens']} in / {usage['output_tokens']} out · "
+                f"prompt cache: {usage['cache_read_tokens']} read / {usage['cache_write_tokens']} written"
+            )
+        plan = result.get("plan")
+        if plan is not None:
+            st.caption(f"Query plan: {plan.summary()}")
+            st.code("\n".join(plan.lines()), language="text")
+
+
+def render_export(result):
+    from database import EXPORT_FORMATS, export_frame, export_query, export_to_file
+
+    df = result["data"]
+    trace = result.get("trace")
+    widget_key = trace.trace_id if trace is not None else "result"
+
+    col1, col2, col3 = st.columns([1, 1, 2])
+    fmt = col1.selectbox(
+        "Export format", list(EXPORT_FORMATS),
+        format_func=lambda f: EXPORT_FORMATS[f]["label"], key=f"export_format_{widget_key}"
+    )
+    full = df.attrs.get("truncated") and col2.checkbox(
+        "Full result", key=f"export_full_{widget_key}",
+        help=f"Re-run the query without the {config.MAX_RESULT_ROWS:,}-row limit"
+    )
+
+    def generate():
+        # Runs only when the button is clicked, on Streamlit's download thread;
+        # chunks go to a spool file, so the export never builds up in memory
+        if full:
+            return export_to_file(export_query, result["sql"], fmt)
+        return export_to_file(export_frame, df, fmt)
+
+    col3.download_button(
+        f"Download {EXPORT_FORMATS[fmt]['label']}", generate,
+        file_name=f"query_results.{EXPORT_FORMATS[fmt]['extension']}",
+        mime=EXPORT_FORMATS[fmt]["mime"], on_click="ignore", key=f"export_{widget_key}"
+    )
+
+
+def render_pager(result):
+    from database import ResultPager
+
+    df = result["data"]
+    st.caption(f"Showing the first {len(df):,} rows; the full result is larger.")
+
+    with st.expander("Browse full result", expanded=False):
+        trace = result.get("trace")
+        widget_key = trace.trace_id if trace is not None else "result"
+
+        col1, col2 = st.columns(2)
+        key = col1.selectbox(
+            "Page by key column (unique)", [None] + list(df.columns),
+            format_func=lambda c: "Query order (offset)" if c is None else c,
+            key=f"pager_key_{widget_key}"
+        )
+        page_size = col2.selectbox(
+            "Rows per page", [50, 100, 500, 1000],
+            index=1, key=f"pager_size_{widget_key}"
+        )
+
+        pager = result.get("pager")
+        if pager is None or pager.key != key or pager.page_size != page_size:
+            pager = ResultPager(result["sql"], page_size=page_size, key=key)
+            result["pager"] = pager
+
+        try:
+            total = pager.total_rows()
+            pages = pager.page_count()
+            number = st.number_input(
+                f"Page (of {pages:,}, {total:,} rows)", min_value=1, max_value=pages,
+                value=1, step=1, key=f"pager_page_{widget_key}"
+            )
+            st.dataframe(pager.page(int(number) - 1), use_container_width=True)
+            if key is not None and not pager.uses_keyset():
+                st.caption(f"{key} is not unique in this result, so pages follow the query order.")
+        except Exception as e:
+            st.error(f"Could not load page: {e}")
+
+
+def render_timings(result):
+    trace = result.get("trace")
+    if trace is None:
+        return
+
+    spans = trace.to_dict()["spans"]
+    total = next((s["duration_ms"] for s in spans if s["name"] == "pipeline.total"), None)
+    label = f"Timing ({total:.0f} ms)" if total is not None else "Timing"
+
+    with st.expander(label, expanded=False):
+        rows = [{
+            "stage": s["name"],
+            "start (ms)": s["start_ms"],
+            "duration (ms)": s["duration_ms"],
+            "details": ", ".join(f"{k}={v}" for k, v in s["attributes"].items()),
+            "error": s["error"] or ""
+        } for s in spans]
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+        st.download_button(
+            label="Download trace (JSONL)",
+            data=json.dumps(trace.to_dict(), default=str) + "\n",
+            file_name=f"trace_{trace.trace_id}.jsonl",
+            mime="application/x-ndjson"
+        )
+
 
 def main():
+    start_metrics_server()
     init_session_state()
     render_header()
     render_sidebar()
@@ -362,14 +540,16 @@ def main():
             return
 
         with st.spinner("Generating SQL and executing query..."):
-            result = process_query(query_to_run)
+            sql_preview = st.empty()
+            result = process_query(
+                query_to_run, on_sql_delta=lambda sql: sql_preview.code(sql, language="sql")
+            )
+            sql_preview.empty()
             st.session_state.last_result = result
 
-            if not st.session_state.query_history or \
-               st.session_state.query_history[-1]["question"] != query_to_run:
-                st.session_state.query_history.append({
-                    "question": query_to_run, "result": result
-                })
+            history = query_history()
+            if not len(history) or history.recent(1)[0]["question"] != query_to_run:
+                history.append(result)
 
     if st.session_state.last_result:
         st.markdown('<div class="divider"></div>', unsafe_allow_html=True)
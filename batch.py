@@ -0,0 +1,221 @@
+"""Headless batch runner: push a file of questions through the query pipeline.
+
+Usage:
+    python batch.py questions.txt -o results.jsonl --concurrency 8
+    python batch.py questions.jsonl -o results.jsonl --frames-dir frames --rate-limit openai=300
+
+Input is either plain text (one question per line) or JSONL with "question"
+and optional "id" fields. Results are appended to the output as they finish,
+so rerunning the same command resumes after an interruption.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+import config
+from database.export import unique_column_names
+from llm import aclose_clients
+from pipeline import new_result, run_pipeline
+
+MAX_FRAME_NAME_CHARS = 100
+
+
+class RateLimiter:
+    # Token bucket: allows short bursts up to one second's worth of requests
+    # while holding the long-run rate at requests_per_minute.
+
+    def __init__(self, requests_per_minute):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def load_questions(path):
+    path = Path(path)
+    questions = []
+    with path.open(encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.suffix == ".jsonl":
+                item = json.loads(line)
+                questions.append((str(item.get("id", line_no)), item["question"]))
+            else:
+                questions.append((str(line_no), line))
+    return questions
+
+
+def load_completed(output_path, retry_failed=False):
+    completed = set()
+    if output_path.exists():
+        with output_path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by an interruption; that question is rerun
+                    continue
+                if record.get("success") or not retry_failed:
+                    completed.add(record["id"])
+    return completed
+
+
+def frame_filename(question_id, frame_format):
+    # Ids come verbatim from the input file: anything outside [A-Za-z0-9_.-]
+    # (path separators included) is replaced and the length capped, with a
+    # hash of the original appended whenever it changed so names stay distinct
+    question_id = str(question_id)
+    safe = re.sub(r"[^\w.-]", "_", question_id, flags=re.ASCII)[:MAX_FRAME_NAME_CHARS]
+    if safe != question_id or safe.strip(".") == "":
+        safe = f"{safe}-{hashlib.sha1(question_id.encode('utf-8')).hexdigest()[:10]}"
+    return f"{safe}.{frame_format}"
+
+
+def write_frame(df, frames_dir, question_id, frame_format):
+    path = frames_dir / frame_filename(question_id, frame_format)
+    if frame_format == "parquet":
+        # Parquet rejects duplicate column names (e.g. two joined Name columns)
+        df = df.set_axis(unique_column_names(df.columns), axis=1)
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return str(path)
+
+
+def to_record(question_id, result, frame_path=None):
+    df = result["data"]
+    plan = result.get("plan")
+    return {
+        "id": question_id,
+        "question": result["question"],
+        "success": result["success"],
+        "sql": result["sql"],
+        "rows": len(df) if df is not None else None,
+        "plan_cost": round(plan.estimated_cost) if plan is not None else None,
+        "timings": result["timings"],
+        "error": result["error"],
+        "frame": frame_path
+    }
+
+
+async def run_batch(questions, output_path, provider, concurrency, requests_per_minute,
+                    frames_dir=None, frame_format="csv"):
+    limiter = RateLimiter(requests_per_minute)
+    queue = asyncio.Queue()
+    for item in questions:
+        queue.put_nowait(item)
+
+    loop = asyncio.get_running_loop()
+    counts = {"done": 0, "failed": 0}
+
+    with output_path.open("a", encoding="utf-8") as out:
+
+        async def worker():
+            while True:
+                try:
+                    question_id, question = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+
+                await limiter.acquire()
+                # A failure is recorded against its question rather than
+                # aborting the batch, so a resumed run does not hit it again
+                try:
+                    result = await run_pipeline(question, provider, build_chart=False)
+                except Exception as e:
+                    result = new_result(question)
+                    result["error"] = str(e)
+
+                frame_path = None
+                if frames_dir and result["success"]:
+                    try:
+                        frame_path = await loop.run_in_executor(
+                            None, write_frame, result["data"], frames_dir, question_id, frame_format
+                        )
+                    except Exception as e:
+                        result["success"] = False
+                        result["error"] = f"Could not write result frame: {e}"
+
+                out.write(json.dumps(to_record(question_id, result, frame_path), default=str) + "\n")
+                out.flush()
+                counts["done" if result["success"] else "failed"] += 1
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        finally:
+            # The clients' connections belong to this asyncio.run loop
+            await aclose_clients()
+
+    return counts
+
+
+def parse_rate_limits(values):
+    limits = dict(config.BATCH_REQUESTS_PER_MINUTE)
+    for value in values or []:
+        name, _, rate = value.partition("=")
+        limits[name] = float(rate)
+    return limits
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run natural-language questions through the Text-to-SQL pipeline")
+    parser.add_argument("questions", help="Text file (one question per line) or JSONL with id/question")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="JSONL results file (appended, resumable)")
+    parser.add_argument("-p", "--provider", default=config.LLM_PROVIDER, choices=["openai", "anthropic"])
+    parser.add_argument("-c", "--concurrency", type=int, default=config.BATCH_CONCURRENCY)
+    parser.add_argument("--rate-limit", action="append", metavar="PROVIDER=RPM",
+                        help="Requests per minute for a provider, e.g. openai=300")
+    parser.add_argument("--frames-dir", help="Also write each result frame to this directory")
+    parser.add_argument("--frames-format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--retry-failed", action="store_true", help="Rerun questions that previously failed")
+    args = parser.parse_args(argv)
+
+    output_path = Path(args.output)
+    frames_dir = Path(args.frames_dir) if args.frames_dir else None
+    if frames_dir:
+        frames_dir.mkdir(parents=True, exist_ok=True)
+
+    questions = load_questions(args.questions)
+    completed = load_completed(output_path, args.retry_failed)
+    pending = [item for item in questions if item[0] not in completed]
+    print(f"{len(questions)} questions, {len(questions) - len(pending)} already done, "
+          f"{len(pending)} to run", file=sys.stderr)
+
+    rate = parse_rate_limits(args.rate_limit)[args.provider]
+    started = time.perf_counter()
+    try:
+        counts = asyncio.run(run_batch(
+            pending, output_path, args.provider, max(1, args.concurrency), rate,
+            frames_dir, args.frames_format
+        ))
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume.", file=sys.stderr)
+        return 130
+
+    elapsed = time.perf_counter() - started
+    print(f"Finished {counts['done']} ok, {counts['failed']} failed in {elapsed:.1f}s", file=sys.stderr)
+    return 0 if counts["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
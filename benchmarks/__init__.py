@@ -0,0 +1 @@
+"""Offline benchmarks for the Text-to-SQL pipeline."""
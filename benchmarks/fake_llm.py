@@ -0,0 +1,35 @@
+import json
+import time
+from pathlib import Path
+
+from llm import register_provider
+from llm.cache import normalize_question
+
+CORPUS_PATH = Path(__file__).parent / "corpus.json"
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FakeLLM:
+    # Replays recorded responses for known questions so the whole chain can
+    # be timed without network access or API credits.
+
+    def __init__(self, corpus=None, latency_ms=0.0):
+        corpus = corpus if corpus is not None else load_corpus()
+        self.latency_ms = latency_ms
+        self.responses = {normalize_question(item["question"]): item["response"] for item in corpus}
+
+    def complete(self, user_question, system_blocks):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        try:
+            return self.responses[normalize_question(user_question)]
+        except KeyError:
+            raise ValueError(f"No recorded response for question: {user_question}")
+
+    def install(self, name="fake"):
+        register_provider(name, self.complete, model="fake-replay")
+        return name
@@ -0,0 +1,175 @@
+"""Single-pass SQL lexer versus the regex validate_sql/sanitize_sql it replaced.
+
+Usage:
+    python -m benchmarks.lexer
+    python -m benchmarks.lexer --sizes 10 100 1000 --iterations 20
+
+Before timing, every forbidden keyword is checked in function-call position
+(e.g. `SELECT delete(1) FROM tracks`): the lexer must reject each one the
+regex validator rejects, except the replace() scalar function.
+"""
+
+import argparse
+import random
+import re
+import statistics
+import sys
+import time
+
+from config import FORBIDDEN_SQL_KEYWORDS
+from utils import analyze_sql
+
+
+def legacy_validate_sql(sql):
+    if not sql or not sql.strip():
+        return False, "SQL query cannot be empty"
+
+    sql_upper = sql.upper().strip()
+
+    if not sql_upper.startswith("SELECT"):
+        return False, "Only SELECT queries are allowed"
+
+    for keyword in FORBIDDEN_SQL_KEYWORDS:
+        pattern = r'\b' + keyword + r'\b'
+        if re.search(pattern, sql_upper):
+            return False, f"Forbidden keyword detected: {keyword}"
+
+    sql_no_strings = re.sub(r"'[^']*'", "", sql)
+    sql_no_strings = re.sub(r'"[^"]*"', "", sql_no_strings)
+
+    if ';' in sql_no_strings.rstrip(';'):
+        return False, "Multiple SQL statements are not allowed"
+
+    injection_patterns = [
+        r'--',
+        r'/\*',
+        r'\*/',
+        r'\bUNION\b.*\bSELECT\b',
+    ]
+
+    for pattern in injection_patterns:
+        if re.search(pattern, sql_upper):
+            if 'UNION' in pattern and 'UNION ALL' in sql_upper:
+                continue
+            return False, "Potentially unsafe SQL pattern detected"
+
+    return True, ""
+
+
+def legacy_sanitize_sql(sql):
+    sql = sql.strip()
+    sql = sql.rstrip(';')
+    sql = re.sub(r'--.*$', '', sql, flags=re.MULTILINE)
+    sql = re.sub(r'/\*.*?\*/', '', sql, flags=re.DOTALL)
+    sql = ' '.join(sql.split())
+    return sql
+
+
+def generate_query(predicates, keyword_literals=False, seed=0):
+    # A wide, valid SELECT whose size grows with the number of predicates.
+    # With keyword_literals some string literals contain keywords and
+    # semicolons, which the regex validator wrongly rejects.
+    literal = "select; drop" if keyword_literals else "name"
+    rng = random.Random(seed)
+    columns = ", ".join(f"t.col_{i} AS alias_{i}" for i in range(min(predicates, 40)))
+    clauses = []
+    for i in range(predicates):
+        choice = rng.randrange(4)
+        if choice == 0:
+            clauses.append(f"t.col_{i} = {rng.randint(0, 10_000)}")
+        elif choice == 1:
+            clauses.append(f"t.name_{i} LIKE '%{literal} {i}%'")
+        elif choice == 2:
+            clauses.append(f"\"Quoted Col {i}\" IN ({', '.join(str(rng.random()) for _ in range(5))})")
+        else:
+            clauses.append(f"(t.a_{i} > 1.5 OR t.b_{i} IS NULL)")
+    return (
+        f"SELECT {columns}\nFROM Track t\n  JOIN Album a ON a.AlbumId = t.AlbumId\n"
+        f"WHERE {' AND '.join(clauses)}\nORDER BY 1 DESC\nLIMIT 100;"
+    )
+
+
+def time_calls(fn, sql, iterations):
+    fn(sql)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(sql)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def legacy(sql):
+    valid, _ = legacy_validate_sql(sql)
+    return valid and legacy_sanitize_sql(sql)
+
+
+def lexer(sql):
+    analysis = analyze_sql(sql)
+    return analysis.valid and analysis.sql
+
+
+# (template, whether replace() in this position is the allowed scalar function)
+KEYWORD_TEMPLATES = [
+    ("SELECT {kw}(1) FROM tracks", True),
+    ("SELECT * FROM tracks WHERE Name = {kw}(1)", True),
+    ("SELECT * FROM tracks WHERE Name = {kw} (1)", True),
+    ("SELECT {kw} FROM tracks", False),
+]
+
+
+def check_keywords():
+    # Cases where the lexer's verdict differs from the expected one
+    failures = []
+    for keyword in FORBIDDEN_SQL_KEYWORDS:
+        for template, function_call in KEYWORD_TEMPLATES:
+            sql = template.format(kw=keyword.lower())
+            allowed = keyword == "REPLACE" and function_call
+            if analyze_sql(sql).valid != allowed:
+                failures.append(sql)
+    return failures
+
+
+def run(sizes, iterations):
+    rows = []
+    for keyword_literals in (False, True):
+        for size in sizes:
+            rows.append(measure(generate_query(size, keyword_literals), size, iterations))
+    return rows
+
+
+def measure(sql, size, iterations):
+    # Where legacy_valid is False the regex path stopped at a false positive,
+    # so its time there is not comparable.
+    return {
+        "predicates": size,
+        "chars": len(sql),
+        "legacy_ms": time_calls(legacy, sql, iterations),
+        "lexer_ms": time_calls(lexer, sql, iterations),
+        "legacy_valid": legacy_validate_sql(sql)[0],
+        "lexer_valid": analyze_sql(sql).valid
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SQL lexer against the regex validators")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[10, 100, 1000, 5000])
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    failures = check_keywords()
+    for sql in failures:
+        print(f"Unexpected verdict: {sql}")
+    if failures:
+        return 1
+
+    print(f"{'predicates':>10} {'chars':>9} {'legacy ms':>10} {'lexer ms':>10} {'legacy ok':>10} {'lexer ok':>9}")
+    for row in run(args.sizes, args.iterations):
+        print(
+            f"{row['predicates']:>10} {row['chars']:>9} {row['legacy_ms']:>10.3f} "
+            f"{row['lexer_ms']:>10.3f} {str(row['legacy_valid']):>10} {str(row['lexer_valid']):>9}"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
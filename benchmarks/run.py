@@ -0,0 +1,202 @@
+"""Per-stage latency and allocation benchmarks, fully offline.
+
+Usage:
+    python -m benchmarks.run
+    python -m benchmarks.run --iterations 200 --output benchmarks/baselines/main.json
+    python -m benchmarks.run --baseline benchmarks/baselines/main.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+from database import execute_query, get_schema_snapshot
+from database.plan import explain_query
+from database.retriever import get_schema_retriever
+from database.snapshot import build_schema_snapshot
+from llm import generate_sql_response, parse_llm_response
+from utils import analyze_sql, sanitize_sql
+from visualization import create_chart
+from .fake_llm import FakeLLM, load_corpus
+
+DEFAULT_OUTPUT = Path(__file__).parent / "baselines" / "latest.json"
+
+
+def prepare_cases(corpus, provider):
+    cases = []
+    for item in corpus:
+        parsed = parse_llm_response(item["response"])
+        sql = sanitize_sql(parsed["sql"])
+        df = execute_query(sql, use_cache=False)
+        cases.append({
+            "question": item["question"], "text": item["response"], "parsed": parsed,
+            "raw_sql": parsed["sql"], "sql": sql, "df": df, "provider": provider,
+            "figure": create_chart(df, parsed["visualization"], use_cache=False)
+        })
+    return cases
+
+
+def build_stages(snapshot):
+    retriever = get_schema_retriever(snapshot)
+    return {
+        "schema_build": lambda case: build_schema_snapshot(),
+        "schema_cached": lambda case: get_schema_snapshot(),
+        "schema_retrieve": lambda case: retriever.retrieve(case["question"]),
+        "generate": lambda case: generate_sql_response(
+            case["question"], provider=case["provider"], use_cache=False
+        ),
+        "parse": lambda case: parse_llm_response(case["text"]),
+        # validate_sql/sanitize_sql memoise the lexer pass, so time it directly
+        "validate": lambda case: analyze_sql(case["raw_sql"]).valid,
+        "sanitize": lambda case: analyze_sql(case["raw_sql"]).sql,
+        "plan": lambda case: explain_query(case["sql"]),
+        "execute": lambda case: execute_query(case["sql"], use_cache=False),
+        # Figure construction on every call, then the figure-cache hit path
+        "chart": lambda case: create_chart(case["df"], case["parsed"]["visualization"], use_cache=False),
+        "chart_cached": lambda case: create_chart(case["df"], case["parsed"]["visualization"]),
+        "chart_json": lambda case: case["figure"].to_json(),
+    }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def time_stage(fn, cases, iterations):
+    for case in cases:
+        fn(case)
+
+    samples = []
+    for _ in range(iterations):
+        for case in cases:
+            start = time.perf_counter()
+            fn(case)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def measure_allocations(fn, cases):
+    tracemalloc.start()
+    peaks = []
+    blocks = []
+    try:
+        for case in cases:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            snapshot_before = tracemalloc.take_snapshot()
+            fn(case)
+            _, peak = tracemalloc.get_traced_memory()
+            stats = tracemalloc.take_snapshot().compare_to(snapshot_before, "filename")
+            peaks.append(peak - before)
+            blocks.append(sum(max(stat.count_diff, 0) for stat in stats))
+    finally:
+        tracemalloc.stop()
+    return {
+        "alloc_peak_kb": round(sum(peaks) / len(peaks) / 1024, 2),
+        "alloc_blocks": round(sum(blocks) / len(blocks), 1)
+    }
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "calls": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 4),
+        "p50_ms": round(percentile(ordered, 50), 4),
+        "p95_ms": round(percentile(ordered, 95), 4),
+        "p99_ms": round(percentile(ordered, 99), 4),
+    }
+
+
+def run(iterations, stage_names=None):
+    corpus = load_corpus()
+    provider = FakeLLM(corpus).install()
+    snapshot = get_schema_snapshot()
+    cases = prepare_cases(corpus, provider)
+    stages = build_stages(snapshot)
+
+    results = {}
+    for name, fn in stages.items():
+        if stage_names and name not in stage_names:
+            continue
+        stage_cases = cases
+        if name.startswith("chart"):
+            stage_cases = [case for case in cases if case["figure"] is not None]
+        # Schema rebuilds are slow and question-independent; one case per iteration is enough
+        if name.startswith("schema_") and name != "schema_retrieve":
+            stage_cases = cases[:1]
+
+        results[name] = summarize(time_stage(fn, stage_cases, iterations))
+        results[name].update(measure_allocations(fn, stage_cases))
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": iterations,
+            "questions": len(cases),
+        },
+        "stages": results
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"{'stage':<16}{'p50 ms':>12}{'base':>12}{'p95 ms':>12}{'base':>12}")
+    for name, current in results["stages"].items():
+        base = baseline["stages"].get(name)
+        if not base:
+            continue
+        print(f"{name:<16}{current['p50_ms']:>12.4f}{base['p50_ms']:>12.4f}"
+              f"{current['p95_ms']:>12.4f}{base['p95_ms']:>12.4f}")
+        for metric in ("p50_ms", "p95_ms"):
+            if base[metric] and current[metric] > base[metric] * (1 + threshold):
+                regressions.append(f"{name} {metric}: {base[metric]:.4f} -> {current[metric]:.4f}")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'stage':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KB':>10}{'blocks':>10}")
+    for name, r in results["stages"].items():
+        print(f"{name:<16}{r['p50_ms']:>10.4f}{r['p95_ms']:>10.4f}{r['p99_ms']:>10.4f}"
+              f"{r['alloc_peak_kb']:>10.1f}{r['alloc_blocks']:>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline per-stage pipeline benchmarks")
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    parser.add_argument("--stages", nargs="*", help="Only run these stages")
+    parser.add_argument("-o", "--output", default=str(DEFAULT_OUTPUT), help="Where to save the JSON results")
+    parser.add_argument("--baseline", help="Compare against a saved JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slowdown that counts as a regression (default 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    results = run(args.iterations, args.stages)
+    print_table(results)
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nSaved results to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""Cold-start profile of the Streamlit app: import cost and time to first paint.
+
+Usage:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 5 --top 15 -o benchmarks/baselines/startup.json
+
+Each measurement runs in a fresh interpreter so nothing is already imported.
+First paint is `python -X importtime -c "import app"`: everything that runs
+before the page config and styles reach the browser, grouped by top-level
+package. Time to interactive is a complete first script run (header, sidebar
+and examples) under Streamlit's AppTest, followed by a rerun as a widget
+click would trigger.
+"""
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+_FIRST_PAINT = """
+import json, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+app = AppTest.from_file("app.py", default_timeout=120)
+app.run()
+first = time.perf_counter()
+app.run()
+rerun = time.perf_counter()
+print(json.dumps({
+    "streamlit_import_ms": (imported - started) * 1000,
+    "first_run_ms": (first - imported) * 1000,
+    "interactive_ms": (first - started) * 1000,
+    "rerun_ms": (rerun - first) * 1000,
+    "exceptions": [str(e.value) for e in app.exception],
+}))
+"""
+
+
+def _run(args):
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+
+
+def import_profile(module="app"):
+    stderr = _run(["-X", "importtime", "-c", f"import {module}"]).stderr
+    total_us = 0
+    packages = defaultdict(int)
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        packages[name.split(".")[0]] += int(self_us)
+        if name == module and len(indent) == 1:
+            total_us = int(cumulative_us)
+    return total_us / 1000, {name: us / 1000 for name, us in packages.items()}
+
+
+def first_paint():
+    return json.loads(_run(["-c", _FIRST_PAINT]).stdout.strip().splitlines()[-1])
+
+
+def run(runs, top):
+    imports = [import_profile() for _ in range(runs)]
+    paints = [first_paint() for _ in range(runs)]
+
+    packages = defaultdict(list)
+    for _, by_package in imports:
+        for name, ms in by_package.items():
+            packages[name].append(ms)
+    heaviest = sorted(packages.items(), key=lambda item: -statistics.median(item[1]))[:top]
+
+    return {
+        "runs": runs,
+        "first_paint_ms": round(statistics.median(total for total, _ in imports), 1),
+        "packages_ms": {name: round(statistics.median(values), 1) for name, values in heaviest},
+        **{
+            key: round(statistics.median(p[key] for p in paints), 1)
+            for key in ("streamlit_import_ms", "first_run_ms", "interactive_ms", "rerun_ms")
+        },
+        "exceptions": sorted({e for p in paints for e in p["exceptions"]}),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start import and first-paint benchmark for app.py")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per measurement (median reported)")
+    parser.add_argument("--top", type=int, default=12, help="Heaviest packages to list")
+    parser.add_argument("-o", "--output", help="Also save the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run(max(1, args.runs), args.top)
+    print(f"first paint (import app)  {results['first_paint_ms']:>9.1f} ms")
+    print(f"import streamlit          {results['streamlit_import_ms']:>9.1f} ms")
+    print(f"first script run          {results['first_run_ms']:>9.1f} ms")
+    print(f"time to interactive       {results['interactive_ms']:>9.1f} ms")
+    print(f"rerun                     {results['rerun_ms']:>9.1f} ms")
+    print("\nSelf import time by package (import app):")
+    for name, ms in results["packages_ms"].items():
+        print(f"  {name:<24}{ms:>9.1f} ms")
+    for error in results["exceptions"]:
+        print(f"\nApp raised: {error}")
+
+    if args.output:
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(results, indent=2))
+        print(f"\nSaved results to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
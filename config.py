@@ -6,18 +6,98 @@ load_dotenv()
 
 BASE_DIR = Path(__file__).parent
 DATABASE_PATH = BASE_DIR / "chinook.db"
+CACHE_DIR = Path(os.getenv("CACHE_DIR", BASE_DIR / ".cache"))
 
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL") or None
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
 
 ANTHROPIC_MODEL = "claude-sonnet-4-20250514"
 OPENAI_MODEL = "gpt-4.1-mini"
 
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() == "true"
 LLM_TEMPERATURE = 0.1
 LLM_MAX_TOKENS = 2048
+LLM_TIMEOUT_SECONDS = 60
+LLM_CONNECT_TIMEOUT_SECONDS = 10
+LLM_MAX_RETRIES = 2
+LLM_MAX_CONNECTIONS = 20
+LLM_MAX_KEEPALIVE_CONNECTIONS = 10
+LLM_KEEPALIVE_EXPIRY_SECONDS = 60
 MAX_RESULT_ROWS = 1000
+RESULT_PAGE_SIZE = 100
+FETCH_CHUNK_ROWS = 2048
 QUERY_TIMEOUT_SECONDS = 30
+QUERY_VM_STEP_BUDGET = int(os.getenv("QUERY_VM_STEP_BUDGET", "200000000"))
+QUERY_PROGRESS_INTERVAL = 10000
+
+# Estimated row visits above which a query is sent back for a cheaper rewrite (0 disables)
+PLAN_COST_THRESHOLD = float(os.getenv("PLAN_COST_THRESHOLD", "50000000"))
+PLAN_REGENERATE_ATTEMPTS = 1
+
+# Chart data reduction: LTTB/min-max decimation for lines, top-N + "Other" for bars and pies
+CHART_MAX_POINTS = 2000
+CHART_LINE_DOWNSAMPLER = "lttb"
+CHART_BAR_TOP_N = 30
+CHART_PIE_TOP_N = 10
+CHART_WEBGL_THRESHOLD = 1000
+# Chart-type inference profiles at most this many sampled rows per result
+PROFILE_SAMPLE_ROWS = 1000
+PROFILE_DATETIME_RATIO = 0.9
+FIGURE_CACHE_ENABLED = os.getenv("FIGURE_CACHE_ENABLED", "true").lower() == "true"
+FIGURE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_POOL_CHECKOUT_TIMEOUT_SECONDS = 10
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_CACHE_SIZE_KB = 64 * 1024
+
+SCHEMA_PRUNING_ENABLED = os.getenv("SCHEMA_PRUNING_ENABLED", "true").lower() == "true"
+SCHEMA_TOKEN_BUDGET = int(os.getenv("SCHEMA_TOKEN_BUDGET", "900"))
+SCHEMA_PRUNING_MIN_SCORE = 2.0
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_PATH = CACHE_DIR / "responses.db"
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+
+WORKLOAD_LOG_ENABLED = os.getenv("WORKLOAD_LOG_ENABLED", "true").lower() == "true"
+WORKLOAD_LOG_PATH = CACHE_DIR / "workload.db"
+ADVISOR_SIDECAR_PATH = CACHE_DIR / "advisor.db"
+ADVISOR_MIN_GAIN = 0.10
+ADVISOR_MAX_INDEX_COLUMNS = 4
+
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "true").lower() == "true"
+ROLLUP_PATH = CACHE_DIR / "rollups.db"
+
+# Downloads are serialised on click, chunk by chunk; a full export re-runs the
+# query without MAX_RESULT_ROWS under its own time limit (0 disables the step budget)
+EXPORT_CHUNK_ROWS = 50000
+EXPORT_GZIP_LEVEL = 6
+EXPORT_PARQUET_COMPRESSION = "zstd"
+EXPORT_TIMEOUT_SECONDS = 300
+EXPORT_VM_STEP_BUDGET = int(os.getenv("EXPORT_VM_STEP_BUDGET", "0"))
+EXPORT_SPOOL_DIR = CACHE_DIR / "exports"
+
+# Query history: metadata stays in session state, result frames are written to
+# per-session spill files and the most recent kept in memory under one budget
+HISTORY_MEMORY_BUDGET_BYTES = int(os.getenv("HISTORY_MEMORY_BUDGET_BYTES", str(64 * 1024 * 1024)))
+HISTORY_MAX_ENTRIES = 50
+HISTORY_SPILL_DIR = CACHE_DIR / "history"
+HISTORY_SPILL_MAX_AGE_SECONDS = 24 * 60 * 60
+
+TRACE_LOG_PATH = Path(os.environ["TRACE_LOG_PATH"]) if os.getenv("TRACE_LOG_PATH") else None
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) or None
+# Loopback only by default; set 0.0.0.0 to let a remote Prometheus scrape
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_REQUESTS_PER_MINUTE = {"openai": 500, "anthropic": 50}
 
 FORBIDDEN_SQL_KEYWORDS = [
     "INSERT", "UPDATE", "DELETE", "DROP", "CREATE", "ALTER",
@@ -1,6 +1,25 @@
 """Database module for SQLite connection and schema extraction."""
 
-from .connection import execute_query, get_connection
-from .schema import get_schema_for_llm, get_table_names
+from .connection import (
+    aexecute_query, execute_query, get_connection, get_database_version,
+    get_pool_stats, get_result_cache_stats, run_in_db_executor, stream_query
+)
+from .export import EXPORT_FORMATS, export_frame, export_query, export_to_file
+from .guard import (
+    QueryAbortedError, QueryBudgetExceededError, QueryTimeoutError, get_query_guard_stats
+)
+from .pagination import ResultPager
+from .rollup import get_rollup_stats
+from .retriever import get_retrieval_stats, retrieve_schema
+from .schema import get_table_names
+from .snapshot import get_schema_cache_stats, get_schema_for_llm, get_schema_snapshot
 
-__all__ = ["execute_query", "get_connection", "get_schema_for_llm", "get_table_names"]
+__all__ = [
+    "aexecute_query", "execute_query", "run_in_db_executor", "stream_query",
+    "get_connection", "get_database_version",
+    "EXPORT_FORMATS", "export_frame", "export_query", "export_to_file",
+    "get_pool_stats", "get_result_cache_stats", "get_rollup_stats", "ResultPager",
+    "QueryAbortedError", "QueryTimeoutError", "QueryBudgetExceededError", "get_query_guard_stats",
+    "get_schema_for_llm", "get_schema_snapshot", "get_schema_cache_stats",
+    "get_retrieval_stats", "retrieve_schema", "get_table_names"
+]
@@ -0,0 +1,425 @@
+import hashlib
+import re
+import sqlite3
+import statistics
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import config
+from utils.sql_lexer import tokenize
+from .guard import guarded
+from .plan import explain_query, table_aliases
+from .pool import open_readonly_connection
+from .snapshot import get_schema_snapshot
+from .workload import get_workload_log
+
+_CLAUSES = frozenset(("SELECT", "FROM", "JOIN", "ON", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT"))
+_EQUALITY = frozenset(("=", "==", "IN", "IS"))
+_RANGE = frozenset(("<", ">", "<=", ">=", "BETWEEN", "LIKE", "GLOB"))
+_PREDICATE_CLAUSES = frozenset(("WHERE", "ON"))
+
+# Only deterministic functions can appear in an index expression
+_INDEXABLE_FUNCTIONS = frozenset((
+    "strftime", "date", "datetime", "julianday", "substr", "substring", "lower", "upper",
+    "trim", "ltrim", "rtrim", "length", "abs", "round", "coalesce", "ifnull", "cast"
+))
+
+_AUTOMATIC_TERM_RE = re.compile(r"(\w+)(?:=|>|<)")
+
+
+@dataclass(frozen=True)
+class ColumnRef:
+    table: str
+    column: str
+    clause: str
+    kind: str
+    expression: bool = False
+
+
+@dataclass
+class IndexCandidate:
+    table: str
+    columns: tuple
+    reason: str
+    queries: set = field(default_factory=set)
+    affected: int = 0
+    before_ms: float = 0.0
+    after_ms: float = 0.0
+
+    @property
+    def name(self):
+        digest = hashlib.sha256(repr((self.table, self.columns)).encode("utf-8")).hexdigest()[:8]
+        words = "_".join(re.sub(r"\W+", "", c)[:12] for c in self.columns)
+        return f"advisor_{self.table}_{words}_{digest}"
+
+    @property
+    def ddl(self):
+        return f'CREATE INDEX IF NOT EXISTS "{self.name}" ON "{self.table}" ({", ".join(self.columns)})'
+
+    @property
+    def gain(self):
+        return 1 - self.after_ms / self.before_ms if self.before_ms else 0.0
+
+    def to_dict(self):
+        return {
+            "ddl": self.ddl, "reason": self.reason, "queries": len(self.queries),
+            "affected": self.affected, "before_ms": round(self.before_ms, 3),
+            "after_ms": round(self.after_ms, 3), "gain": round(self.gain, 4)
+        }
+
+
+@dataclass
+class AdvisorReport:
+    queries: int
+    hot_scans: dict
+    hot_sorts: dict
+    candidates: list
+    winners: list
+    workload_before_ms: float = 0.0
+    workload_after_ms: float = 0.0
+    promoted: list = field(default_factory=list)
+
+    def to_dict(self):
+        return {
+            "queries": self.queries,
+            "hot_scans": self.hot_scans,
+            "hot_sorts": self.hot_sorts,
+            "candidates": [c.to_dict() for c in self.candidates],
+            "winners": [c.name for c in self.winners],
+            "workload_before_ms": round(self.workload_before_ms, 3),
+            "workload_after_ms": round(self.workload_after_ms, 3),
+            "promoted": self.promoted
+        }
+
+
+def _schema_columns():
+    snapshot = get_schema_snapshot()
+    columns = {}
+    primary_keys = {}
+    for table, table_columns in snapshot.columns.items():
+        columns[table.casefold()] = {c["name"].casefold(): c["name"] for c in table_columns}
+        primary_keys[table.casefold()] = {
+            c["name"].casefold() for c in table_columns
+            if c["primary_key"] and "INT" in (c["type"] or "").upper()
+        }
+    return columns, primary_keys
+
+
+def _predicate_kind(tokens, start, end):
+    following = tokens[end + 1].text.upper() if end + 1 < len(tokens) else ""
+    if following == "NOT" and end + 2 < len(tokens):
+        following = tokens[end + 2].text.upper()
+    preceding = tokens[start - 1].text.upper() if start > 0 else ""
+    if following in _EQUALITY or preceding in ("=", "=="):
+        return "eq"
+    if following in _RANGE or preceding in _RANGE:
+        return "range"
+    return "other"
+
+
+def _closing_paren(tokens, start):
+    depth = 0
+    for i in range(start, len(tokens)):
+        if tokens[i].text == "(":
+            depth += 1
+        elif tokens[i].text == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(tokens) - 1
+
+
+def _expression_text(tokens, start, end, aliases):
+    # The call as written, minus alias qualifiers: an index on
+    # strftime('%Y', InvoiceDate) also serves strftime('%Y', i.InvoiceDate)
+    parts = []
+    previous_end = None
+    i = start
+    while i <= end:
+        token = tokens[i]
+        if i + 1 <= end and tokens[i + 1].text == "." and token.text.casefold() in aliases:
+            i += 2
+            token = tokens[i]
+        if previous_end is not None and token.start > previous_end and tokens[i - 1].text != ".":
+            parts.append(" ")
+        parts.append(token.text)
+        previous_end = token.start + len(token.text)
+        i += 1
+    return "".join(parts)
+
+
+def column_references(sql, columns):
+    # Every column (and indexable expression) the query touches, tagged with
+    # the clause it appears in and whether it is compared by equality or range.
+    tokens = [t for t in tokenize(sql) if t.kind != "ws" and t.kind != "comment"]
+    aliases = table_aliases(sql, columns)
+    in_query = set(aliases.values())
+    refs = []
+    clause = None
+    stack = []
+
+    def resolve(qualifier, name):
+        name = name.strip('"`[]').casefold()
+        if qualifier is not None:
+            table = aliases.get(qualifier.strip('"`[]').casefold())
+            return (table, columns[table][name]) if table and name in columns.get(table, {}) else None
+        owners = [t for t in in_query if name in columns.get(t, {})]
+        return (owners[0], columns[owners[0]][name]) if len(owners) == 1 else None
+
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        upper = token.text.upper()
+        nxt = tokens[i + 1].text if i + 1 < len(tokens) else ""
+
+        if token.text == "(":
+            stack.append(clause)
+        elif token.text == ")":
+            clause = stack.pop() if stack else clause
+        elif token.kind == "word" and upper in _CLAUSES and nxt != ".":
+            clause = upper
+        elif token.kind == "word" and nxt == "(":
+            if token.text.casefold() in _INDEXABLE_FUNCTIONS and clause in ("WHERE", "ON", "GROUP", "ORDER"):
+                end = _closing_paren(tokens, i + 1)
+                inner = [
+                    resolve(None, t.text) for t in tokens[i + 2:end] if t.kind in ("word", "ident")
+                ] + [
+                    resolve(tokens[k - 2].text, tokens[k].text)
+                    for k in range(i + 2, end) if tokens[k - 1].text == "."
+                ]
+                tables = {ref[0] for ref in inner if ref}
+                literal = any(t.kind == "string" and "now" in t.text.casefold() for t in tokens[i:end])
+                if len(tables) == 1 and not literal:
+                    refs.append(ColumnRef(
+                        tables.pop(), _expression_text(tokens, i, end, aliases), clause,
+                        _predicate_kind(tokens, i, end), expression=True
+                    ))
+        elif token.kind in ("word", "ident"):
+            if nxt == "." and i + 2 < len(tokens):
+                resolved = resolve(token.text, tokens[i + 2].text)
+                end = i + 2
+            else:
+                resolved = resolve(None, token.text)
+                end = i
+            if resolved and clause:
+                refs.append(ColumnRef(resolved[0], resolved[1], clause, _predicate_kind(tokens, i, end)))
+            i = end
+        i += 1
+    return refs
+
+
+def _walk(nodes):
+    for node in nodes:
+        yield node
+        yield from _walk(node.children)
+
+
+def _unique(values):
+    return list(dict.fromkeys(values))
+
+
+def candidates_for(sql, plan, columns, primary_keys, max_columns=None):
+    max_columns = max_columns or config.ADVISOR_MAX_INDEX_COLUMNS
+    refs = column_references(sql, columns)
+    nodes = list(_walk(plan.nodes))
+    sorts = {node.detail.rsplit(" FOR ", 1)[-1] for node in nodes if node.op == "TEMP_BTREE"}
+    found = []
+
+    for node in nodes:
+        if node.automatic_index and node.table in columns:
+            # SQLite built a throwaway index for this on every run
+            keys = [columns[node.table].get(c.casefold()) for c in _AUTOMATIC_TERM_RE.findall(node.terms or "")]
+            if all(keys) and keys:
+                found.append((node.table, tuple(keys), "automatic index"))
+
+    scanned = _unique(node.table for node in nodes if node.op == "SCAN" and node.table in columns)
+    for table in scanned:
+        table_refs = [r for r in refs if r.table == table]
+        pk = primary_keys.get(table, set())
+        eq = _unique(r.column for r in table_refs
+                     if r.clause in _PREDICATE_CLAUSES and r.kind == "eq" and r.column.casefold() not in pk)
+        ranged = _unique(r.column for r in table_refs
+                         if r.clause in _PREDICATE_CLAUSES and r.kind == "range" and r.column not in eq)
+        key = (eq + ranged[:1])[:max_columns]
+        if key:
+            found.append((table, tuple(key), "expression filter" if any(
+                r.expression and r.column in key for r in table_refs) else "filter"))
+
+        for purpose, clause in (("GROUP BY", "GROUP"), ("ORDER BY", "ORDER")):
+            if purpose in sorts:
+                sort_key = _unique(r.column for r in table_refs if r.clause == clause)[:max_columns]
+                if sort_key and tuple(sort_key) != tuple(key):
+                    found.append((table, tuple(sort_key), purpose.lower()))
+
+        # Covering variant: every other column the query reads from this table
+        if key:
+            extra = _unique(r.column for r in table_refs if not r.expression and r.column not in key)
+            if extra and len(key) + len(extra) <= max_columns:
+                found.append((table, tuple(key + extra), "covering"))
+
+    return found, scanned, sorts
+
+
+def mine_workload(workload, columns=None, primary_keys=None):
+    if columns is None:
+        columns, primary_keys = _schema_columns()
+    candidates = {}
+    hot_scans = Counter()
+    hot_sorts = Counter()
+
+    for query in workload:
+        try:
+            plan = explain_query(query["sql"])
+        except sqlite3.Error:
+            continue
+        found, scanned, sorts = candidates_for(query["sql"], plan, columns, primary_keys)
+        for table in scanned:
+            hot_scans[table] += query["executions"]
+        for purpose in sorts:
+            hot_sorts[purpose] += query["executions"]
+        for table, keys, reason in found:
+            candidate = candidates.setdefault((table, keys), IndexCandidate(table, keys, reason))
+            candidate.queries.add(query["fingerprint"])
+
+    return list(candidates.values()), dict(hot_scans.most_common()), dict(hot_sorts.most_common())
+
+
+def _existing_indexes(conn):
+    existing = set()
+    for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+        for index in conn.execute(f'PRAGMA index_list("{table}")').fetchall():
+            cols = tuple(
+                (row[2] or "").casefold()
+                for row in conn.execute(f'PRAGMA index_xinfo("{index[1]}")').fetchall() if row[5]
+            )
+            existing.add((table.casefold(), cols))
+    return existing
+
+
+def _covered(candidate, existing):
+    # An existing index whose leading columns are the candidate adds nothing new
+    keys = tuple(c.casefold() for c in candidate.columns)
+    return any(table == candidate.table and cols[:len(keys)] == keys for table, cols in existing)
+
+
+def build_sidecar(path=None):
+    path = Path(path or config.ADVISOR_SIDECAR_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        path.unlink()
+    source = open_readonly_connection()
+    sidecar = sqlite3.connect(str(path))
+    try:
+        source.backup(sidecar)
+    finally:
+        source.close()
+    sidecar.execute("ANALYZE")
+    return sidecar
+
+
+def _time_query(conn, sql, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with guarded(conn):
+            conn.execute(sql).fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def replay(conn, workload, repeat):
+    # Median latency per query, weighted by how often the workload ran it
+    timings = {}
+    for query in workload:
+        try:
+            timings[query["fingerprint"]] = _time_query(conn, query["sql"], repeat)
+        except sqlite3.Error:
+            continue
+    return timings
+
+
+def _weighted(timings, workload):
+    return sum(timings.get(q["fingerprint"], 0.0) * q["executions"] for q in workload)
+
+
+def _uses_index(conn, sql, name):
+    return any(name in row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall())
+
+
+def evaluate(candidates, workload, sidecar, repeat):
+    existing = _existing_indexes(sidecar)
+    baseline = replay(sidecar, workload, repeat)
+
+    evaluated = []
+    for candidate in candidates:
+        if _covered(candidate, existing):
+            continue
+        try:
+            sidecar.execute(candidate.ddl)
+        except sqlite3.Error:
+            continue
+        sidecar.execute(f'ANALYZE "{candidate.table}"')
+        affected = [q for q in workload if _uses_index(sidecar, q["sql"], candidate.name)]
+        candidate.affected = len(affected)
+        candidate.before_ms = _weighted(baseline, affected)
+        candidate.after_ms = _weighted(replay(sidecar, affected, repeat), affected)
+        sidecar.execute(f'DROP INDEX "{candidate.name}"')
+        evaluated.append(candidate)
+
+    return baseline, sorted(evaluated, key=lambda c: c.gain, reverse=True)
+
+
+def _pick_winners(evaluated, min_gain):
+    # One index per table and leading column: the best of overlapping variants
+    winners = []
+    taken = set()
+    for candidate in evaluated:
+        slot = (candidate.table, candidate.columns[0].casefold())
+        if candidate.affected and candidate.gain >= min_gain and slot not in taken:
+            winners.append(candidate)
+            taken.add(slot)
+    return winners
+
+
+def promote(winners, database_path=None):
+    # The only write the application ever makes to the production database
+    conn = sqlite3.connect(str(database_path or config.DATABASE_PATH))
+    try:
+        with conn:
+            for candidate in winners:
+                conn.execute(candidate.ddl)
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return [candidate.name for candidate in winners]
+
+
+def advise(top=50, repeat=5, min_gain=None, apply=False, sidecar_path=None):
+    min_gain = config.ADVISOR_MIN_GAIN if min_gain is None else min_gain
+    workload = get_workload_log().top(top)
+    candidates, hot_scans, hot_sorts = mine_workload(workload)
+    report = AdvisorReport(len(workload), hot_scans, hot_sorts, [], [])
+    if not candidates:
+        return report
+
+    sidecar = build_sidecar(sidecar_path)
+    try:
+        baseline, report.candidates = evaluate(candidates, workload, sidecar, repeat)
+        report.winners = _pick_winners(report.candidates, min_gain)
+        report.workload_before_ms = _weighted(baseline, workload)
+        report.workload_after_ms = report.workload_before_ms
+
+        if report.winners:
+            # Confirm the winners together on the whole workload before promoting
+            for candidate in report.winners:
+                sidecar.execute(candidate.ddl)
+            sidecar.execute("ANALYZE")
+            report.workload_after_ms = _weighted(replay(sidecar, workload, repeat), workload)
+    finally:
+        sidecar.close()
+
+    if apply and report.winners and report.workload_after_ms < report.workload_before_ms:
+        report.promoted = promote(report.winners)
+    return report
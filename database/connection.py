@@ -1,35 +1,162 @@
+import asyncio
+import os
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
-import pandas as pd
+import config
+from config import DATABASE_PATH, MAX_RESULT_ROWS
+from utils.sql_lexer import limit_sql
+from utils.tracing import bind_context, span
+from .guard import guarded
+from .materialize import fetch_frame, iter_frames
+from .pool import ConnectionPool, open_readonly_connection
+from .result_cache import get_result_cache, make_result_key
+from .rollup import get_rollup_store
+from .workload import get_workload_log
 
-from config import DATABASE_PATH, MAX_RESULT_ROWS, QUERY_TIMEOUT_SECONDS
+_pool_lock = threading.Lock()
+_pool = None
+_version_lock = threading.Lock()
+_version_conn = None
+_executor_lock = threading.Lock()
+_executor = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DATABASE_PATH)
+    return _pool
+
+
+def get_pool_stats():
+    return get_pool().stats()
+
+
+def get_db_executor():
+    # Sized to the pool so async callers queue here rather than inside
+    # ConnectionPool.checkout while holding an executor thread.
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_pool().size, thread_name_prefix="sqlite"
+                )
+    return _executor
+
+
+async def run_in_db_executor(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), bind_context(func, *args, **kwargs))
 
 
 @contextmanager
 def get_connection():
-    conn = None
-    try:
-        conn = sqlite3.connect(str(DATABASE_PATH), timeout=QUERY_TIMEOUT_SECONDS)
-        conn.row_factory = sqlite3.Row
+    with get_pool().connection() as conn:
         yield conn
-    finally:
-        if conn:
-            conn.close()
 
 
-def execute_query(sql, limit=None):
+def get_database_version():
+    # data_version only moves when *another* connection commits, so the probe
+    # must stay open for the life of the process to observe changes.
+    global _version_conn
+
+    with _version_lock:
+        if _version_conn is None:
+            _version_conn = open_readonly_connection(DATABASE_PATH)
+        schema_version = _version_conn.execute("PRAGMA schema_version").fetchone()[0]
+        data_version = _version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    try:
+        mtime_ns = os.stat(DATABASE_PATH).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+
+    return schema_version, data_version, mtime_ns
+
+
+def get_result_cache_stats():
+    return get_result_cache().stats()
+
+
+def _execute(conn, sql, params=()):
+    # Plain tuples: the buffers read columns positionally, so sqlite3.Row adds nothing
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    try:
+        return cursor.execute(sql, params)
+    except sqlite3.Error as e:
+        raise sqlite3.Error(f"Query execution failed: {str(e)}")
+
+
+def read_frame(sql, params=(), capacity=None):
+    # capacity: expected row count (e.g. the LIMIT) so buffers are sized once
+    with get_connection() as conn, guarded(conn):
+        return fetch_frame(_execute(conn, sql, params), capacity=capacity)
+
+
+def stream_query(sql, params=(), chunk_size=None, timeout=None, step_budget=None):
+    # Yields typed DataFrame chunks; the pooled connection is held until the
+    # generator is exhausted or closed, so consume it on a single thread.
+    # The deadline covers the consumer's time between chunks as well.
+    with get_connection() as conn, guarded(conn, timeout, step_budget):
+        yield from iter_frames(_execute(conn, sql, params), chunk_size)
+
+
+def execute_query(sql, limit=None, use_cache=True):
     if not sql or not sql.strip():
         raise ValueError("SQL query cannot be empty")
 
     effective_limit = limit or MAX_RESULT_ROWS
-    sql_upper = sql.upper().strip()
 
-    if sql_upper.startswith("SELECT") and "LIMIT" not in sql_upper:
-        sql = f"{sql.rstrip().rstrip(';')} LIMIT {effective_limit}"
+    with span("db.execute", cached=False) as current:
+        cache_key = make_result_key(sql, effective_limit, get_database_version())
+        cache = get_result_cache() if use_cache and config.RESULT_CACHE_ENABLED else None
+        if cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                current.set(cached=True, rows=len(cached))
+                return cached
+
+        # One extra row tells a capped result apart from one that fits exactly
+        limited_sql = limit_sql(sql, effective_limit + 1)
+        rewrite = None
+        if config.ROLLUPS_ENABLED:
+            rewrite = get_rollup_store().rewrite(limited_sql, get_database_version())
+
+        if rewrite is not None and rewrite.verified:
+            df = get_rollup_store().read(rewrite, capacity=effective_limit + 1)
+            current.set(rollup=rewrite.rollup)
+        else:
+            started = time.perf_counter()
+            df = read_frame(limited_sql, capacity=effective_limit + 1)
+            if config.WORKLOAD_LOG_ENABLED:
+                get_workload_log().record(
+                    limited_sql, (time.perf_counter() - started) * 1000, len(df)
+                )
+            if rewrite is not None:
+                # First sighting of this query shape: prove the rewrite before serving it
+                get_rollup_store().verify(rewrite, df, capacity=effective_limit + 1)
+        truncated = len(df) > effective_limit
+        if truncated:
+            df = df.iloc[:effective_limit].copy()
+        df.attrs["truncated"] = truncated
+        df.attrs["row_limit"] = effective_limit
+        # Identifies the result without hashing it, e.g. for the figure cache
+        df.attrs["result_key"] = cache_key
+
+        current.set(rows=len(df), truncated=truncated)
+        if cache:
+            cache.put(cache_key, df)
+
+        return df
+
 
-    with get_connection() as conn:
-        try:
-            return pd.read_sql_query(sql, conn)
-        except sqlite3.Error as e:
-            raise sqlite3.Error(f"Query execution failed: {str(e)}")
+async def aexecute_query(sql, limit=None, use_cache=True):
+    return await run_in_db_executor(execute_query, sql, limit=limit, use_cache=use_cache)
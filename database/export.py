@@ -0,0 +1,160 @@
+import gzip
+import io
+import os
+import tempfile
+
+import pandas as pd
+
+import config
+from utils.tracing import span
+from .connection import stream_query
+
+EXPORT_FORMATS = {
+    "csv.gz": {"label": "CSV (gzip)", "extension": "csv.gz", "mime": "application/gzip"},
+    "parquet": {"label": "Parquet", "extension": "parquet", "mime": "application/vnd.apache.parquet"},
+    "arrow": {"label": "Arrow IPC", "extension": "arrow", "mime": "application/vnd.apache.arrow.file"},
+}
+
+
+def frame_chunks(df, chunk_rows=None):
+    # Row slices of an in-memory result; an empty frame still yields once
+    # so the export carries its header/schema
+    chunk_rows = chunk_rows or config.EXPORT_CHUNK_ROWS
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def _write_csv_gz(frames, sink):
+    rows = 0
+    header = True
+    with gzip.GzipFile(fileobj=sink, mode="wb", compresslevel=config.EXPORT_GZIP_LEVEL) as gz, \
+            io.TextIOWrapper(gz, encoding="utf-8", newline="") as text:
+        for frame in frames:
+            frame.to_csv(text, header=header, index=False)
+            header = False
+            rows += len(frame)
+    return rows
+
+
+def unique_column_names(columns):
+    # Parquet readers reject duplicate field names (e.g. SELECT a.Name, b.Name);
+    # repeats get pandas' read_csv suffixes: Name, Name.1, ...
+    names = []
+    seen = {}
+    for column in map(str, columns):
+        count = seen.get(column, 0)
+        seen[column] = count + 1
+        names.append(f"{column}.{count}" if count else column)
+    return names
+
+
+def _arrow_column(values):
+    import pyarrow as pa
+
+    try:
+        return pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # SQLite is dynamically typed: a column mixing e.g. ints and text is exported as text
+        return pa.array([None if pd.isna(v) else str(v) for v in values.tolist()], type=pa.string())
+
+
+def _arrow_tables(frames):
+    # The schema is fixed by the first chunk (all-NULL columns become text);
+    # later chunks are cast to it, e.g. an int column whose chunk has NULLs
+    # and so arrived as float64
+    import pyarrow as pa
+
+    schema = None
+    for frame in frames:
+        table = pa.Table.from_arrays(
+            [_arrow_column(frame.iloc[:, i]) for i in range(frame.shape[1])],
+            names=unique_column_names(frame.columns)
+        )
+        if schema is None:
+            schema = pa.schema([
+                field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                for field in table.schema
+            ])
+        try:
+            yield table.cast(schema)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            raise ValueError(
+                f"Column types changed part-way through the result ({e}); export as CSV instead"
+            )
+
+
+def _write_arrow(frames, sink, fmt):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = 0
+    writer = None
+    try:
+        for table in _arrow_tables(frames):
+            if writer is None:
+                if fmt == "parquet":
+                    writer = pq.ParquetWriter(sink, table.schema, compression=config.EXPORT_PARQUET_COMPRESSION)
+                else:
+                    writer = pa.ipc.new_file(sink, table.schema)
+            writer.write_table(table)
+            rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write_frames(frames, fmt, sink):
+    # Serialises an iterable of DataFrame chunks into the binary file-like
+    # sink one chunk at a time; returns the number of rows written
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if fmt == "csv.gz":
+        return _write_csv_gz(frames, sink)
+    return _write_arrow(frames, sink, fmt)
+
+
+def export_frame(df, fmt, sink):
+    with span("export.frame", format=fmt) as current:
+        rows = write_frames(frame_chunks(df), fmt, sink)
+        current.set(rows=rows)
+    return rows
+
+
+def export_query(sql, fmt, sink):
+    # Re-runs the query without the MAX_RESULT_ROWS cap, writing each chunk
+    # as it leaves the cursor; only one chunk is held in memory at a time
+    if not sql or not sql.strip():
+        raise ValueError("SQL query cannot be empty")
+
+    with span("export.query", format=fmt) as current:
+        frames = stream_query(
+            sql, chunk_size=config.EXPORT_CHUNK_ROWS,
+            timeout=config.EXPORT_TIMEOUT_SECONDS, step_budget=config.EXPORT_VM_STEP_BUDGET
+        )
+        try:
+            rows = write_frames(frames, fmt, sink)
+        finally:
+            frames.close()
+        current.set(rows=rows)
+    return rows
+
+
+def export_to_file(export, source, fmt):
+    # Runs export_frame/export_query into a spool file under
+    # EXPORT_SPOOL_DIR (not /tmp, which is often RAM-backed) and returns it
+    # open for reading. The name is unlinked straight away, so the data goes
+    # when the handle is closed.
+    directory = config.EXPORT_SPOOL_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=f".{EXPORT_FORMATS[fmt]['extension']}", dir=directory)
+    try:
+        with open(fd, "wb") as sink:
+            export(source, fmt, sink)
+        handle = open(path, "rb")
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return handle
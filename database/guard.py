@@ -0,0 +1,120 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+from utils.tracing import current_span
+
+
+class QueryAbortedError(sqlite3.OperationalError):
+    pass
+
+
+class QueryTimeoutError(QueryAbortedError):
+    pass
+
+
+class QueryBudgetExceededError(QueryAbortedError):
+    pass
+
+
+_stats_lock = threading.Lock()
+_stats = {
+    "queries": 0, "killed_timeout": 0, "killed_budget": 0,
+    "vm_steps": 0, "max_vm_steps": 0, "killed_vm_steps": 0
+}
+
+
+class QueryGuard:
+    # Installed as the connection's progress handler, which SQLite calls
+    # every `interval` VM instructions from inside sqlite3_step. Returning
+    # non-zero interrupts the statement, so a runaway join is stopped within
+    # a few thousand instructions of hitting its deadline or budget rather
+    # than running until the busy timeout (which only covers lock waits).
+
+    def __init__(self, timeout=None, step_budget=None, interval=None):
+        self.timeout = timeout
+        self.step_budget = step_budget
+        self.interval = interval or config.QUERY_PROGRESS_INTERVAL
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.steps = 0
+        self.reason = None
+
+    def __call__(self):
+        self.steps += self.interval
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.reason = "timeout"
+            return 1
+        if self.step_budget and self.steps > self.step_budget:
+            self.reason = "budget"
+            return 1
+        return 0
+
+    def error(self):
+        if self.reason == "timeout":
+            return QueryTimeoutError(
+                f"Query exceeded the {self.timeout:g}s time limit and was cancelled"
+            )
+        return QueryBudgetExceededError(
+            f"Query exceeded the budget of {self.step_budget:,} VM steps and was cancelled"
+        )
+
+
+def _record(guard):
+    current = current_span()
+    if current is not None:
+        current.set(vm_steps=guard.steps, killed=int(bool(guard.reason)))
+    with _stats_lock:
+        _stats["queries"] += 1
+        _stats["vm_steps"] += guard.steps
+        _stats["max_vm_steps"] = max(_stats["max_vm_steps"], guard.steps)
+        if guard.reason:
+            _stats[f"killed_{guard.reason}"] += 1
+            _stats["killed_vm_steps"] += guard.steps
+
+
+# The guard currently installed on each connection, by id(conn): sqlite3 has
+# no getter for the progress handler and connections can't be weakly referenced
+_active_lock = threading.Lock()
+_active = {}
+
+
+@contextmanager
+def guarded(conn, timeout=None, step_budget=None):
+    # timeout/step_budget default to the config values; pass 0 to disable one.
+    # Guards nest: e.g. a read_frame issued on a pooled connection while a
+    # stream_query generator holds it puts the outer guard back when it ends.
+    guard = QueryGuard(
+        config.QUERY_TIMEOUT_SECONDS if timeout is None else timeout,
+        config.QUERY_VM_STEP_BUDGET if step_budget is None else step_budget
+    )
+    with _active_lock:
+        outer = _active.get(id(conn))
+        _active[id(conn)] = guard
+    conn.set_progress_handler(guard, guard.interval)
+    try:
+        yield guard
+    except sqlite3.Error as e:
+        if guard.reason:
+            raise guard.error() from e
+        raise
+    finally:
+        with _active_lock:
+            if outer is None:
+                _active.pop(id(conn), None)
+            else:
+                _active[id(conn)] = outer
+        if outer is None:
+            conn.set_progress_handler(None, 0)
+        else:
+            conn.set_progress_handler(outer, outer.interval)
+        _record(guard)
+
+
+def get_query_guard_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["killed"] = stats["killed_timeout"] + stats["killed_budget"]
+    stats["avg_vm_steps"] = round(stats["vm_steps"] / stats["queries"]) if stats["queries"] else 0
+    return stats
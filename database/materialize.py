@@ -0,0 +1,235 @@
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+import config
+
+INTEGER = "integer"
+REAL = "real"
+TEXT = "text"
+OBJECT = "object"
+
+# Element types each buffer kind accepts without being widened
+_ACCEPTS = {
+    INTEGER: frozenset((int, type(None))),
+    REAL: frozenset((float, int, type(None))),
+    TEXT: frozenset((str, type(None))),
+}
+_FROM_VALUE = {int: INTEGER, float: REAL, str: TEXT}
+
+_INITIAL_CAPACITY = 1024
+
+_types_lock = threading.Lock()
+_declared = {"fingerprint": None, "types": {}}
+
+
+def affinity(declared_type):
+    # SQLite's column affinity rules (section 3.1 of the datatype docs)
+    declared = (declared_type or "").upper()
+    if "INT" in declared:
+        return INTEGER
+    if "CHAR" in declared or "CLOB" in declared or "TEXT" in declared:
+        return TEXT
+    if "REAL" in declared or "FLOA" in declared or "DOUB" in declared:
+        return REAL
+    if "NUM" in declared or "DEC" in declared:
+        return REAL
+    return None
+
+
+def declared_column_types():
+    # Column name -> affinity across every table. A name declared with
+    # different affinities in different tables is left out, and the buffer
+    # kind is then inferred from the first values instead.
+    # Imported here: the snapshot module depends on database.connection,
+    # which depends on this one.
+    from .snapshot import get_schema_snapshot
+
+    snapshot = get_schema_snapshot()
+    with _types_lock:
+        if _declared["fingerprint"] != snapshot.fingerprint:
+            types = {}
+            conflicts = set()
+            for columns in snapshot.columns.values():
+                for column in columns:
+                    name = column["name"].casefold()
+                    kind = affinity(column["type"])
+                    if types.setdefault(name, kind) != kind:
+                        conflicts.add(name)
+            _declared["types"] = {k: v for k, v in types.items() if k not in conflicts and v}
+            _declared["fingerprint"] = snapshot.fingerprint
+        return _declared["types"]
+
+
+def _text_array(values):
+    # pandas 3 stores str columns in a contiguous Arrow buffer; older
+    # pandas keeps object dtype, as read_sql_query did.
+    if getattr(pd.options.future, "infer_string", False):
+        return pd.array(values, dtype="str")
+    return np.array(values, dtype=object)
+
+
+def _allocate(kind, capacity):
+    if kind == INTEGER:
+        return np.zeros(capacity, dtype=np.int64)
+    if kind == REAL:
+        return np.empty(capacity, dtype=np.float64)
+    return []
+
+
+class ColumnBuffer:
+    # Preallocated, growable storage for one result column. Each chunk's
+    # element types are checked once (in C, via set(map(type, ...))); values
+    # the current kind cannot hold widen the buffer instead of being silently
+    # coerced, e.g. 2.5 landing in an int64 array.
+
+    def __init__(self, kind, capacity=None):
+        self.kind = kind
+        self.size = 0
+        self._data = _allocate(kind, capacity or _INITIAL_CAPACITY)
+        self._nulls = None
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * len(self._data))
+        data = _allocate(self.kind, capacity)
+        data[:self.size] = self._data[:self.size]
+        self._data = data
+        if self._nulls is not None:
+            nulls = np.zeros(capacity, dtype=bool)
+            nulls[:self.size] = self._nulls[:self.size]
+            self._nulls = nulls
+
+    def _values(self):
+        if isinstance(self._data, list):
+            return self._data
+        values = self._data[:self.size].tolist()
+        if self._nulls is not None:
+            return [None if null else v for v, null in zip(values, self._nulls[:self.size])]
+        return values
+
+    def _widen(self, kind):
+        values = self._values()
+        self.kind = kind
+        self.size = 0
+        self._nulls = None
+        self._data = _allocate(kind, max(len(values), _INITIAL_CAPACITY))
+        self._append(values, has_nulls=True)
+
+    def _append(self, values, has_nulls=False):
+        if isinstance(self._data, list):
+            self._data.extend(values)
+            self.size += len(values)
+            return
+
+        end = self.size + len(values)
+        if end > len(self._data):
+            self._grow(end)
+        if self.kind == INTEGER and has_nulls:
+            # int64 has no NULL, so track them in a mask alongside
+            if self._nulls is None:
+                self._nulls = np.zeros(len(self._data), dtype=bool)
+            values = np.array(values, dtype=object)
+            nulls = values == None  # noqa: E711 - elementwise comparison
+            values[nulls] = 0
+            self._nulls[self.size:end] = nulls
+        # None becomes NaN on assignment into a float64 array
+        self._data[self.size:end] = values
+        self.size = end
+
+    def extend(self, values):
+        types = set(map(type, values))
+        accepts = _ACCEPTS.get(self.kind)
+        if accepts is not None and not types <= accepts:
+            widen_to_real = self.kind == INTEGER and types <= _ACCEPTS[REAL]
+            self._widen(REAL if widen_to_real else OBJECT)
+        try:
+            self._append(values, has_nulls=type(None) in types)
+        except OverflowError:
+            # Integers beyond int64
+            self._widen(OBJECT)
+            self._append(values)
+
+    def finish(self):
+        if self.kind == INTEGER:
+            data = self._data[:self.size]
+            if self._nulls is not None and self._nulls[:self.size].any():
+                # As with read_sql_query, an integer column with NULLs is float64
+                data = data.astype(np.float64)
+                data[self._nulls[:self.size]] = np.nan
+                return data
+            return data.copy() if self.size < len(self._data) else data
+        if self.kind == REAL:
+            data = self._data[:self.size]
+            return data.copy() if self.size < len(self._data) else data
+        if self.kind == TEXT:
+            return _text_array(self._data)
+        return np.array(self._data, dtype=object) if self._data else np.empty(0, dtype=object)
+
+
+def _column_kinds(description, rows):
+    declared = declared_column_types()
+    kinds = []
+    for i, column in enumerate(description):
+        kind = declared.get(column[0].casefold())
+        if kind is None:
+            sample = next((row[i] for row in rows if row[i] is not None), None)
+            kind = _FROM_VALUE.get(type(sample), OBJECT)
+        kinds.append(kind)
+    return kinds
+
+
+def _frame(names, arrays):
+    # Built positionally so duplicate column names survive
+    df = pd.DataFrame(dict(enumerate(arrays)), copy=False)
+    df.columns = names
+    return df
+
+
+def _fetch(cursor, size):
+    try:
+        return cursor.fetchmany(size)
+    except sqlite3.Error as e:
+        raise sqlite3.Error(f"Query execution failed: {str(e)}")
+
+
+def fetch_frame(cursor, capacity=None, chunk_size=None):
+    # Reads the whole result into typed column buffers, chunk_size rows at a
+    # time, without building per-row objects beyond what sqlite3 returns.
+    if cursor.description is None:
+        return pd.DataFrame()
+
+    chunk_size = chunk_size or config.FETCH_CHUNK_ROWS
+    names = [column[0] for column in cursor.description]
+    rows = _fetch(cursor, chunk_size)
+    buffers = [
+        ColumnBuffer(kind, capacity) for kind in _column_kinds(cursor.description, rows)
+    ]
+    while rows:
+        for buffer, values in zip(buffers, zip(*rows)):
+            buffer.extend(values)
+        rows = _fetch(cursor, chunk_size)
+    return _frame(names, [buffer.finish() for buffer in buffers])
+
+
+def iter_frames(cursor, chunk_size=None):
+    # Generator of typed DataFrame chunks. Column kinds are fixed from the
+    # first chunk; a later chunk may still widen (e.g. int -> float) on its own.
+    # An empty result yields one empty frame, so consumers still see the
+    # column names and declared types.
+    if cursor.description is None:
+        return
+
+    chunk_size = chunk_size or config.FETCH_CHUNK_ROWS
+    names = [column[0] for column in cursor.description]
+    rows = _fetch(cursor, chunk_size)
+    kinds = _column_kinds(cursor.description, rows)
+    while True:
+        buffers = [ColumnBuffer(kind, len(rows)) for kind in kinds]
+        for buffer, values in zip(buffers, zip(*rows)):
+            buffer.extend(values)
+        yield _frame(names, [buffer.finish() for buffer in buffers])
+        rows = rows and _fetch(cursor, chunk_size)
+        if not rows:
+            return
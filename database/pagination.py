@@ -0,0 +1,131 @@
+import math
+import threading
+from collections import OrderedDict
+
+import config
+from utils.sql_lexer import limit_sql, statement_body
+from utils.tracing import span
+from .connection import get_database_version, read_frame
+
+CACHED_PAGES = 8
+
+
+def _quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _bindable(value):
+    # numpy scalars from a DataFrame cannot be bound by sqlite3 directly
+    return value.item() if hasattr(value, "item") else value
+
+
+class ResultPager:
+    # Browses a query's full result one page at a time; only the last few
+    # pages are held in memory, never the whole result.
+    #
+    # Without a key, pages are fetched by OFFSET in the query's own order.
+    # With a key (a unique, non-null result column) pages are ordered by it
+    # and walked by keyset: page n+1 starts after the last key seen on page n,
+    # so moving forward costs the same at page 10,000 as at page 1. Jumping
+    # to a page whose start key is not known yet falls back to OFFSET.
+    # The key is checked once per database version: a column that is
+    # ambiguous, NULL or repeated anywhere would make "key > ?" skip rows,
+    # so such a pager pages by OFFSET instead.
+
+    def __init__(self, sql, page_size=None, key=None):
+        self.body = statement_body(sql)
+        self.page_size = page_size or config.RESULT_PAGE_SIZE
+        self.key = key
+        self._lock = threading.Lock()
+        self._version = None
+        self._reset()
+
+    def _reset(self):
+        self._total = None
+        self._keyset = None
+        self._pages = OrderedDict()
+        self._page_starts = {0: None}
+
+    def _check_version(self):
+        # Offsets and keyset boundaries are only valid for the data they were read from
+        version = get_database_version()
+        if version != self._version:
+            self._version = version
+            self._reset()
+
+    def total_rows(self):
+        with self._lock:
+            self._check_version()
+            if self._total is None:
+                with span("db.page_count"):
+                    counted = read_frame(f"SELECT COUNT(*) FROM ({self.body})")
+                self._total = int(counted.iloc[0, 0])
+            return self._total
+
+    def page_count(self):
+        return max(1, math.ceil(self.total_rows() / self.page_size))
+
+    def _check_key(self):
+        # One scan counts the rows (cached for total_rows) and the distinct
+        # non-null keys; keyset paging needs the two to be equal
+        if self.key is None or self._keyset is not None:
+            return
+        # The query's own column names: SELECT * FROM (...) would rename a
+        # repeated Name to Name:1 and hide the ambiguity
+        columns = read_frame(limit_sql(self.body, 0)).columns
+        if list(columns).count(self.key) != 1:
+            self._keyset = False
+            return
+        key = _quote_identifier(self.key)
+        with span("db.page_key_check"):
+            counted = read_frame(
+                f"SELECT COUNT(*), COUNT(DISTINCT {key}), COUNT({key}) FROM ({self.body})"
+            )
+        rows, distinct, non_null = (int(v) for v in counted.iloc[0])
+        self._total = rows
+        self._keyset = rows == distinct == non_null
+
+    def uses_keyset(self):
+        with self._lock:
+            self._check_version()
+            self._check_key()
+            return bool(self._keyset)
+
+    def _page_sql(self, number):
+        if not self._keyset:
+            return limit_sql(self.body, self.page_size, offset=number * self.page_size), ()
+
+        key = _quote_identifier(self.key)
+        source = f"SELECT * FROM ({self.body})"
+        if number in self._page_starts:
+            start = self._page_starts[number]
+            if start is None:
+                return f"{source} ORDER BY {key} LIMIT {self.page_size}", ()
+            return f"{source} WHERE {key} > ? ORDER BY {key} LIMIT {self.page_size}", (start,)
+        return (
+            f"{source} ORDER BY {key} LIMIT {self.page_size} OFFSET {number * self.page_size}", ()
+        )
+
+    def page(self, number):
+        if number < 0:
+            raise ValueError("Page number cannot be negative")
+
+        with self._lock:
+            self._check_version()
+            if number in self._pages:
+                self._pages.move_to_end(number)
+                return self._pages[number].copy()
+            self._check_key()
+
+            sql, params = self._page_sql(number)
+            with span("db.page", page=number, keyset=bool(params)) as current:
+                df = read_frame(sql, params, capacity=self.page_size)
+                current.set(rows=len(df))
+
+            if self._keyset and len(df) == self.page_size:
+                self._page_starts[number + 1] = _bindable(df[self.key].iloc[-1])
+
+            self._pages[number] = df
+            while len(self._pages) > CACHED_PAGES:
+                self._pages.popitem(last=False)
+            return df.copy()
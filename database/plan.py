@@ -0,0 +1,266 @@
+import math
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+
+import config
+from utils.sql_lexer import tokenize
+from utils.tracing import span
+from .connection import get_connection, get_database_version
+from .schema import get_table_names
+
+# Fallbacks when the planner gives nothing better to go on
+DEFAULT_TABLE_ROWS = 1000
+AUTOMATIC_INDEX_ROWS = 10
+RANGE_SELECTIVITY = 4
+
+_LOOP_RE = re.compile(
+    r"^(?P<op>SCAN|SEARCH) (?P<name>\S+)(?: AS \S+)?"
+    r"(?: USING (?P<using>.*?))?(?: \((?P<terms>[^)]*)\))?$"
+)
+_INDEX_RE = re.compile(r"(?:(?P<automatic>AUTOMATIC) )?(?:PARTIAL )?(?:COVERING )?INDEX ?(?P<index>\S*)")
+_TEMP_BTREE_RE = re.compile(r"^USE TEMP B-TREE FOR (?P<purpose>.+)$")
+_SUBQUERY_RE = re.compile(r"^(?P<correlated>CORRELATED )?(?:SCALAR|LIST) SUBQUERY")
+_NAMED_RE = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (?P<name>\S+)")
+
+_JOIN_WORDS = frozenset(("FROM", "JOIN", ","))
+_NOT_ALIASES = frozenset((
+    "ON", "USING", "WHERE", "GROUP", "ORDER", "LIMIT", "HAVING", "JOIN", "LEFT", "RIGHT",
+    "FULL", "INNER", "OUTER", "CROSS", "NATURAL", "UNION", "EXCEPT", "INTERSECT", "WINDOW"
+))
+
+_rows_lock = threading.Lock()
+_row_counts = {"version": None, "tables": {}, "indexes": {}}
+
+
+@dataclass
+class PlanNode:
+    id: int
+    parent: int
+    detail: str
+    op: str = "OTHER"
+    table: str = None
+    index: str = None
+    terms: str = None
+    automatic_index: bool = False
+    correlated: bool = False
+    rows: float = 0
+    children: list = field(default_factory=list)
+
+    def to_dict(self):
+        return {
+            "detail": self.detail, "op": self.op, "table": self.table, "index": self.index,
+            "rows": round(self.rows), "children": [child.to_dict() for child in self.children]
+        }
+
+
+@dataclass
+class QueryPlan:
+    sql: str
+    nodes: list
+    full_scans: list
+    temp_btrees: list
+    automatic_indexes: list
+    nested_loop_depth: int
+    estimated_cost: float
+    estimated_rows: float
+
+    def exceeds(self, threshold=None):
+        threshold = config.PLAN_COST_THRESHOLD if threshold is None else threshold
+        return bool(threshold) and self.estimated_cost > threshold
+
+    def lines(self):
+        rendered = []
+
+        def walk(nodes, depth):
+            for node in nodes:
+                rendered.append("  " * depth + node.detail)
+                walk(node.children, depth + 1)
+
+        walk(self.nodes, 0)
+        return rendered
+
+    def summary(self):
+        parts = [f"est. cost {self.estimated_cost:,.0f} row visits"]
+        if self.full_scans:
+            parts.append("full scans: " + ", ".join(self.full_scans))
+        if self.temp_btrees:
+            parts.append("temp B-tree for " + ", ".join(self.temp_btrees))
+        if self.automatic_indexes:
+            parts.append("automatic index on " + ", ".join(self.automatic_indexes))
+        if self.nested_loop_depth > 1:
+            parts.append(f"{self.nested_loop_depth}-deep nested loop")
+        return "; ".join(parts)
+
+    def to_dict(self):
+        return {
+            "summary": self.summary(),
+            "estimated_cost": round(self.estimated_cost),
+            "estimated_rows": round(self.estimated_rows),
+            "full_scans": self.full_scans,
+            "temp_btrees": self.temp_btrees,
+            "automatic_indexes": self.automatic_indexes,
+            "nested_loop_depth": self.nested_loop_depth,
+            "nodes": [node.to_dict() for node in self.nodes]
+        }
+
+
+def _load_row_counts(conn):
+    # sqlite_stat1 (from ANALYZE) has both table sizes and average rows per
+    # index key; tables it doesn't cover are counted directly.
+    tables = {}
+    indexes = {}
+    try:
+        for table, index, stat in conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1"):
+            numbers = [int(n) for n in stat.split() if n.isdigit()]
+            if not numbers:
+                continue
+            tables[table.casefold()] = numbers[0]
+            if index:
+                indexes[index.casefold()] = numbers[1:]
+    except sqlite3.Error:
+        pass
+    for table in get_table_names(conn):
+        if table.casefold() not in tables:
+            tables[table.casefold()] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    return tables, indexes
+
+
+def get_row_counts():
+    version = get_database_version()
+    with _rows_lock:
+        if _row_counts["version"] != version:
+            with get_connection() as conn:
+                _row_counts["tables"], _row_counts["indexes"] = _load_row_counts(conn)
+            _row_counts["version"] = version
+        return _row_counts["tables"], _row_counts["indexes"]
+
+
+def table_aliases(sql, tables):
+    # EXPLAIN QUERY PLAN names loops by alias ("SCAN t"); map them back
+    words = [t for t in tokenize(sql) if t.kind not in ("ws", "comment")]
+    aliases = {}
+    for i, token in enumerate(words):
+        name = token.text.strip('"`[]').casefold()
+        if name not in tables or i == 0 or words[i - 1].text.upper() not in _JOIN_WORDS:
+            continue
+        aliases[name] = name
+        j = i + 1
+        if j < len(words) and words[j].text.upper() == "AS":
+            j += 1
+        if j < len(words) and words[j].kind in ("word", "ident") \
+                and words[j].text.upper() not in _NOT_ALIASES:
+            aliases[words[j].text.strip('"`[]').casefold()] = name
+    return aliases
+
+
+def _lookup_rows(node, table_rows, index_stats):
+    terms = node.terms or ""
+    equalities = terms.count("=?") - terms.count(">=?") - terms.count("<=?")
+    if node.automatic_index:
+        return AUTOMATIC_INDEX_ROWS
+    if "rowid=" in terms and equalities == 1:
+        return 1
+    stats = index_stats.get((node.index or "").casefold())
+    if stats and 0 < equalities <= len(stats):
+        return stats[equalities - 1]
+    if equalities:
+        return max(1, table_rows / 10)
+    return max(1, table_rows / RANGE_SELECTIVITY)
+
+
+def _parse(rows, aliases):
+    nodes = {}
+    roots = []
+    for node_id, parent, _, detail in rows:
+        node = PlanNode(node_id, parent, detail)
+        loop = _LOOP_RE.match(detail)
+        if loop:
+            node.op = loop.group("op")
+            name = loop.group("name").casefold()
+            node.table = aliases.get(name, name)
+            node.terms = loop.group("terms")
+            using = loop.group("using") or ""
+            index = _INDEX_RE.search(using)
+            if index:
+                node.index = index.group("index") or None
+                node.automatic_index = bool(index.group("automatic"))
+            elif using:
+                node.index = using
+        elif _TEMP_BTREE_RE.match(detail):
+            node.op = "TEMP_BTREE"
+        elif _SUBQUERY_RE.match(detail):
+            node.op = "SUBQUERY"
+            node.correlated = detail.startswith("CORRELATED")
+        elif _NAMED_RE.match(detail):
+            node.op = "MATERIALIZE"
+            node.table = _NAMED_RE.match(detail).group("name").casefold()
+
+        nodes[node_id] = node
+        (nodes[parent].children if parent in nodes else roots).append(node)
+    return roots
+
+
+def _estimate(nodes, table_rows, index_stats, materialized, summary):
+    # Sibling SCAN/SEARCH nodes are the loops of one nested-loop join, outermost
+    # first: each runs once per row produced by the loops before it.
+    outer_rows = 1.0
+    cost = 0.0
+    loops = 0
+
+    for node in nodes:
+        if node.op in ("SCAN", "SEARCH"):
+            loops += 1
+            size = table_rows.get(node.table, materialized.get(node.table, DEFAULT_TABLE_ROWS))
+            if node.op == "SCAN":
+                node.rows = size
+                if node.table in table_rows:
+                    summary["full_scans"].append(node.table)
+            else:
+                node.rows = _lookup_rows(node, size, index_stats)
+            if node.automatic_index:
+                # Building the index reads the whole table once
+                cost += size
+                summary["automatic_indexes"].append(f"{node.table} ({node.terms})")
+            cost += outer_rows * node.rows
+            outer_rows *= node.rows
+        elif node.op == "TEMP_BTREE":
+            cost += outer_rows * math.log2(outer_rows + 1)
+            summary["temp_btrees"].append(_TEMP_BTREE_RE.match(node.detail).group("purpose"))
+        elif node.children:
+            child_cost, child_rows = _estimate(
+                node.children, table_rows, index_stats, materialized, summary
+            )
+            if node.op == "MATERIALIZE":
+                materialized[node.table] = child_rows
+            node.rows = child_rows
+            cost += child_cost * (outer_rows if node.correlated else 1)
+
+    summary["depth"] = max(summary["depth"], loops)
+    return cost, outer_rows
+
+
+def explain_query(sql):
+    table_rows, index_stats = get_row_counts()
+    with span("db.explain") as current:
+        with get_connection() as conn:
+            try:
+                rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            except sqlite3.Error as e:
+                raise sqlite3.Error(f"Query planning failed: {str(e)}")
+        nodes = _parse([tuple(row) for row in rows], table_aliases(sql, table_rows))
+        summary = {"full_scans": [], "temp_btrees": [], "automatic_indexes": [], "depth": 0}
+        cost, output_rows = _estimate(nodes, table_rows, index_stats, {}, summary)
+        current.set(cost=round(cost))
+
+    return QueryPlan(
+        sql=sql,
+        nodes=nodes,
+        full_scans=summary["full_scans"],
+        temp_btrees=summary["temp_btrees"],
+        automatic_indexes=summary["automatic_indexes"],
+        nested_loop_depth=summary["depth"],
+        estimated_cost=cost,
+        estimated_rows=output_rows
+    )
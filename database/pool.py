@@ -0,0 +1,137 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import config
+
+
+def open_readonly_connection(database_path=None):
+    path = Path(database_path or config.DATABASE_PATH).resolve()
+    conn = sqlite3.connect(
+        f"{path.as_uri()}?mode=ro", uri=True,
+        timeout=config.QUERY_TIMEOUT_SECONDS, check_same_thread=False
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+    conn.execute(f"PRAGMA cache_size=-{int(config.SQLITE_CACHE_SIZE_KB)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, database_path=None, size=None, checkout_timeout=None):
+        self.database_path = database_path or config.DATABASE_PATH
+        self.size = max(1, size or config.DB_POOL_SIZE)
+        self.checkout_timeout = checkout_timeout or config.DB_POOL_CHECKOUT_TIMEOUT_SECONDS
+
+        # LIFO so the most recently used connection (warmest page cache) goes out first
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _create(self):
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            return open_readonly_connection(self.database_path)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _checkout(self):
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._create()
+            if conn is None:
+                try:
+                    conn = self._idle.get(timeout=self.checkout_timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(
+                        f"Timed out after {self.checkout_timeout}s waiting for a database connection"
+                    )
+        wait = time.perf_counter() - start
+
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+            if wait > 0.001:
+                self._waits += 1
+        return conn
+
+    def _checkin(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            conn = None
+
+        with self._lock:
+            self._in_use -= 1
+            if conn is None:
+                self._created -= 1
+        if conn is not None:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        # Nested checkouts on the same thread reuse the held connection instead
+        # of taking a second slot (and deadlocking a pool of size one).
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self._checkout()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._checkin(conn)
+
+    def stats(self):
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "peak_in_use": self._peak_in_use,
+                "utilisation": self._in_use / self.size,
+                "peak_utilisation": self._peak_in_use / self.size,
+                "checkouts": checkouts,
+                "waited_checkouts": self._waits,
+                "avg_wait_ms": (self._total_wait / checkouts * 1000) if checkouts else 0.0,
+                "max_wait_ms": self._max_wait * 1000
+            }
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+
+import config
+from utils import sanitize_sql
+
+
+def normalize_sql(sql):
+    # Lexer-based: whitespace and comments between tokens are normalised,
+    # string literals ('a  b' vs 'a b') are kept verbatim
+    return sanitize_sql(sql)
+
+
+def make_result_key(sql, limit, version):
+    return normalize_sql(sql), limit, version
+
+
+def frame_size_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class ResultCache:
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or config.RESULT_CACHE_MAX_BYTES
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            entry["hits"] += 1
+            self._hits += 1
+            df = entry["data"]
+        # Callers may add columns or sort in place; never hand out the cached frame
+        return df.copy()
+
+    def put(self, key, df):
+        size = frame_size_bytes(df)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old["size"]
+
+            self._entries[key] = {"data": df.copy(), "size": size, "hits": 0}
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted["size"]
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+                "items": [
+                    {"sql": key[0], "limit": key[1], "bytes": entry["size"],
+                     "rows": len(entry["data"]), "hits": entry["hits"]}
+                    for key, entry in self._entries.items()
+                ]
+            }
+
+
+_cache_lock = threading.Lock()
+_cache = None
+
+
+def get_result_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
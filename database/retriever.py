@@ -0,0 +1,236 @@
+import math
+import re
+import threading
+from collections import defaultdict, deque
+from dataclasses import dataclass
+
+import config
+from .schema import TABLE_RELATIONSHIPS, format_schema_text
+
+# Business vocabulary that never appears in Chinook identifiers
+SCHEMA_SYNONYMS = {
+    "sale": ["invoices", "invoice_items"],
+    "sell": ["invoice_items"],
+    "selling": ["invoice_items"],
+    "sold": ["invoice_items"],
+    "revenue": ["invoices", "invoice_items"],
+    "purchase": ["invoice_items", "invoices"],
+    "order": ["invoices"],
+    "spent": ["invoices"],
+    "song": ["tracks"],
+    "band": ["artists"],
+    "singer": ["artists"],
+    "format": ["media_types"],
+    "staff": ["employees"],
+    "manager": ["employees"],
+    "rep": ["employees"],
+}
+
+STOPWORDS = {
+    "all", "and", "are", "by", "each", "for", "from", "how", "in", "is", "list",
+    "many", "me", "most", "number", "of", "on", "one", "show", "than", "the",
+    "their", "to", "top", "total", "what", "which", "who", "with"
+}
+
+TABLE_NAME_WEIGHT = 3.0
+TABLE_NAME_PART_WEIGHT = 1.0
+COLUMN_WEIGHT = 2.0
+KEY_COLUMN_WEIGHT = 0.5
+SAMPLE_WEIGHT = 1.0
+RELATIONSHIP_WEIGHT = 0.5
+SYNONYM_WEIGHT = 2.0
+# Tables scoring below this fraction of the best match are only pulled in as join paths
+RELATIVE_SCORE_CUTOFF = 0.4
+
+_RELATIONSHIP_LINE = re.compile(r"^- (\w+)\.\w+ -> (\w+)\.\w+ \((.*)\)$")
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", str(text))
+    return [_stem(word) for word in re.findall(r"[a-z0-9]+", text.lower())
+            if len(word) > 1 and word not in STOPWORDS]
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / 4)
+
+
+@dataclass
+class RetrievalResult:
+    tables: list
+    text: str
+    tokens: int
+    full_tokens: int
+
+    @property
+    def saved_tokens(self):
+        return self.full_tokens - self.tokens
+
+    @property
+    def saved_ratio(self):
+        return self.saved_tokens / self.full_tokens if self.full_tokens else 0.0
+
+
+class SchemaRetriever:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.tables = list(snapshot.blocks)
+        self.full_tokens = estimate_tokens(snapshot.text)
+        self._index = defaultdict(lambda: defaultdict(float))
+        self._graph = defaultdict(set)
+        self._relationship_lines = []
+
+        for table in self.tables:
+            self._index_table(table)
+        self._index_relationships()
+
+    def _add(self, text, table, weight):
+        for term in set(tokenize(text)):
+            self._index[term][table] = max(self._index[term][table], weight)
+
+    def _index_table(self, table):
+        name_terms = tokenize(table)
+        weight = TABLE_NAME_WEIGHT if len(name_terms) == 1 else TABLE_NAME_PART_WEIGHT
+        for term in name_terms:
+            self._index[term][table] = max(self._index[term][table], weight)
+
+        for col in self.snapshot.columns[table]:
+            key_column = col["primary_key"] or col["name"].endswith("Id")
+            self._add(col["name"], table, KEY_COLUMN_WEIGHT if key_column else COLUMN_WEIGHT)
+
+        for sample in self.snapshot.samples.get(table, []):
+            for value in sample.values():
+                if isinstance(value, str):
+                    self._add(value, table, SAMPLE_WEIGHT)
+
+        for fk in self.snapshot.foreign_keys.get(table, []):
+            if fk["ref_table"] in self.snapshot.blocks and fk["ref_table"] != table:
+                self._graph[table].add(fk["ref_table"])
+                self._graph[fk["ref_table"]].add(table)
+
+    def _index_relationships(self):
+        for line in TABLE_RELATIONSHIPS.strip().splitlines():
+            match = _RELATIONSHIP_LINE.match(line.strip())
+            if not match:
+                continue
+            source, target, description = match.groups()
+            self._relationship_lines.append((source, target, line.strip()))
+            for table in (source, target):
+                if table in self.snapshot.blocks:
+                    self._add(description, table, RELATIONSHIP_WEIGHT)
+
+    def score(self, question):
+        scores = defaultdict(float)
+        for term in tokenize(question):
+            for table, weight in self._index.get(term, {}).items():
+                scores[table] += weight
+            for table in SCHEMA_SYNONYMS.get(term, []):
+                if table in self.snapshot.blocks:
+                    scores[table] += SYNONYM_WEIGHT
+        return dict(scores)
+
+    def _join_path(self, selected, target):
+        # Shortest path in the foreign-key graph from target to any selected table
+        previous = {target: None}
+        queue = deque([target])
+        while queue:
+            table = queue.popleft()
+            if table in selected:
+                path = []
+                while table is not None:
+                    path.append(table)
+                    table = previous[table]
+                return path
+            for neighbour in sorted(self._graph[table]):
+                if neighbour not in previous:
+                    previous[neighbour] = table
+                    queue.append(neighbour)
+        return [target]
+
+    def _render(self, tables):
+        ordered = [table for table in self.tables if table in tables]
+        lines = [line for source, target, line in self._relationship_lines
+                 if source in tables and target in tables]
+        relationships = "\nTable Relationships:\n" + "\n".join(lines) + "\n" if lines else ""
+        return format_schema_text((self.snapshot.blocks[t] for t in ordered), relationships)
+
+    def retrieve(self, question, token_budget=None):
+        token_budget = token_budget or config.SCHEMA_TOKEN_BUDGET
+        scores = self.score(question)
+        cutoff = max(config.SCHEMA_PRUNING_MIN_SCORE,
+                     max(scores.values(), default=0) * RELATIVE_SCORE_CUTOFF)
+        ranked = sorted(
+            (table for table, score in scores.items() if score >= cutoff),
+            key=lambda table: (-scores[table], table)
+        )
+
+        if not ranked:
+            # Nothing recognisable in the question: let the model see everything
+            return RetrievalResult(self.tables, self.snapshot.text,
+                                   self.full_tokens, self.full_tokens)
+
+        selected = set()
+        text = None
+        for table in ranked:
+            candidate = selected | set(self._join_path(selected, table)) if selected else {table}
+            candidate_text = self._render(candidate)
+            if text is not None and estimate_tokens(candidate_text) > token_budget:
+                break
+            selected, text = candidate, candidate_text
+
+        if len(selected) == 1:
+            # A lone lookup table ("distribution of media types") is almost
+            # always aggregated over the tables that reference it.
+            (table,) = selected
+            if not self.snapshot.foreign_keys.get(table):
+                candidate = selected | self._graph[table]
+                candidate_text = self._render(candidate)
+                if estimate_tokens(candidate_text) <= token_budget:
+                    selected, text = candidate, candidate_text
+
+        ordered = [table for table in self.tables if table in selected]
+        return RetrievalResult(ordered, text, estimate_tokens(text), self.full_tokens)
+
+
+_lock = threading.Lock()
+_retriever = None
+_stats = {"questions": 0, "tokens": 0, "full_tokens": 0}
+_recent = deque(maxlen=50)
+
+
+def get_schema_retriever(snapshot):
+    global _retriever
+    with _lock:
+        if _retriever is None or _retriever.snapshot is not snapshot:
+            _retriever = SchemaRetriever(snapshot)
+        return _retriever
+
+
+def retrieve_schema(question, snapshot, token_budget=None):
+    result = get_schema_retriever(snapshot).retrieve(question, token_budget)
+    with _lock:
+        _stats["questions"] += 1
+        _stats["tokens"] += result.tokens
+        _stats["full_tokens"] += result.full_tokens
+        _recent.append({
+            "question": question, "tables": result.tables, "tokens": result.tokens,
+            "full_tokens": result.full_tokens, "saved_tokens": result.saved_tokens
+        })
+    return result
+
+
+def get_retrieval_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["recent"] = list(_recent)
+    stats["saved_tokens"] = stats["full_tokens"] - stats["tokens"]
+    stats["saved_ratio"] = stats["saved_tokens"] / stats["full_tokens"] if stats["full_tokens"] else 0.0
+    return stats
@@ -0,0 +1,620 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+
+import config
+from utils import fingerprint_sql
+from utils.sql_lexer import tokenize
+from utils.tracing import span
+from .guard import guarded
+from .materialize import fetch_frame
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_meta (
+    name TEXT PRIMARY KEY,
+    definition TEXT NOT NULL,
+    source TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    refreshed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rewrites (
+    fingerprint TEXT PRIMARY KEY,
+    rollup TEXT NOT NULL,
+    definition TEXT NOT NULL,
+    verified INTEGER NOT NULL,
+    checked_at REAL NOT NULL
+);
+"""
+
+_CLAUSES = ("FROM", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT")
+_UNSUPPORTED = frozenset((
+    "UNION", "EXCEPT", "INTERSECT", "WITH", "OVER", "WINDOW",
+    "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "OUTER", "USING"
+))
+_AGGREGATES = frozenset(("sum", "count", "avg", "min", "max", "total", "group_concat"))
+_NOT_ALIASES = frozenset(("END", "NULL", "TRUE", "FALSE", "ASC", "DESC"))
+
+
+@dataclass(frozen=True)
+class Rollup:
+    name: str
+    root: str
+    tables: frozenset
+    joins: frozenset
+    build_sql: str
+    dimensions: dict
+    measures: dict
+    presence: dict
+
+    @property
+    def definition(self):
+        return hashlib.sha256(self.build_sql.encode("utf-8")).hexdigest()[:16]
+
+
+def _join(left, right):
+    return frozenset((left, right))
+
+
+_MONTH = "strftime ( '%Y-%m' , invoices.invoicedate )"
+_YEAR = "strftime ( '%Y' , invoices.invoicedate )"
+
+# Every dimension and measure is keyed by its canonical token text: columns
+# as table.column, words lower-cased, one space between tokens.
+ROLLUPS = (
+    Rollup(
+        name="invoice_rollup",
+        root="invoices",
+        tables=frozenset(("invoices",)),
+        joins=frozenset(),
+        build_sql=(
+            "SELECT strftime('%Y-%m', InvoiceDate) AS dim_month, strftime('%Y', InvoiceDate) AS dim_year, "
+            "BillingCountry AS dim_country, SUM(Total) AS sum_total, COUNT(*) AS invoice_count, "
+            "MIN(Total) AS min_total, MAX(Total) AS max_total "
+            "FROM src.invoices GROUP BY 1, 2, 3"
+        ),
+        dimensions={
+            _MONTH: "_r.dim_month",
+            _YEAR: "_r.dim_year",
+            "invoices.billingcountry": "_r.dim_country",
+        },
+        measures={
+            "sum ( invoices.total )": "SUM(_r.sum_total)",
+            "total ( invoices.total )": "TOTAL(_r.sum_total)",
+            "avg ( invoices.total )": "(SUM(_r.sum_total) * 1.0 / SUM(_r.invoice_count))",
+            "min ( invoices.total )": "MIN(_r.min_total)",
+            "max ( invoices.total )": "MAX(_r.max_total)",
+            "count ( * )": "COALESCE(SUM(_r.invoice_count), 0)",
+            "count ( invoices.invoiceid )": "COALESCE(SUM(_r.invoice_count), 0)",
+        },
+        presence={},
+    ),
+    Rollup(
+        name="sales_rollup",
+        root="invoice_items",
+        tables=frozenset(("invoice_items", "invoices", "tracks", "genres", "albums", "artists")),
+        joins=frozenset((
+            _join("invoices.invoiceid", "invoice_items.invoiceid"),
+            _join("invoice_items.trackid", "tracks.trackid"),
+            _join("tracks.genreid", "genres.genreid"),
+            _join("tracks.albumid", "albums.albumid"),
+            _join("albums.artistid", "artists.artistid"),
+        )),
+        # LEFT JOINs keep every line; the has_* flags and joined ids let a
+        # query's inner joins be replayed as filters.
+        build_sql=(
+            "SELECT strftime('%Y-%m', i.InvoiceDate) AS dim_month, strftime('%Y', i.InvoiceDate) AS dim_year, "
+            "i.BillingCountry AS dim_country, g.GenreId AS dim_genre_id, g.Name AS dim_genre, "
+            "ar.ArtistId AS dim_artist_id, ar.Name AS dim_artist, "
+            "i.InvoiceId IS NOT NULL AS has_invoice, t.TrackId IS NOT NULL AS has_track, "
+            "al.AlbumId IS NOT NULL AS has_album, "
+            "SUM(ii.UnitPrice * ii.Quantity) AS sum_revenue, SUM(ii.Quantity) AS sum_quantity, "
+            "COUNT(*) AS line_count "
+            "FROM src.invoice_items ii "
+            "LEFT JOIN src.invoices i ON i.InvoiceId = ii.InvoiceId "
+            "LEFT JOIN src.tracks t ON t.TrackId = ii.TrackId "
+            "LEFT JOIN src.genres g ON g.GenreId = t.GenreId "
+            "LEFT JOIN src.albums al ON al.AlbumId = t.AlbumId "
+            "LEFT JOIN src.artists ar ON ar.ArtistId = al.ArtistId "
+            "GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9, 10"
+        ),
+        dimensions={
+            _MONTH: "_r.dim_month",
+            _YEAR: "_r.dim_year",
+            "invoices.billingcountry": "_r.dim_country",
+            "genres.genreid": "_r.dim_genre_id",
+            "genres.name": "_r.dim_genre",
+            "artists.artistid": "_r.dim_artist_id",
+            "artists.name": "_r.dim_artist",
+        },
+        measures={
+            "sum ( invoice_items.unitprice * invoice_items.quantity )": "SUM(_r.sum_revenue)",
+            "sum ( invoice_items.quantity * invoice_items.unitprice )": "SUM(_r.sum_revenue)",
+            "sum ( invoice_items.quantity )": "SUM(_r.sum_quantity)",
+            "count ( * )": "COALESCE(SUM(_r.line_count), 0)",
+            "count ( invoice_items.invoicelineid )": "COALESCE(SUM(_r.line_count), 0)",
+        },
+        presence={
+            "invoices": "_r.has_invoice = 1",
+            "tracks": "_r.has_track = 1",
+            "albums": "_r.has_album = 1",
+            "genres": "_r.dim_genre_id IS NOT NULL",
+            "artists": "_r.dim_artist_id IS NOT NULL",
+        },
+    ),
+)
+
+_ROLLUP_TABLES = frozenset(table for rollup in ROLLUPS for table in rollup.tables)
+
+
+class _Ineligible(Exception):
+    pass
+
+
+@dataclass
+class Rewrite:
+    fingerprint: str
+    rollup: str
+    sql: str
+    verified: bool = None
+
+
+def _quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _closing_paren(tokens, start):
+    depth = 0
+    for i in range(start, len(tokens)):
+        if tokens[i].text == "(":
+            depth += 1
+        elif tokens[i].text == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    raise _Ineligible()
+
+
+def _clause_bounds(tokens):
+    # Index of each top-level clause keyword, and where each clause ends
+    starts = {}
+    depth = 0
+    for i, token in enumerate(tokens):
+        if token.text == "(":
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+        elif depth == 0 and token.kind == "word" and token.text.upper() in _CLAUSES:
+            starts.setdefault(token.text.upper(), i)
+    ordered = sorted(starts.values()) + [len(tokens)]
+    return {name: (i, ordered[ordered.index(i) + 1]) for name, i in starts.items()}
+
+
+def _split_top_level(tokens, lo, hi):
+    items = []
+    depth = 0
+    start = lo
+    for i in range(lo, hi):
+        if tokens[i].text == "(":
+            depth += 1
+        elif tokens[i].text == ")":
+            depth -= 1
+        elif tokens[i].text == "," and depth == 0:
+            items.append((start, i))
+            start = i + 1
+    items.append((start, hi))
+    return items
+
+
+def _same_result(expected, actual):
+    if list(expected.columns) != list(actual.columns) or len(expected) != len(actual):
+        return False
+    try:
+        # Partial sums are added in a different order, so allow float rounding
+        pd.testing.assert_frame_equal(
+            expected.reset_index(drop=True), actual.reset_index(drop=True),
+            check_dtype=False, check_exact=False, rtol=1e-9, atol=1e-9
+        )
+    except (AssertionError, TypeError, ValueError):
+        return False
+    return True
+
+
+class _Translation:
+    # Token-by-token rewrite of one statement onto a rollup's columns
+
+    def __init__(self, rollup, tokens, sql, aliases, columns):
+        self.rollup = rollup
+        self.tokens = tokens
+        self.sql = sql
+        self.aliases = aliases
+        self.columns = columns
+        self.in_query = set(aliases.values())
+        self.aggregated = False
+
+    def resolve(self, qualifier, name):
+        name = name.strip('"`[]').casefold()
+        if qualifier is not None:
+            table = self.aliases.get(qualifier.strip('"`[]').casefold())
+            if table is None or name not in self.columns.get(table, {}):
+                raise _Ineligible()
+            return f"{table}.{name}"
+        owners = [t for t in self.in_query if name in self.columns.get(t, {})]
+        if len(owners) > 1:
+            raise _Ineligible()
+        return f"{owners[0]}.{name}" if owners else None
+
+    def column_at(self, i, hi):
+        # (canonical column, tokens consumed) for a column reference at i, if any
+        token = self.tokens[i]
+        if token.kind not in ("word", "ident"):
+            return None, 1
+        if i + 2 < hi and self.tokens[i + 1].text == ".":
+            return self.resolve(token.text, self.tokens[i + 2].text), 3
+        return self.resolve(None, token.text), 1
+
+    def canonical(self, lo, hi):
+        parts = []
+        i = lo
+        while i < hi:
+            column, used = self.column_at(i, hi)
+            if column is not None:
+                parts.append(column)
+            else:
+                token = self.tokens[i]
+                parts.append(token.text.lower() if token.kind == "word" else token.text)
+            i += used
+        return " ".join(parts)
+
+    def translate(self, lo, hi, aliases_first=()):
+        out = []
+        i = lo
+        while i < hi:
+            token = self.tokens[i]
+            following = self.tokens[i + 1].text if i + 1 < hi else ""
+
+            if token.kind == "word" and following == "(":
+                end = _closing_paren(self.tokens, i + 1)
+                call = self.canonical(i, end + 1)
+                if call in self.rollup.measures:
+                    out.append(self.rollup.measures[call])
+                    self.aggregated = True
+                    i = end + 1
+                    continue
+                if call in self.rollup.dimensions:
+                    out.append(self.rollup.dimensions[call])
+                    i = end + 1
+                    continue
+                if token.text.lower() in _AGGREGATES:
+                    raise _Ineligible()
+                out.append(token.text)
+                i += 1
+                continue
+
+            if token.text == "*":
+                previous = self.tokens[i - 1].text.upper() if i > 0 else ""
+                if previous in ("SELECT", "DISTINCT", ",", "."):
+                    raise _Ineligible()
+
+            if token.kind in ("word", "ident") and token.text.strip('"`[]').casefold() in aliases_first \
+                    and following != ".":
+                out.append(token.text)
+                i += 1
+                continue
+
+            column, used = self.column_at(i, hi)
+            if column is not None:
+                if column not in self.rollup.dimensions:
+                    raise _Ineligible()
+                out.append(self.rollup.dimensions[column])
+            else:
+                out.append(token.text)
+            i += used
+        return " ".join(out)
+
+    def select_list(self, lo, hi):
+        # Unaliased items are given the name SQLite would have reported for
+        # the original expression, so the result columns are unchanged.
+        rendered = []
+        names = set()
+        if self.tokens[lo].text.upper() in ("DISTINCT", "ALL"):
+            rendered.append(self.tokens[lo].text)
+            lo += 1
+        items = []
+        for start, end in _split_top_level(self.tokens, lo, hi):
+            if end - start >= 3 and self.tokens[end - 2].text.upper() == "AS":
+                alias = self.tokens[end - 1].text
+                expression = self.translate(start, end - 2)
+            elif end - start >= 2 and self.tokens[end - 1].kind in ("word", "ident") \
+                    and self.tokens[end - 1].text.upper() not in _NOT_ALIASES \
+                    and self.tokens[end - 2].text != "." \
+                    and (self.tokens[end - 2].text == ")" or self.tokens[end - 2].kind in (
+                        "word", "ident", "string", "number")):
+                alias = self.tokens[end - 1].text
+                expression = self.translate(start, end - 1)
+            else:
+                column, used = self.column_at(start, end)
+                if column is not None and used == end - start:
+                    table, name = column.split(".", 1)
+                    alias = _quote_identifier(self.columns[table][name])
+                else:
+                    last = self.tokens[end - 1]
+                    alias = _quote_identifier(self.sql[self.tokens[start].start:last.start + len(last.text)])
+                expression = self.translate(start, end)
+            names.add(alias.strip('"`[]').casefold())
+            items.append(f"{expression} AS {alias}")
+        rendered.append(", ".join(items))
+        return " ".join(rendered), names
+
+
+def _parse_from(tokens, lo, hi):
+    # table [AS] [alias] ([INNER] JOIN table [AS] [alias] ON a.x = b.y)*
+    aliases = {}
+    conditions = []
+    i = lo
+
+    def table_ref(i):
+        if i >= hi or tokens[i].kind not in ("word", "ident") or tokens[i].text == "(":
+            raise _Ineligible()
+        table = tokens[i].text.strip('"`[]').casefold()
+        aliases[table] = table
+        i += 1
+        if i < hi and tokens[i].text.upper() == "AS":
+            i += 1
+        if i < hi and tokens[i].kind in ("word", "ident") \
+                and tokens[i].text.upper() not in ("JOIN", "INNER", "ON"):
+            aliases[tokens[i].text.strip('"`[]').casefold()] = table
+            i += 1
+        return i
+
+    i = table_ref(i)
+    while i < hi:
+        if tokens[i].text.upper() == "INNER":
+            i += 1
+        if i >= hi or tokens[i].text.upper() != "JOIN":
+            raise _Ineligible()
+        i = table_ref(i + 1)
+        if i + 7 > hi or tokens[i].text.upper() != "ON":
+            raise _Ineligible()
+        left, op, right = tokens[i + 1:i + 4], tokens[i + 4], tokens[i + 5:i + 8]
+        if op.text not in ("=", "==") or left[1].text != "." or right[1].text != ".":
+            raise _Ineligible()
+        conditions.append(((left[0].text, left[2].text), (right[0].text, right[2].text)))
+        i += 8
+    return aliases, conditions
+
+
+class RollupStore:
+    # Precomputed aggregates in a sidecar SQLite file, rebuilt from the source
+    # database whenever its version changes. Eligible queries (inner joins
+    # along the rollup's keys, grouping and filtering only on its dimensions,
+    # aggregating only its measures) are rewritten to read the rollup. A
+    # rewrite is served only after it has once returned the same result as
+    # the original; the verdict is kept per query fingerprint.
+
+    def __init__(self, path=None, database_path=None, rollups=ROLLUPS):
+        self.path = Path(path or config.ROLLUP_PATH)
+        self.database_path = Path(database_path or config.DATABASE_PATH)
+        self.rollups = rollups
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._version = None
+        self._columns = {}
+        self._verdicts = {}
+        self._stats = {
+            "lookups": 0, "ineligible": 0, "hits": 0, "verified": 0,
+            "mismatches": 0, "refreshes": 0, "refresh_ms": 0.0
+        }
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _refresh(self, source):
+        started = time.perf_counter()
+        with span("db.rollup_refresh") as current:
+            # URI mode so the source can be attached read-only
+            conn = sqlite3.connect(self.path.resolve().as_uri(), uri=True, timeout=30, isolation_level=None)
+            try:
+                conn.execute("ATTACH DATABASE ? AS src", (f"{self.database_path.resolve().as_uri()}?mode=ro",))
+                conn.execute("BEGIN IMMEDIATE")
+                total = 0
+                for rollup in self.rollups:
+                    conn.execute(f"DROP TABLE IF EXISTS {rollup.name}")
+                    conn.execute(f"CREATE TABLE {rollup.name} AS {rollup.build_sql}")
+                    rows = conn.execute(f"SELECT COUNT(*) FROM {rollup.name}").fetchone()[0]
+                    conn.execute(
+                        "INSERT OR REPLACE INTO rollup_meta (name, definition, source, rows, refreshed_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (rollup.name, rollup.definition, source, rows, time.time())
+                    )
+                    total += rows
+                conn.execute("COMMIT")
+                conn.execute("DETACH DATABASE src")
+            finally:
+                conn.close()
+            current.set(rows=total)
+        self._count("refreshes")
+        self._count("refresh_ms", (time.perf_counter() - started) * 1000)
+
+    def _load_columns(self):
+        conn = sqlite3.connect(f"{self.database_path.resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            return {
+                table: {row[1].casefold(): row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+                for table in _ROLLUP_TABLES
+            }
+        finally:
+            conn.close()
+
+    def ensure_fresh(self, version):
+        if version == self._version:
+            return
+        with self._refresh_lock:
+            if version == self._version:
+                return
+            # data_version is per process; across restarts the schema version
+            # and file mtime tell whether the stored rollups are still current.
+            source = json.dumps([version[0], version[2]])
+            stored = dict(self._connection().execute("SELECT name, definition || ':' || source FROM rollup_meta"))
+            current = all(stored.get(r.name) == f"{r.definition}:{source}" for r in self.rollups)
+            if self._version is not None or not current:
+                self._refresh(source)
+            self._columns = self._load_columns()
+            self._version = version
+
+    def _verdict(self, fingerprint, rollup):
+        key = (fingerprint, rollup.name)
+        if key not in self._verdicts:
+            row = self._connection().execute(
+                "SELECT verified FROM rewrites WHERE fingerprint = ? AND rollup = ? AND definition = ?",
+                (fingerprint, rollup.name, rollup.definition)
+            ).fetchone()
+            self._verdicts[key] = None if row is None else bool(row[0])
+        return self._verdicts[key]
+
+    def _pick(self, tables, conditions, aliases):
+        joins = set()
+        for left, right in conditions:
+            left_table = aliases.get(left[0].strip('"`[]').casefold())
+            right_table = aliases.get(right[0].strip('"`[]').casefold())
+            if left_table is None or right_table is None:
+                return None
+            joins.add(_join(f"{left_table}.{left[1].casefold()}", f"{right_table}.{right[1].casefold()}"))
+        for rollup in self.rollups:
+            if rollup.root in tables and tables <= rollup.tables and joins <= rollup.joins \
+                    and len(joins) == len(tables) - 1:
+                return rollup
+        return None
+
+    def rewrite(self, sql, version):
+        self._count("lookups")
+        try:
+            rewrite = self._rewrite(sql, version)
+        except (_Ineligible, IndexError, sqlite3.Error):
+            rewrite = None
+        if rewrite is None:
+            self._count("ineligible")
+        return rewrite
+
+    def _rewrite(self, sql, version):
+        tokens = [t for t in tokenize(sql) if t.kind not in ("ws", "comment")]
+        if not tokens or tokens[0].text.upper() != "SELECT":
+            return None
+        for i, token in enumerate(tokens):
+            if token.kind == "word" and token.text.upper() in _UNSUPPORTED:
+                return None
+            if token.text == "(" and i + 1 < len(tokens) and tokens[i + 1].text.upper() == "SELECT":
+                return None
+
+        bounds = _clause_bounds(tokens)
+        if "FROM" not in bounds:
+            return None
+        from_start, from_end = bounds["FROM"]
+        aliases, conditions = _parse_from(tokens, from_start + 1, from_end)
+        tables = frozenset(aliases.values())
+        if not tables <= _ROLLUP_TABLES:
+            return None
+        rollup = self._pick(tables, conditions, aliases)
+        if rollup is None:
+            return None
+
+        self.ensure_fresh(version)
+        fingerprint = fingerprint_sql(sql)
+        if self._verdict(fingerprint, rollup) is False:
+            return None
+
+        translation = _Translation(rollup, tokens, sql, aliases, self._columns)
+        select, names = translation.select_list(1, from_start)
+        parts = [f"SELECT {select}", f"FROM {rollup.name} _r"]
+
+        filters = [rollup.presence[t] for t in sorted(tables) if t in rollup.presence]
+        if "WHERE" in bounds:
+            lo, hi = bounds["WHERE"]
+            filters.insert(0, f"({translation.translate(lo + 1, hi)})")
+        if filters:
+            parts.append("WHERE " + " AND ".join(filters))
+
+        for clause in ("GROUP", "HAVING", "ORDER", "LIMIT"):
+            if clause in bounds:
+                lo, hi = bounds[clause]
+                # ORDER BY prefers result aliases over columns; GROUP BY does not
+                parts.append(translation.translate(lo, hi, names if clause == "ORDER" else ()))
+
+        if "GROUP" not in bounds and not translation.aggregated:
+            return None
+        return Rewrite(fingerprint, rollup.name, " ".join(parts), self._verdict(fingerprint, rollup))
+
+    def read(self, rewrite, capacity=None):
+        conn = self._connection()
+        with span("db.rollup", rollup=rewrite.rollup), guarded(conn):
+            df = fetch_frame(conn.execute(rewrite.sql), capacity=capacity)
+        self._count("hits")
+        return df
+
+    def verify(self, rewrite, expected, capacity=None):
+        try:
+            conn = self._connection()
+            with guarded(conn):
+                actual = fetch_frame(conn.execute(rewrite.sql), capacity=capacity)
+            verified = _same_result(expected, actual)
+        except sqlite3.Error:
+            verified = False
+
+        rollup = next(r for r in self.rollups if r.name == rewrite.rollup)
+        self._connection().execute(
+            "INSERT OR REPLACE INTO rewrites (fingerprint, rollup, definition, verified, checked_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (rewrite.fingerprint, rollup.name, rollup.definition, int(verified), time.time())
+        )
+        self._verdicts[(rewrite.fingerprint, rollup.name)] = verified
+        self._count("verified" if verified else "mismatches")
+        return verified
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["refresh_ms"] = round(stats["refresh_ms"], 3)
+        stats["hit_ratio"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        try:
+            stats["tables"] = {
+                name: rows for name, rows in self._connection().execute("SELECT name, rows FROM rollup_meta")
+            }
+        except sqlite3.Error:
+            stats["tables"] = {}
+        return stats
+
+
+_store_lock = threading.Lock()
+_store = None
+
+
+def get_rollup_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RollupStore()
+    return _store
+
+
+def get_rollup_stats():
+    return get_rollup_store().stats()
@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 from .connection import get_connection
 
 TABLE_RELATIONSHIPS = """
@@ -16,8 +18,18 @@ Table Relationships:
 """
 
 
-def get_table_names():
+@contextmanager
+def _use_connection(conn=None):
+    # Reuse the caller's connection so a full schema walk costs one open
+    if conn is not None:
+        yield conn
+        return
     with get_connection() as conn:
+        yield conn
+
+
+def get_table_names(conn=None):
+    with _use_connection(conn) as conn:
         cursor = conn.execute(
             "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"
         )
@@ -25,8 +37,8 @@ def get_table_names():
                 if not row[0].startswith('sqlite_')]
 
 
-def get_table_schema(table_name):
-    with get_connection() as conn:
+def get_table_schema(table_name, conn=None):
+    with _use_connection(conn) as conn:
         cursor = conn.execute(f"PRAGMA table_info({table_name})")
         columns = []
         for row in cursor.fetchall():
@@ -39,17 +51,15 @@ def get_table_schema(table_name):
         return columns
 
 
-def get_sample_data(table_name, limit=3):
-    with get_connection() as conn:
+def get_sample_data(table_name, limit=3, conn=None):
+    with _use_connection(conn) as conn:
         cursor = conn.execute(f"SELECT * FROM {table_name} LIMIT {limit}")
         columns = [description[0] for description in cursor.description]
         rows = cursor.fetchall()
         return [dict(zip(columns, row)) for row in rows]
 
 
-def format_table_schema(table_name):
-    columns = get_table_schema(table_name)
-
+def format_columns_and_samples(table_name, columns, samples):
     lines = [f"Table: {table_name}"]
     lines.append("Columns:")
 
@@ -58,31 +68,49 @@ def format_table_schema(table_name):
         null_marker = " NOT NULL" if col["not_null"] else ""
         lines.append(f"  - {col['name']}: {col['type']}{pk_marker}{null_marker}")
 
+    if samples:
+        lines.append("Sample data:")
+        for sample in samples:
+            sample_str = ", ".join(f"{k}={repr(v)}" for k, v in list(sample.items())[:4])
+            if len(sample) > 4:
+                sample_str += ", ..."
+            lines.append(f"  {sample_str}")
+
+    return "\n".join(lines)
+
+
+def format_table_schema(table_name, conn=None):
+    columns = get_table_schema(table_name, conn)
+
     try:
-        samples = get_sample_data(table_name, limit=2)
-        if samples:
-            lines.append("Sample data:")
-            for sample in samples:
-                sample_str = ", ".join(f"{k}={repr(v)}" for k, v in list(sample.items())[:4])
-                if len(sample) > 4:
-                    sample_str += ", ..."
-                lines.append(f"  {sample_str}")
+        samples = get_sample_data(table_name, limit=2, conn=conn)
     except Exception:
-        pass
+        samples = []
 
-    return "\n".join(lines)
+    return format_columns_and_samples(table_name, columns, samples)
 
 
-def get_schema_for_llm():
-    tables = get_table_names()
+def get_foreign_keys(table_name, conn=None):
+    with _use_connection(conn) as conn:
+        cursor = conn.execute(f"PRAGMA foreign_key_list({table_name})")
+        return [{"column": row[3], "ref_table": row[2], "ref_column": row[4]}
+                for row in cursor.fetchall()]
 
+
+def format_schema_text(table_blocks, relationships=TABLE_RELATIONSHIPS):
     schema_parts = ["# Chinook Database Schema\n"]
     schema_parts.append("This is a digital music store database with the following tables:\n")
 
-    for table in tables:
-        schema_parts.append(format_table_schema(table))
+    for block in table_blocks:
+        schema_parts.append(block)
         schema_parts.append("")
 
-    schema_parts.append(TABLE_RELATIONSHIPS)
+    schema_parts.append(relationships)
 
     return "\n".join(schema_parts)
+
+
+def build_schema_for_llm(conn=None):
+    with _use_connection(conn) as conn:
+        tables = get_table_names(conn)
+        return format_schema_text(format_table_schema(table, conn) for table in tables)
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+
+from utils.tracing import span
+from .connection import get_connection, get_database_version
+from .schema import (
+    format_columns_and_samples, format_schema_text,
+    get_foreign_keys, get_sample_data, get_table_names, get_table_schema
+)
+
+
+@dataclass(frozen=True)
+class SchemaSnapshot:
+    version: tuple
+    text: str
+    columns: dict
+    samples: dict
+    foreign_keys: dict
+    blocks: dict
+    fingerprint: str
+    built_at: float = field(default_factory=time.time)
+
+
+_lock = threading.Lock()
+_snapshot = None
+_stats = {"hits": 0, "misses": 0, "builds": 0, "last_build_ms": 0.0}
+
+
+def _fingerprint(columns):
+    payload = json.dumps(columns, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def build_schema_snapshot(version=None):
+    version = version or get_database_version()
+    columns = {}
+    samples = {}
+    foreign_keys = {}
+    blocks = {}
+
+    with get_connection() as conn:
+        for table in get_table_names(conn):
+            columns[table] = get_table_schema(table, conn)
+            try:
+                samples[table] = get_sample_data(table, limit=2, conn=conn)
+            except Exception:
+                samples[table] = []
+            foreign_keys[table] = get_foreign_keys(table, conn)
+            blocks[table] = format_columns_and_samples(table, columns[table], samples[table])
+
+    return SchemaSnapshot(
+        version=version,
+        text=format_schema_text(blocks.values()),
+        columns=columns,
+        samples=samples,
+        foreign_keys=foreign_keys,
+        blocks=blocks,
+        fingerprint=_fingerprint(columns)
+    )
+
+
+def get_schema_snapshot():
+    global _snapshot
+
+    version = get_database_version()
+    with _lock:
+        if _snapshot is not None and _snapshot.version == version:
+            _stats["hits"] += 1
+            return _snapshot
+
+        _stats["misses"] += 1
+        start = time.perf_counter()
+        with span("db.schema_snapshot"):
+            _snapshot = build_schema_snapshot(version)
+        _stats["builds"] += 1
+        _stats["last_build_ms"] = (time.perf_counter() - start) * 1000
+        return _snapshot
+
+
+def invalidate_schema_snapshot():
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+def get_schema_cache_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["cached"] = _snapshot is not None
+        stats["fingerprint"] = _snapshot.fingerprint if _snapshot else None
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+def get_schema_for_llm():
+    return get_schema_snapshot().text
@@ -0,0 +1,91 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import config
+from utils import fingerprint_sql
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    fingerprint TEXT PRIMARY KEY,
+    sql TEXT NOT NULL,
+    executions INTEGER NOT NULL,
+    total_ms REAL NOT NULL,
+    max_ms REAL NOT NULL,
+    rows INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+"""
+
+
+class WorkloadLog:
+    # Executed SQL grouped by fingerprint (literals stripped), keeping the
+    # latest concrete statement so the workload can be replayed later.
+
+    def __init__(self, path=None):
+        self.path = Path(path or config.WORKLOAD_LOG_PATH)
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, sql, duration_ms, rows):
+        now = time.time()
+        try:
+            self._connection().execute(
+                "INSERT INTO queries "
+                "(fingerprint, sql, executions, total_ms, max_ms, rows, first_seen, last_seen) "
+                "VALUES (?, ?, 1, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (fingerprint) DO UPDATE SET "
+                "sql = excluded.sql, executions = executions + 1, "
+                "total_ms = total_ms + excluded.total_ms, "
+                "max_ms = MAX(max_ms, excluded.max_ms), "
+                "rows = excluded.rows, last_seen = excluded.last_seen",
+                (fingerprint_sql(sql), sql, duration_ms, duration_ms, rows, now, now)
+            )
+        except sqlite3.Error:
+            pass
+
+    def top(self, limit=50):
+        # Heaviest first: total time spent is what an index can win back
+        cursor = self._connection().execute(
+            "SELECT fingerprint, sql, executions, total_ms, max_ms, rows "
+            "FROM queries ORDER BY total_ms DESC LIMIT ?", (limit,)
+        )
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def clear(self):
+        self._connection().execute("DELETE FROM queries")
+
+    def stats(self):
+        try:
+            row = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(executions), 0), COALESCE(SUM(total_ms), 0) FROM queries"
+            ).fetchone()
+        except sqlite3.Error:
+            return {"fingerprints": None, "executions": None, "total_ms": None}
+        return {"fingerprints": row[0], "executions": row[1], "total_ms": round(row[2], 3)}
+
+
+_log_lock = threading.Lock()
+_log = None
+
+
+def get_workload_log():
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = WorkloadLog()
+    return _log
@@ -0,0 +1,253 @@
+"""Per-session query history with result frames spilled to disk."""
+
+import io
+import json
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from contextlib import closing
+from pathlib import Path
+
+import pandas as pd
+
+import config
+from database.result_cache import frame_size_bytes
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    entry_id TEXT PRIMARY KEY,
+    format TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    attrs TEXT NOT NULL
+);
+"""
+
+# Everything in a result except the frame and the figure, which are rebuilt on reopen
+_METADATA_KEYS = ("question", "sql", "explanation", "error", "success", "viz_config",
+                  "usage", "timings", "plan", "trace")
+
+
+def _encode_frame(df):
+    # Parquet where pyarrow can represent the frame; pickle for the rest
+    # (pyarrow missing, duplicate column names, mixed-type object columns)
+    buffer = io.BytesIO()
+    try:
+        df.to_parquet(buffer, index=False)
+        return "parquet", buffer.getvalue()
+    except (ImportError, ValueError, TypeError, NotImplementedError):
+        return "pickle", pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _decode_frame(fmt, payload):
+    if fmt == "parquet":
+        return pd.read_parquet(io.BytesIO(payload))
+    return pickle.loads(payload)
+
+
+class HistorySpill:
+    # Result frames of every session's history. Each frame is written to its
+    # session's spill file when recorded; the most recently used ones also
+    # stay in memory under one process-wide byte budget, so evicting a frame
+    # only drops the reference.
+
+    def __init__(self, max_bytes=None, directory=None):
+        self.max_bytes = max_bytes or config.HISTORY_MEMORY_BUDGET_BYTES
+        self.directory = Path(directory or config.HISTORY_SPILL_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._rehydrations = 0
+        self._spilled = 0
+        self._evictions = 0
+        self._remove_stale_files()
+
+    def _remove_stale_files(self):
+        # Spill files of sessions from a previous server process
+        cutoff = time.time() - config.HISTORY_SPILL_MAX_AGE_SECONDS
+        for path in self.directory.glob("*.db"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+    def _path(self, session_id):
+        return self.directory / f"{session_id}.db"
+
+    def _connect(self, session_id):
+        conn = sqlite3.connect(str(self._path(session_id)), timeout=5, isolation_level=None)
+        conn.executescript(_SCHEMA)
+        return closing(conn)
+
+    def _remember(self, key, df, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._frames[key] = (df, size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._frames:
+                _, (_, evicted) = self._frames.popitem(last=False)
+                self._bytes -= evicted
+                self._evictions += 1
+
+    def put(self, session_id, entry_id, df):
+        fmt, payload = _encode_frame(df)
+        attrs = json.dumps(df.attrs, default=str)
+        with self._connect(session_id) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO frames (entry_id, format, payload, attrs) VALUES (?, ?, ?, ?)",
+                (entry_id, fmt, payload, attrs)
+            )
+        with self._lock:
+            self._spilled += 1
+        self._remember((session_id, entry_id), df, frame_size_bytes(df))
+
+    def get(self, session_id, entry_id):
+        key = (session_id, entry_id)
+        with self._lock:
+            cached = self._frames.get(key)
+            if cached is not None:
+                self._frames.move_to_end(key)
+                self._hits += 1
+                return cached[0].copy()
+
+        try:
+            with self._connect(session_id) as conn:
+                row = conn.execute(
+                    "SELECT format, payload, attrs FROM frames WHERE entry_id = ?", (entry_id,)
+                ).fetchone()
+        except sqlite3.Error:
+            row = None
+        if row is None:
+            return None
+
+        df = _decode_frame(row[0], row[1])
+        df.attrs.update(json.loads(row[2]))
+        with self._lock:
+            self._rehydrations += 1
+        self._remember(key, df, frame_size_bytes(df))
+        return df.copy()
+
+    def discard(self, session_id, entry_id):
+        with self._lock:
+            old = self._frames.pop((session_id, entry_id), None)
+            if old is not None:
+                self._bytes -= old[1]
+        try:
+            with self._connect(session_id) as conn:
+                conn.execute("DELETE FROM frames WHERE entry_id = ?", (entry_id,))
+        except sqlite3.Error:
+            pass
+
+    def drop_session(self, session_id):
+        with self._lock:
+            for key in [key for key in self._frames if key[0] == session_id]:
+                self._bytes -= self._frames.pop(key)[1]
+        try:
+            self._path(session_id).unlink()
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._rehydrations
+            return {
+                "frames_in_memory": len(self._frames),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "sessions": len({key[0] for key in self._frames}),
+                "spilled": self._spilled,
+                "hits": self._hits,
+                "rehydrations": self._rehydrations,
+                "evictions": self._evictions,
+                "hit_ratio": self._hits / lookups if lookups else 0.0
+            }
+
+
+class QueryHistory:
+    # One session's history: metadata entries live in session state, frames
+    # go to the shared HistorySpill. The spill file is removed when the
+    # session state (and with it this object) is garbage collected.
+
+    def __init__(self, spill=None, max_entries=None):
+        self.session_id = uuid.uuid4().hex
+        self.spill = spill or get_history_spill()
+        self.max_entries = max_entries or config.HISTORY_MAX_ENTRIES
+        self.entries = []
+        weakref.finalize(self, self.spill.drop_session, self.session_id)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, result):
+        entry = {key: result.get(key) for key in _METADATA_KEYS}
+        entry["id"] = uuid.uuid4().hex
+        entry["recorded_at"] = time.time()
+
+        df = result.get("data")
+        entry["rows"] = None if df is None else len(df)
+        entry["columns"] = None if df is None else len(df.columns)
+        if df is not None:
+            self.spill.put(self.session_id, entry["id"], df)
+
+        self.entries.append(entry)
+        while len(self.entries) > self.max_entries:
+            self.spill.discard(self.session_id, self.entries.pop(0)["id"])
+        return entry
+
+    def recent(self, n):
+        return self.entries[-n:]
+
+    def reopen(self, entry_id):
+        # Rebuilds a pipeline result for the entry, reading its frame back
+        # from memory or the spill file; None when the frame is gone
+        entry = next((e for e in self.entries if e["id"] == entry_id), None)
+        if entry is None:
+            return None
+
+        result = {key: entry[key] for key in _METADATA_KEYS}
+        result["data"] = None
+        result["chart"] = None
+        if entry["rows"] is not None:
+            df = self.spill.get(self.session_id, entry_id)
+            if df is None:
+                return None
+            result["data"] = df
+            viz_config = entry["viz_config"] or {}
+            if viz_config.get("needed") and not df.empty:
+                from visualization import create_chart
+                # As in pipeline.resolve_chart: a chart that cannot be built
+                # leaves the table on its own rather than failing the reopen
+                try:
+                    result["chart"] = create_chart(df, viz_config)
+                except Exception as e:
+                    result["chart_error"] = str(e)
+        return result
+
+
+_spill_lock = threading.Lock()
+_spill = None
+
+
+def get_history_spill():
+    global _spill
+    if _spill is None:
+        with _spill_lock:
+            if _spill is None:
+                _spill = HistorySpill()
+    return _spill
+
+
+def get_history_stats():
+    return get_history_spill().stats()
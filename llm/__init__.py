@@ -1,7 +1,17 @@
 """LLM module for natural language to SQL conversion."""
 
-from .client import generate_sql_response
+from .client import (
+    agenerate_sql_response, astream_sql_response, forget_sql_response,
+    generate_sql_response, get_llm_usage_stats, register_provider,
+    remember_sql_response, stream_sql_response
+)
 from .parser import parse_llm_response
 from .prompts import get_system_prompt
+from .registry import aclose_clients, close_clients
 
-__all__ = ["generate_sql_response", "parse_llm_response", "get_system_prompt"]
+__all__ = [
+    "generate_sql_response", "stream_sql_response", "get_llm_usage_stats",
+    "agenerate_sql_response", "astream_sql_response", "register_provider",
+    "remember_sql_response", "forget_sql_response", "aclose_clients", "close_clients",
+    "parse_llm_response", "get_system_prompt"
+]
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    schema_fingerprint TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access);
+"""
+
+
+def normalize_question(question):
+    # Only case, whitespace and closing sentence punctuation are folded:
+    # operators, signs and decimal points change the answer ("> 5" vs "< 5")
+    folded = " ".join(question.casefold().split())
+    return re.sub(r"[\s.?!]+$", "", folded)
+
+
+def make_cache_key(question, provider, model, prompt_hash, schema_fingerprint):
+    payload = json.dumps(
+        [normalize_question(question), provider, model, prompt_hash, schema_fingerprint],
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=None, ttl_seconds=None, max_entries=None):
+        self.path = Path(path or config.RESPONSE_CACHE_PATH)
+        self.ttl_seconds = ttl_seconds or config.RESPONSE_CACHE_TTL_SECONDS
+        self.max_entries = max_entries or config.RESPONSE_CACHE_MAX_ENTRIES
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        # One connection per thread; WAL lets Streamlit sessions and separate
+        # processes read and write the same file concurrently.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    def get(self, key):
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._count(False)
+                return None
+            if now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._count(False)
+                return None
+            conn.execute(
+                "UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+        except sqlite3.Error:
+            self._count(False)
+            return None
+
+        self._count(True)
+        return json.loads(row[0])
+
+    def put(self, key, question, provider, model, schema_fingerprint, response):
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, question, provider, model, schema_fingerprint, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, question, provider, model, schema_fingerprint,
+                 json.dumps(response), now, now)
+            )
+            self._evict(conn, now)
+        except sqlite3.Error:
+            pass
+
+    def delete(self, key):
+        try:
+            self._connection().execute("DELETE FROM responses WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM responses")
+
+    def stats(self):
+        try:
+            entries = self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / lookups if lookups else 0.0
+            }
+
+
+_cache_lock = threading.Lock()
+_cache = None
+
+
+def get_response_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
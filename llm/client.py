@@ -1,61 +1,400 @@
+import asyncio
+import threading
+import time
+
 import config
-from database.schema import get_schema_for_llm
-from .parser import parse_llm_response
-from .prompts import get_system_prompt
+from database.retriever import retrieve_schema
+from database.snapshot import get_schema_snapshot
+from utils.tracing import bind_context, span
+from .cache import get_response_cache, make_cache_key
+from .parser import IncrementalResponseParser, parse_llm_response
+from .prompts import get_prompt_template_hash, get_system_prompt_blocks
+from .registry import get_async_client, get_client
 
+_usage_lock = threading.Lock()
+_usage_totals = {}
 
-def _call_anthropic(user_question, system_prompt):
-    from anthropic import Anthropic
 
+def _anthropic_client(asynchronous=False):
     if not config.ANTHROPIC_API_KEY:
         raise ValueError("ANTHROPIC_API_KEY not configured")
+    factory = get_async_client if asynchronous else get_client
+    return factory("anthropic", config.ANTHROPIC_API_KEY, config.ANTHROPIC_BASE_URL)
+
+
+def _openai_client(asynchronous=False):
+    if not config.OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY not configured")
+    factory = get_async_client if asynchronous else get_client
+    return factory("openai", config.OPENAI_API_KEY, config.OPENAI_BASE_URL)
+
 
-    client = Anthropic(api_key=config.ANTHROPIC_API_KEY)
+def _anthropic_params(user_question, system_blocks):
+    # Breakpoints after the static examples and after the schema block: the
+    # first is shared by every question, the second by repeated table sets.
+    system = [{"type": "text", "text": block} for block in system_blocks]
+    for block in system[1:]:
+        block["cache_control"] = {"type": "ephemeral"}
 
-    response = client.messages.create(
+    return dict(
         model=config.ANTHROPIC_MODEL,
         max_tokens=config.LLM_MAX_TOKENS,
         temperature=config.LLM_TEMPERATURE,
-        system=system_prompt,
+        system=system,
         messages=[{"role": "user", "content": user_question}]
     )
 
-    return response.content[0].text
-
-
-def _call_openai(user_question, system_prompt):
-    from openai import OpenAI
-
-    if not config.OPENAI_API_KEY:
-        raise ValueError("OPENAI_API_KEY not configured")
-
-    client = OpenAI(api_key=config.OPENAI_API_KEY)
 
-    response = client.chat.completions.create(
+def _openai_params(user_question, system_blocks):
+    # OpenAI caches the longest byte-identical prefix automatically, so the
+    # static blocks must come first and never vary between requests.
+    return dict(
         model=config.OPENAI_MODEL,
         max_tokens=config.LLM_MAX_TOKENS,
         temperature=config.LLM_TEMPERATURE,
         messages=[
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": "\n\n".join(system_blocks)},
             {"role": "user", "content": user_question}
         ],
         response_format={"type": "json_object"}
     )
 
+
+def _anthropic_usage(usage):
+    return {
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        "cache_read_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+        "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0
+    }
+
+
+def _openai_usage(usage):
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "input_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cache_read_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "cache_write_tokens": 0
+    }
+
+
+def _record_usage(provider, usage):
+    with _usage_lock:
+        totals = _usage_totals.setdefault(provider, {"requests": 0})
+        totals["requests"] += 1
+        for name, value in usage.items():
+            totals[name] = totals.get(name, 0) + value
+
+
+def get_llm_usage_stats():
+    with _usage_lock:
+        return {provider: dict(totals) for provider, totals in _usage_totals.items()}
+
+
+def _call_anthropic(user_question, system_blocks, usage=None):
+    response = _anthropic_client().messages.create(**_anthropic_params(user_question, system_blocks))
+    if usage is not None:
+        usage.update(_anthropic_usage(response.usage))
+    return response.content[0].text
+
+
+def _call_openai(user_question, system_blocks, usage=None):
+    response = _openai_client().chat.completions.create(**_openai_params(user_question, system_blocks))
+    if usage is not None:
+        usage.update(_openai_usage(response.usage))
+    return response.choices[0].message.content
+
+
+def _stream_anthropic(user_question, system_blocks, usage=None):
+    params = _anthropic_params(user_question, system_blocks)
+    with _anthropic_client().messages.stream(**params) as stream:
+        for text in stream.text_stream:
+            yield text
+        if usage is not None:
+            usage.update(_anthropic_usage(stream.get_final_message().usage))
+
+
+def _stream_openai(user_question, system_blocks, usage=None):
+    stream = _openai_client().chat.completions.create(
+        stream=True, stream_options={"include_usage": True},
+        **_openai_params(user_question, system_blocks)
+    )
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if usage is not None and getattr(chunk, "usage", None):
+                usage.update(_openai_usage(chunk.usage))
+    finally:
+        stream.close()
+
+
+async def _acall_anthropic(user_question, system_blocks, usage=None):
+    client = _anthropic_client(asynchronous=True)
+    response = await client.messages.create(**_anthropic_params(user_question, system_blocks))
+    if usage is not None:
+        usage.update(_anthropic_usage(response.usage))
+    return response.content[0].text
+
+
+async def _acall_openai(user_question, system_blocks, usage=None):
+    client = _openai_client(asynchronous=True)
+    response = await client.chat.completions.create(**_openai_params(user_question, system_blocks))
+    if usage is not None:
+        usage.update(_openai_usage(response.usage))
     return response.choices[0].message.content
 
 
-def generate_sql_response(user_question, provider=None):
-    provider = provider or config.LLM_PROVIDER
+async def _astream_anthropic(user_question, system_blocks, usage=None):
+    client = _anthropic_client(asynchronous=True)
+    async with client.messages.stream(**_anthropic_params(user_question, system_blocks)) as stream:
+        async for text in stream.text_stream:
+            yield text
+        if usage is not None:
+            usage.update(_anthropic_usage((await stream.get_final_message()).usage))
+
+
+async def _astream_openai(user_question, system_blocks, usage=None):
+    client = _openai_client(asynchronous=True)
+    stream = await client.chat.completions.create(
+        stream=True, stream_options={"include_usage": True},
+        **_openai_params(user_question, system_blocks)
+    )
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if usage is not None and getattr(chunk, "usage", None):
+                usage.update(_openai_usage(chunk.usage))
+    finally:
+        await stream.close()
+
+
+_PROVIDERS = {
+    "anthropic": {
+        "model": lambda: config.ANTHROPIC_MODEL,
+        "call": _call_anthropic, "stream": _stream_anthropic,
+        "acall": _acall_anthropic, "astream": _astream_anthropic
+    },
+    "openai": {
+        "model": lambda: config.OPENAI_MODEL,
+        "call": _call_openai, "stream": _stream_openai,
+        "acall": _acall_openai, "astream": _astream_openai
+    }
+}
+
+
+def register_provider(name, complete, model=None):
+    # Plug in a backend such as the offline fake used by the benchmarks.
+    # complete(user_question, system_blocks) must return the raw response text.
+    def call(user_question, system_blocks, usage=None):
+        return complete(user_question, system_blocks)
+
+    def stream(user_question, system_blocks, usage=None):
+        yield complete(user_question, system_blocks)
 
-    schema = get_schema_for_llm()
-    system_prompt = get_system_prompt(schema)
+    async def acall(user_question, system_blocks, usage=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, complete, user_question, system_blocks)
 
-    if provider == "anthropic":
-        response_text = _call_anthropic(user_question, system_prompt)
-    elif provider == "openai":
-        response_text = _call_openai(user_question, system_prompt)
-    else:
-        raise ValueError(f"Unknown LLM provider: {provider}")
+    async def astream(user_question, system_blocks, usage=None):
+        yield await acall(user_question, system_blocks)
 
-    return parse_llm_response(response_text)
+    _PROVIDERS[name] = {
+        "model": lambda: model or name,
+        "call": call, "stream": stream, "acall": acall, "astream": astream
+    }
+
+
+def _provider(name):
+    try:
+        return _PROVIDERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown LLM provider: {name}")
+
+
+class _Request:
+    def __init__(self, user_question, provider, use_cache):
+        self.user_question = user_question
+        self.provider = provider or config.LLM_PROVIDER
+        self.backend = _provider(self.provider)
+        self.model = self.backend["model"]()
+        self.snapshot = get_schema_snapshot()
+        self.retrieval = None
+
+        self.cache = get_response_cache() if use_cache and config.RESPONSE_CACHE_ENABLED else None
+        self.cache_key = None
+        if self.cache:
+            prompt_hash = get_prompt_template_hash()
+            if config.SCHEMA_PRUNING_ENABLED:
+                prompt_hash += ":pruned"
+            self.cache_key = make_cache_key(
+                user_question, self.provider, self.model, prompt_hash, self.snapshot.fingerprint
+            )
+
+    def cached(self):
+        if not self.cache:
+            return None
+        with span("llm.cache_lookup") as current:
+            cached = self.cache.get(self.cache_key)
+            current.set(hit=cached is not None)
+        return None if cached is None else {**cached, "cached": True}
+
+    def system_blocks(self):
+        with span("llm.schema", pruned=config.SCHEMA_PRUNING_ENABLED) as current:
+            if not config.SCHEMA_PRUNING_ENABLED:
+                return get_system_prompt_blocks(self.snapshot.text)
+            self.retrieval = retrieve_schema(self.user_question, self.snapshot)
+            current.set(tables=len(self.retrieval.tables), schema_tokens=self.retrieval.tokens,
+                        saved_tokens=self.retrieval.saved_tokens)
+            return get_system_prompt_blocks(self.retrieval.text)
+
+    def request_span(self):
+        return span("llm.request", provider=self.provider, model=self.model)
+
+    def store(self, parsed):
+        if self.cache:
+            self.cache.put(self.cache_key, self.user_question, self.provider,
+                           self.model, self.snapshot.fingerprint, parsed)
+
+    def forget(self):
+        if self.cache:
+            self.cache.delete(self.cache_key)
+
+    def finish(self, parsed, usage):
+        # Not cached here: see remember_sql_response
+        if usage:
+            _record_usage(self.provider, usage)
+        return {**parsed, "usage": usage or None}
+
+
+def remember_sql_response(user_question, response, provider=None):
+    # Responses are only cached once their SQL has validated and executed,
+    # so a broken or rejected answer is never replayed for the question
+    if response.get("cached"):
+        return
+    parsed = {k: v for k, v in response.items() if k not in ("usage", "cached")}
+    _Request(user_question, provider, use_cache=True).store(parsed)
+
+
+def forget_sql_response(user_question, provider=None):
+    # Evicts a cached response whose SQL failed (e.g. after a data change)
+    _Request(user_question, provider, use_cache=True).forget()
+
+
+def _parse(response_text):
+    with span("llm.parse"):
+        return parse_llm_response(response_text)
+
+
+def _stream_events(parser, completed, state):
+    # Shared by the sync and async streams: turns one parsed chunk into
+    # sql_delta / sql events, emitting the complete sql exactly once.
+    if state["sql_sent"]:
+        return []
+    if "sql" in completed:
+        state["sql_sent"] = True
+        state["request_span"].set(sql_ready_ms=round(
+            (time.perf_counter() - state["request_span"].start) * 1000, 3
+        ))
+        return [{"type": "sql", "sql": parser.fields["sql"]}]
+    partial = parser.partial_value("sql")
+    return [{"type": "sql_delta", "sql": partial}] if partial else []
+
+
+def _stream_finish(request, parser, usage, state):
+    parsed = _parse(parser.text)
+    events = [] if state["sql_sent"] else [{"type": "sql", "sql": parsed["sql"]}]
+    events.append({"type": "done", "response": request.finish(parsed, usage)})
+    return events
+
+
+def generate_sql_response(user_question, provider=None, use_cache=True):
+    request = _Request(user_question, provider, use_cache)
+
+    cached = request.cached()
+    if cached is not None:
+        return cached
+
+    usage = {}
+    system_blocks = request.system_blocks()
+    with request.request_span() as current:
+        response_text = request.backend["call"](user_question, system_blocks, usage)
+        current.set(**usage)
+
+    return request.finish(_parse(response_text), usage)
+
+
+def stream_sql_response(user_question, provider=None, use_cache=True):
+    # Yields {"type": "sql_delta"} while the sql field is being generated,
+    # one {"type": "sql"} as soon as it is complete (before the explanation
+    # has streamed), then {"type": "done"} with the fully parsed response.
+    request = _Request(user_question, provider, use_cache)
+
+    cached = request.cached()
+    if cached is not None:
+        yield {"type": "sql", "sql": cached["sql"]}
+        yield {"type": "done", "response": cached}
+        return
+
+    usage = {}
+    system_blocks = request.system_blocks()
+
+    parser = IncrementalResponseParser()
+    with request.request_span() as current:
+        state = {"sql_sent": False, "request_span": current}
+        for chunk in request.backend["stream"](user_question, system_blocks, usage):
+            yield from _stream_events(parser, parser.feed(chunk), state)
+        current.set(**usage)
+    yield from _stream_finish(request, parser, usage, state)
+
+
+async def _aprepare(user_question, provider, use_cache):
+    # Snapshot, cache lookup and schema retrieval all touch SQLite; keep
+    # them off the event loop.
+    def prepare():
+        request = _Request(user_question, provider, use_cache)
+        cached = request.cached()
+        return request, cached, (None if cached is not None else request.system_blocks())
+
+    return await asyncio.get_running_loop().run_in_executor(None, bind_context(prepare))
+
+
+async def agenerate_sql_response(user_question, provider=None, use_cache=True):
+    request, cached, system_blocks = await _aprepare(user_question, provider, use_cache)
+    if cached is not None:
+        return cached
+
+    usage = {}
+    with request.request_span() as current:
+        response_text = await request.backend["acall"](user_question, system_blocks, usage)
+        current.set(**usage)
+
+    parsed = _parse(response_text)
+    return await asyncio.get_running_loop().run_in_executor(
+        None, bind_context(request.finish, parsed, usage)
+    )
+
+
+async def astream_sql_response(user_question, provider=None, use_cache=True):
+    request, cached, system_blocks = await _aprepare(user_question, provider, use_cache)
+    if cached is not None:
+        yield {"type": "sql", "sql": cached["sql"]}
+        yield {"type": "done", "response": cached}
+        return
+
+    usage = {}
+    parser = IncrementalResponseParser()
+    with request.request_span() as current:
+        state = {"sql_sent": False, "request_span": current}
+        async for chunk in request.backend["astream"](user_question, system_blocks, usage):
+            for event in _stream_events(parser, parser.feed(chunk), state):
+                yield event
+        current.set(**usage)
+
+    events = await asyncio.get_running_loop().run_in_executor(
+        None, bind_context(_stream_finish, request, parser, usage, state)
+    )
+    for event in events:
+        yield event
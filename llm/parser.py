@@ -1,6 +1,8 @@
 import json
 import re
 
+from utils.sql_lexer import additive_columns
+
 
 def extract_json_from_response(text):
     # Try to find JSON in code blocks first
@@ -59,6 +61,10 @@ def parse_llm_response(response_text):
             "y_column": viz.get("y_column"),
             "title": viz.get("title")
         }
+        # Whether the y column is a SUM/COUNT, so charts may total the
+        # categories they leave out into "Other"
+        y_column = visualization["y_column"]
+        visualization["additive"] = bool(y_column) and str(y_column).casefold() in additive_columns(parsed["sql"])
 
         return {
             "sql": parsed["sql"],
@@ -82,3 +88,90 @@ def parse_llm_response(response_text):
         }
 
     raise ValueError(f"Could not parse LLM response: {response_text[:500]}...")
+
+
+class IncrementalResponseParser:
+    # Tracks just enough JSON structure (nesting depth, string state and the
+    # current top-level key) to notice when a top-level string field such as
+    # "sql" is complete while the rest of the object is still streaming.
+
+    def __init__(self):
+        self.fields = {}
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._key = None
+        self._expect_value = False
+
+    @property
+    def text(self):
+        return self._buffer
+
+    def feed(self, chunk):
+        completed = []
+        self._buffer += chunk
+        buffer = self._buffer
+
+        for i in range(self._pos, len(buffer)):
+            ch = buffer[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        name = self._close_string(buffer[self._string_start:i + 1])
+                        if name:
+                            completed.append(name)
+            elif self._depth == 0:
+                # Skip code fences or prose before the JSON object starts
+                if ch == "{":
+                    self._depth = 1
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if self._depth == 1:
+                    self._expect_value = False
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+            elif self._depth == 1 and ch == ":":
+                self._expect_value = True
+            elif self._depth == 1 and ch == ",":
+                self._expect_value = False
+
+        self._pos = len(buffer)
+        return completed
+
+    def _close_string(self, literal):
+        try:
+            value = json.loads(literal)
+        except json.JSONDecodeError:
+            value = literal[1:-1]
+
+        if not self._expect_value:
+            self._key = value
+            return None
+
+        self._expect_value = False
+        self.fields[self._key] = value
+        return self._key
+
+    def partial_value(self, name):
+        if not (self._in_string and self._depth == 1 and self._expect_value and self._key == name):
+            return None
+
+        raw = self._buffer[self._string_start + 1:]
+        if raw.endswith("\\") and not raw.endswith("\\\\"):
+            raw = raw[:-1]
+        try:
+            return json.loads(f'"{raw}"')
+        except json.JSONDecodeError:
+            return raw
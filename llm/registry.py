@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import weakref
+
+import config
+
+_lock = threading.Lock()
+_clients = {}
+# Event loop -> {(provider, key, endpoint): async client}. Weakly keyed, so
+# the clients of a loop that has been discarded (e.g. one asyncio.run per
+# batch) go with it instead of accumulating.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+# httpx, like the provider SDKs below, is imported when the first client is
+# built so that starting the app does not pay for it
+
+
+def _timeout():
+    import httpx
+
+    return httpx.Timeout(config.LLM_TIMEOUT_SECONDS, connect=config.LLM_CONNECT_TIMEOUT_SECONDS)
+
+
+def _limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=config.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY_SECONDS
+    )
+
+
+def _http_client(asynchronous=False):
+    import httpx
+
+    client_cls = httpx.AsyncClient if asynchronous else httpx.Client
+    return client_cls(limits=_limits(), timeout=_timeout(), follow_redirects=True)
+
+
+def _build_client(provider, api_key, base_url, asynchronous=False):
+    if provider == "anthropic":
+        from anthropic import Anthropic, AsyncAnthropic
+        client_cls = AsyncAnthropic if asynchronous else Anthropic
+    elif provider == "openai":
+        from openai import AsyncOpenAI, OpenAI
+        client_cls = AsyncOpenAI if asynchronous else OpenAI
+    else:
+        raise ValueError(f"Unknown LLM provider: {provider}")
+
+    return client_cls(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=_timeout(),
+        max_retries=config.LLM_MAX_RETRIES,
+        http_client=_http_client(asynchronous)
+    )
+
+
+def _get_or_build(clients, key, build):
+    client = clients.get(key)
+    if client is None:
+        with _lock:
+            client = clients.get(key)
+            if client is None:
+                client = build()
+                clients[key] = client
+    return client
+
+
+def get_client(provider, api_key, base_url=None):
+    # SDK clients wrap a thread-safe httpx.Client, so one instance per
+    # (provider, key, endpoint) is shared by every session and keeps its
+    # TLS connections alive between questions.
+    return _get_or_build(
+        _clients, (provider, api_key, base_url),
+        lambda: _build_client(provider, api_key, base_url)
+    )
+
+
+def get_async_client(provider, api_key, base_url=None):
+    # httpx.AsyncClient connections belong to the event loop that opened
+    # them, so async clients are additionally keyed on the running loop.
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+    return _get_or_build(
+        clients, (provider, api_key, base_url),
+        lambda: _build_client(provider, api_key, base_url, asynchronous=True)
+    )
+
+
+async def _close_all(clients):
+    for client in clients:
+        await client.close()
+
+
+async def aclose_clients():
+    # Closes the running loop's async clients; await it before the loop stops
+    with _lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    await _close_all(list(clients.values()))
+
+
+def close_clients():
+    # Closes every sync client and the async clients of loops that can still
+    # run their close: an idle loop runs it here, a loop running on another
+    # thread is handed it. Clients of a closed loop are just dropped.
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        loops = list(_async_clients.items())
+        _async_clients.clear()
+    for client in clients:
+        client.close()
+
+    try:
+        current = asyncio.get_running_loop()
+    except RuntimeError:
+        current = None
+    for loop, async_clients in loops:
+        if loop.is_closed() or not async_clients:
+            continue
+        closing = _close_all(list(async_clients.values()))
+        if loop is current:
+            # Cannot block on our own loop; the closes finish in the background
+            loop.create_task(closing)
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(closing, loop).result(config.LLM_TIMEOUT_SECONDS)
+        else:
+            loop.run_until_complete(closing)
@@ -0,0 +1,259 @@
+"""Async query pipeline shared by the Streamlit app and headless callers."""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from database import aexecute_query, get_connection, get_schema_snapshot, run_in_db_executor
+from database.plan import explain_query
+from llm import (
+    aclose_clients, agenerate_sql_response, astream_sql_response, forget_sql_response,
+    remember_sql_response
+)
+from utils import sanitize_sql, validate_sql
+from utils.tracing import bind_context, span, start_trace
+from visualization import create_chart
+
+_chart_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chart")
+
+
+def new_result(user_question):
+    return {
+        "success": False, "sql": None, "data": None,
+        "chart": None, "explanation": None, "error": None,
+        "question": user_question, "timings": {}
+    }
+
+
+def _warm_database():
+    get_schema_snapshot()
+    with get_connection() as conn:
+        conn.execute("SELECT 1").fetchone()
+
+
+async def _generate(user_question, provider, on_sql_delta):
+    if not config.LLM_STREAMING:
+        return await agenerate_sql_response(user_question, provider=provider), None
+
+    llm_response = None
+    early_sql = None
+    early_query = None
+
+    try:
+        async for event in astream_sql_response(user_question, provider=provider):
+            if event["type"] == "sql_delta" and on_sql_delta:
+                on_sql_delta(event["sql"])
+            elif event["type"] == "sql":
+                early_sql = event["sql"]
+                if on_sql_delta:
+                    on_sql_delta(early_sql)
+                # Start executing while the explanation is still streaming
+                if validate_sql(early_sql)[0]:
+                    early_query = asyncio.ensure_future(_plan_and_execute(sanitize_sql(early_sql)))
+            elif event["type"] == "done":
+                llm_response = event["response"]
+        if llm_response is None:
+            raise ValueError("The LLM response stream ended before the response was complete")
+    except BaseException:
+        # Includes cancellation: the early query must not outlive the request
+        if early_query is not None:
+            early_query.cancel()
+            await asyncio.gather(early_query, return_exceptions=True)
+        raise
+
+    if early_query is not None and llm_response["sql"] != early_sql:
+        early_query.cancel()
+        early_query = None
+
+    return llm_response, early_query
+
+
+async def _plan_and_execute(sql):
+    # The plan is checked first, so a query over the cost threshold never touches the tables
+    plan = await run_in_db_executor(explain_query, sql)
+    if plan.exceeds():
+        return plan, None
+    return plan, await aexecute_query(sql)
+
+
+def _cheaper_question(user_question, sql, plan):
+    return (
+        f"{user_question}\n\n"
+        f"A previous attempt produced this SQL, which was rejected before running because "
+        f"its estimated cost was too high ({plan.summary()}):\n{sql}\n"
+        f"Write a cheaper query that answers the same question: join on key columns, "
+        f"avoid cartesian products and aggregate before joining where possible."
+    )
+
+
+def _apply_response(result, llm_response):
+    result["sql"] = llm_response["sql"]
+    result["explanation"] = llm_response.get("explanation", "")
+    result["usage"] = llm_response.get("usage")
+
+
+def resolve_chart(result):
+    chart_future = result.pop("chart_future", None)
+    if chart_future is not None:
+        try:
+            result["chart"] = chart_future.result()
+        except Exception as e:
+            result["chart"] = None
+            result["chart_error"] = str(e)
+    return result["chart"]
+
+
+async def _settle_response(user_question, provider, llm_response, succeeded):
+    if succeeded:
+        settle = bind_context(remember_sql_response, user_question, llm_response, provider)
+    else:
+        settle = bind_context(forget_sql_response, user_question, provider)
+    await asyncio.get_running_loop().run_in_executor(None, settle)
+
+
+async def _run_stages(result, user_question, provider, on_sql_delta, defer_chart, build_chart):
+    timings = result["timings"]
+    early_query = None
+    llm_response = None
+
+    try:
+        with span("pipeline.generate") as current:
+            llm_response, early_query = await _generate(user_question, provider, on_sql_delta)
+        timings["generate_ms"] = current.duration_ms
+
+        _apply_response(result, llm_response)
+
+        with span("pipeline.validate"):
+            is_valid, error_msg = validate_sql(llm_response["sql"])
+        if not is_valid:
+            result["error"] = f"SQL validation failed: {error_msg}"
+            return
+
+        # With streaming most of the execution overlapped generation; this is the remainder
+        with span("pipeline.execute", overlapped=early_query is not None) as current:
+            if early_query is not None:
+                plan, df = await early_query
+                early_query = None
+            else:
+                plan, df = await _plan_and_execute(sanitize_sql(llm_response["sql"]))
+            current.set(cost=round(plan.estimated_cost), rows=len(df) if df is not None else 0)
+
+        for attempt in range(1, config.PLAN_REGENERATE_ATTEMPTS + 1):
+            if df is not None:
+                break
+            rejected_cost = round(plan.estimated_cost)
+            with span("pipeline.regenerate", attempt=attempt, rejected_cost=rejected_cost) as regen:
+                llm_response = await agenerate_sql_response(
+                    _cheaper_question(user_question, llm_response["sql"], plan), provider=provider
+                )
+            timings["regenerate_ms"] = timings.get("regenerate_ms", 0) + regen.duration_ms
+            _apply_response(result, llm_response)
+
+            is_valid, error_msg = validate_sql(llm_response["sql"])
+            if not is_valid:
+                result["error"] = f"SQL validation failed: {error_msg}"
+                return
+            with span("pipeline.execute", regenerated=True) as current:
+                plan, df = await _plan_and_execute(sanitize_sql(llm_response["sql"]))
+                current.set(cost=round(plan.estimated_cost), rows=len(df) if df is not None else 0)
+
+        result["plan"] = plan
+        if df is None:
+            result["error"] = (
+                f"Query rejected before execution: estimated cost {plan.estimated_cost:,.0f} "
+                f"exceeds the limit of {config.PLAN_COST_THRESHOLD:,.0f} ({plan.summary()})"
+            )
+            return
+        timings["execute_ms"] = current.duration_ms
+        result["data"] = df
+        result["success"] = True
+
+        viz_config = llm_response.get("visualization", {})
+        result["viz_config"] = viz_config
+        if build_chart and viz_config.get("needed"):
+            chart_future = _chart_executor.submit(bind_context(create_chart, df, viz_config))
+            if defer_chart:
+                result["chart_future"] = chart_future
+            else:
+                with span("pipeline.chart") as current:
+                    result["chart"] = await asyncio.wrap_future(chart_future)
+                timings["chart_ms"] = current.duration_ms
+
+    except Exception as e:
+        result["error"] = str(e)
+
+    finally:
+        if early_query is not None:
+            early_query.cancel()
+        # The response cache only keeps answers whose SQL validated and ran
+        if llm_response is not None:
+            await _settle_response(user_question, provider, llm_response, result["success"])
+
+
+async def run_pipeline(user_question, provider=None, on_sql_delta=None,
+                       defer_chart=False, build_chart=True):
+    # With defer_chart the figure is left building in result["chart_future"]
+    # so the caller can render the table first; see resolve_chart().
+    result = new_result(user_question)
+    provider = provider or config.LLM_PROVIDER
+
+    with start_trace("query", question=user_question, provider=provider) as trace:
+        result["trace"] = trace
+        with span("pipeline.total") as total:
+            # Warm the schema snapshot and a pooled connection while the LLM request is in flight
+            warm = asyncio.ensure_future(run_in_db_executor(_warm_database))
+            await _run_stages(result, user_question, provider, on_sql_delta, defer_chart, build_chart)
+            try:
+                await warm
+            except Exception:
+                pass
+            total.set(success=result["success"])
+        result["timings"]["total_ms"] = total.duration_ms
+
+    return result
+
+
+class QueryEngine:
+    # One event loop on a background thread serves every session; callers
+    # on other threads submit coroutines and block on the returned future.
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="query-engine", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, user_question, provider=None, on_sql_delta=None, defer_chart=False):
+        return self.submit(
+            run_pipeline(user_question, provider, on_sql_delta, defer_chart=defer_chart)
+        ).result()
+
+    def stop(self):
+        # Closes the loop's LLM clients while it can still run their
+        # connection shutdown, then stops and closes the loop
+        if self.loop.is_closed():
+            return
+        try:
+            self.submit(aclose_clients()).result(config.LLM_TIMEOUT_SECONDS)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+
+
+_engine_lock = threading.Lock()
+_engine = None
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = QueryEngine()
+    return _engine
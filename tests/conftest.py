@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Side stores (response cache, workload log, rollups, spill files) go to a
+# throwaway directory; config reads CACHE_DIR at import time
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="text2sql-tests-"))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+import pandas as pd
+
+import batch
+from pipeline import new_result
+
+
+def _duplicate_column_result(question):
+    result = new_result(question)
+    result.update(
+        success=True,
+        sql="SELECT a.Name, b.Name FROM artists a JOIN albums b ON b.ArtistId = a.ArtistId",
+        data=pd.DataFrame([["AC/DC", "Let There Be Rock"]], columns=["Name", "Name"])
+    )
+    return result
+
+
+def test_write_frame_parquet_dedupes_column_names(tmp_path):
+    df = pd.DataFrame([[1, "a", "b"]], columns=["Id", "Name", "Name"])
+    path = batch.write_frame(df, tmp_path, "q1", "parquet")
+    assert list(pd.read_parquet(path).columns) == ["Id", "Name", "Name.1"]
+
+
+def test_run_batch_records_failures_without_aborting(tmp_path, monkeypatch):
+    async def fake_pipeline(question, provider, build_chart=True):
+        if question == "boom":
+            raise RuntimeError("provider unavailable")
+        return _duplicate_column_result(question)
+
+    monkeypatch.setattr(batch, "run_pipeline", fake_pipeline)
+    output = tmp_path / "results.jsonl"
+    frames_dir = tmp_path / "frames"
+    frames_dir.mkdir()
+
+    counts = asyncio.run(batch.run_batch(
+        [("q1", "albums by artist"), ("q2", "boom")], output, "openai",
+        concurrency=2, requests_per_minute=6000, frames_dir=frames_dir, frame_format="parquet"
+    ))
+
+    records = {r["id"]: r for r in map(json.loads, output.read_text().splitlines())}
+    assert counts == {"done": 1, "failed": 1}
+    assert records["q1"]["success"] and records["q1"]["frame"]
+    assert list(pd.read_parquet(records["q1"]["frame"]).columns) == ["Name", "Name.1"]
+    assert not records["q2"]["success"]
+    assert records["q2"]["error"] == "provider unavailable"
+
+
+def test_run_batch_records_frame_write_failure(tmp_path, monkeypatch):
+    async def fake_pipeline(question, provider, build_chart=True):
+        return _duplicate_column_result(question)
+
+    def failing_write(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(batch, "run_pipeline", fake_pipeline)
+    monkeypatch.setattr(batch, "write_frame", failing_write)
+    output = tmp_path / "results.jsonl"
+
+    counts = asyncio.run(batch.run_batch(
+        [("q1", "albums by artist")], output, "openai",
+        concurrency=1, requests_per_minute=6000, frames_dir=tmp_path, frame_format="parquet"
+    ))
+
+    record = json.loads(output.read_text())
+    assert counts == {"done": 0, "failed": 1}
+    assert not record["success"]
+    assert "disk full" in record["error"]
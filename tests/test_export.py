@@ -0,0 +1,48 @@
+import gzip
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from database import EXPORT_FORMATS, export_query
+
+
+def _read_back(fmt, payload):
+    if fmt == "csv.gz":
+        return pd.read_csv(io.StringIO(gzip.decompress(payload).decode("utf-8")))
+    if fmt == "parquet":
+        return pq.read_table(io.BytesIO(payload)).to_pandas()
+    return pa.ipc.open_file(io.BytesIO(payload)).read_all().to_pandas()
+
+
+@pytest.mark.parametrize("fmt", list(EXPORT_FORMATS))
+def test_export_empty_result_keeps_columns(fmt):
+    sink = io.BytesIO()
+    rows = export_query("SELECT TrackId, Name, UnitPrice FROM tracks WHERE 0", fmt, sink)
+
+    df = _read_back(fmt, sink.getvalue())
+    assert rows == 0
+    assert df.empty
+    assert list(df.columns) == ["TrackId", "Name", "UnitPrice"]
+
+
+@pytest.mark.parametrize("fmt", list(EXPORT_FORMATS))
+def test_export_round_trips_rows(fmt):
+    sink = io.BytesIO()
+    rows = export_query("SELECT GenreId, Name FROM genres ORDER BY GenreId", fmt, sink)
+
+    df = _read_back(fmt, sink.getvalue())
+    assert rows == len(df) == 25
+    assert df["Name"].iloc[0] == "Rock"
+
+
+def test_empty_parquet_export_keeps_declared_types():
+    sink = io.BytesIO()
+    export_query("SELECT TrackId, Name, UnitPrice FROM tracks WHERE 0", "parquet", sink)
+
+    schema = pq.read_schema(io.BytesIO(sink.getvalue()))
+    assert schema.field("TrackId").type == pa.int64()
+    assert schema.field("UnitPrice").type == pa.float64()
+    assert schema.field("Name").type in (pa.string(), pa.large_string())
@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+from database import guard
+from database.guard import QueryBudgetExceededError, QueryTimeoutError, guarded
+
+# Enough VM work for several progress-handler calls at any interval
+HEAVY = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 2000000) SELECT SUM(i) FROM n"
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    yield conn
+    conn.close()
+
+
+def test_step_budget_cancels_the_query(conn):
+    with pytest.raises(QueryBudgetExceededError):
+        with guarded(conn, timeout=0, step_budget=10_000):
+            conn.execute(HEAVY).fetchone()
+
+
+def test_timeout_cancels_the_query(conn):
+    with pytest.raises(QueryTimeoutError):
+        with guarded(conn, timeout=1e-6, step_budget=0):
+            conn.execute(HEAVY).fetchone()
+
+
+def test_nested_guard_restores_the_outer_handler(conn):
+    with guarded(conn, timeout=0, step_budget=0) as outer:
+        with guarded(conn, timeout=0, step_budget=0) as inner:
+            assert guard._active[id(conn)] is inner
+            conn.execute("SELECT COUNT(*) FROM (SELECT 1 UNION ALL SELECT 2)").fetchone()
+        assert guard._active[id(conn)] is outer
+
+        # The outer guard counts the steps of statements run after the inner one
+        before = outer.steps
+        conn.execute(HEAVY).fetchone()
+        assert outer.steps > before
+    assert id(conn) not in guard._active
+
+
+def test_outer_budget_still_applies_after_a_nested_guard(conn):
+    with pytest.raises(QueryBudgetExceededError):
+        with guarded(conn, timeout=0, step_budget=10_000):
+            with guarded(conn, timeout=0, step_budget=0):
+                conn.execute("SELECT 1").fetchone()
+            conn.execute(HEAVY).fetchone()
+
+
+def test_handler_is_removed_after_the_outermost_guard(conn):
+    with guarded(conn, timeout=0, step_budget=10_000):
+        pass
+    assert conn.execute(HEAVY).fetchone()[0] == 2000000 * 2000001 // 2
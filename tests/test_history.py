@@ -0,0 +1,44 @@
+import pandas as pd
+
+import visualization
+from history import HistorySpill, QueryHistory
+from pipeline import new_result
+
+
+def _history(tmp_path):
+    return QueryHistory(spill=HistorySpill(directory=tmp_path))
+
+
+def _result():
+    result = new_result("Tracks by genre")
+    result.update(
+        success=True,
+        sql="SELECT g.Name AS genre, COUNT(*) AS tracks FROM tracks t JOIN genres g ON g.GenreId = t.GenreId GROUP BY g.Name",
+        data=pd.DataFrame({"genre": ["Rock", "Jazz"], "tracks": [1297, 130]}),
+        viz_config={"needed": True, "chart_type": "bar", "x_column": "genre", "y_column": "tracks"}
+    )
+    return result
+
+
+def test_reopen_rebuilds_frame_and_chart(tmp_path):
+    history = _history(tmp_path)
+    entry = history.append(_result())
+
+    reopened = history.reopen(entry["id"])
+    assert reopened["data"]["tracks"].tolist() == [1297, 130]
+    assert reopened["chart"] is not None
+    assert "chart_error" not in reopened
+
+
+def test_reopen_survives_a_chart_failure(tmp_path, monkeypatch):
+    def broken_chart(df, viz_config):
+        raise ValueError("bad column")
+
+    monkeypatch.setattr(visualization, "create_chart", broken_chart)
+    history = _history(tmp_path)
+    entry = history.append(_result())
+
+    reopened = history.reopen(entry["id"])
+    assert reopened["data"]["genre"].tolist() == ["Rock", "Jazz"]
+    assert reopened["chart"] is None
+    assert reopened["chart_error"] == "bad column"
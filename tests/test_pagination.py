@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from database import ResultPager
+from database.connection import read_frame
+
+TRACKS = "SELECT TrackId, Name, GenreId, Composer FROM tracks"
+
+
+def _all_pages(pager):
+    return pd.concat([pager.page(n) for n in range(pager.page_count())], ignore_index=True)
+
+
+def test_unique_key_pages_by_keyset():
+    pager = ResultPager(TRACKS, page_size=500, key="TrackId")
+    assert pager.uses_keyset()
+
+    pages = _all_pages(pager)
+    expected = read_frame(f"{TRACKS} ORDER BY TrackId")
+    pd.testing.assert_frame_equal(pages, expected)
+
+
+@pytest.mark.parametrize("key", ["GenreId", "Composer"])
+def test_repeated_or_null_key_falls_back_to_offset(key):
+    pager = ResultPager(TRACKS, page_size=500, key=key)
+    assert not pager.uses_keyset()
+
+    pages = _all_pages(pager)
+    assert len(pages) == pager.total_rows() == len(read_frame(TRACKS))
+    assert pages["TrackId"].is_unique
+
+
+def test_ambiguous_key_column_falls_back_to_offset():
+    sql = ("SELECT ar.Name, al.Title AS Name FROM artists ar "
+           "JOIN albums al ON al.ArtistId = ar.ArtistId ORDER BY al.AlbumId")
+    pager = ResultPager(sql, page_size=100, key="Name")
+    assert not pager.uses_keyset()
+    assert sum(len(pager.page(n)) for n in range(pager.page_count())) == len(read_frame(sql))
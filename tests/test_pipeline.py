@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+import config
+import pipeline
+
+SQL = "SELECT Name FROM genres"
+
+
+def _install(monkeypatch, events, error=None):
+    state = {"started": False, "cancelled": False}
+
+    async def fake_stream(user_question, provider=None):
+        for event in events:
+            yield event
+            await asyncio.sleep(0)
+        if error is not None:
+            raise error
+
+    async def slow_query(sql):
+        state["started"] = True
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    monkeypatch.setattr(config, "LLM_STREAMING", True)
+    monkeypatch.setattr(pipeline, "astream_sql_response", fake_stream)
+    monkeypatch.setattr(pipeline, "_plan_and_execute", slow_query)
+    return state
+
+
+async def _generate_failing(expected):
+    # Checked before asyncio.run tears the loop down and cancels leftover tasks
+    with pytest.raises(expected):
+        await pipeline._generate("genres", "openai", None)
+
+
+def test_early_query_is_cancelled_when_the_stream_fails(monkeypatch):
+    state = _install(monkeypatch, [{"type": "sql", "sql": SQL}], error=ConnectionError("reset"))
+
+    async def run():
+        await _generate_failing(ConnectionError)
+        assert state["started"] and state["cancelled"]
+
+    asyncio.run(run())
+
+
+def test_early_query_is_cancelled_when_the_stream_ends_early(monkeypatch):
+    state = _install(monkeypatch, [{"type": "sql", "sql": SQL}])
+
+    async def run():
+        await _generate_failing(ValueError)
+        assert state["started"] and state["cancelled"]
+
+    asyncio.run(run())
+
+
+def test_early_query_is_returned_when_the_sql_matches(monkeypatch):
+    response = {"sql": SQL, "visualization": {"needed": False}, "explanation": ""}
+    state = _install(monkeypatch, [{"type": "sql", "sql": SQL}, {"type": "done", "response": response}])
+
+    async def generate():
+        llm_response, early_query = await pipeline._generate("genres", "openai", None)
+        assert llm_response is response and early_query is not None
+        early_query.cancel()
+        await asyncio.gather(early_query, return_exceptions=True)
+
+    asyncio.run(generate())
+    assert state["started"]
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from llm.parser import parse_llm_response
+from utils.sql_lexer import additive_columns
+from visualization.reduce import OTHER_LABEL, reduce_for_chart, top_n
+
+
+def _frame(values, y_col="value"):
+    return pd.DataFrame({"category": [f"c{i}" for i in range(len(values))], y_col: values})
+
+
+def test_additive_measure_sums_the_rest_into_other():
+    df = _frame([5.0, 1.0, 9.0, 2.0, 7.0])
+    reduced = top_n(df, "category", "value", 3, additive=True)
+    assert reduced["category"].tolist() == ["c2", "c4", OTHER_LABEL]
+    assert reduced["value"].tolist() == [9.0, 7.0, 8.0]
+
+
+def test_non_additive_measure_keeps_top_rows_without_other():
+    df = _frame([5.0, 1.0, 9.0, np.nan, 7.0])
+    reduced = top_n(df, "category", "value", 3)
+    assert reduced["category"].tolist() == ["c2", "c4"]
+    assert OTHER_LABEL not in reduced["category"].tolist()
+
+
+def test_non_numeric_y_is_left_unchanged():
+    df = _frame(["a", "b", "c", "d", "e"])
+    assert top_n(df, "category", "value", 3, additive=True) is df
+
+
+def test_reduce_for_chart_passes_additivity_through():
+    df = _frame([float(v) for v in range(40)])
+    summed, summed_summary, _ = reduce_for_chart(df, "pie", "category", "value", additive=True)
+    kept, kept_summary, _ = reduce_for_chart(df, "pie", "category", "value")
+    assert summed["category"].iloc[-1] == OTHER_LABEL
+    assert summed["value"].sum() == df["value"].sum()
+    assert OTHER_LABEL not in kept["category"].tolist()
+    assert (summed_summary["method"], kept_summary["method"]) == ("top_n", "top_rows")
+
+
+def test_additive_columns():
+    sql = ("SELECT c.Country, SUM(i.Total) AS revenue, COUNT(*), AVG(i.Total) AS average, "
+           "MAX(i.Total) AS largest, SUM(i.Total) / COUNT(*) AS ratio, "
+           "COUNT(DISTINCT c.CustomerId) AS customers "
+           "FROM invoices i JOIN customers c ON c.CustomerId = i.CustomerId GROUP BY c.Country")
+    assert additive_columns(sql) == {"revenue", "count(*)"}
+
+
+def test_parser_marks_additive_visualizations():
+    response = """{"sql": "SELECT g.Name AS genre, %s AS value FROM tracks t JOIN genres g ON g.GenreId = t.GenreId GROUP BY g.Name",
+                   "visualization": {"needed": true, "chart_type": "pie", "x_column": "genre", "y_column": "value"},
+                   "explanation": ""}"""
+    assert parse_llm_response(response % "COUNT(t.TrackId)")["visualization"]["additive"]
+    assert not parse_llm_response(response % "AVG(t.Milliseconds)")["visualization"]["additive"]
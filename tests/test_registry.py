@@ -0,0 +1,81 @@
+import asyncio
+import gc
+
+import pytest
+
+from llm import registry
+from pipeline import QueryEngine
+
+
+class FakeClient:
+    def __init__(self, asynchronous):
+        self.asynchronous = asynchronous
+        self.closed = False
+
+    def close(self):
+        if self.asynchronous:
+            return self._aclose()
+        self.closed = True
+
+    async def _aclose(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def fake_clients(monkeypatch):
+    monkeypatch.setattr(registry, "_build_client",
+                        lambda provider, api_key, base_url, asynchronous=False: FakeClient(asynchronous))
+    yield
+    registry.close_clients()
+
+
+async def _client():
+    return registry.get_async_client("openai", "key")
+
+
+def test_async_clients_are_per_loop_and_dropped_with_the_loop():
+    first = asyncio.run(_client())
+    second = asyncio.run(_client())
+    assert first is not second
+
+    gc.collect()
+    assert len(registry._async_clients) == 0
+
+
+def test_async_client_is_reused_within_a_loop():
+    async def both():
+        return await _client(), await _client()
+
+    first, second = asyncio.run(both())
+    assert first is second
+
+
+def test_close_clients_closes_sync_and_async_clients():
+    loop = asyncio.new_event_loop()
+    try:
+        async_client = loop.run_until_complete(_client())
+        sync_client = registry.get_client("openai", "key")
+
+        registry.close_clients()
+        assert sync_client.closed and async_client.closed
+        assert registry.get_client("openai", "key") is not sync_client
+    finally:
+        loop.close()
+
+
+def test_aclose_clients_closes_the_running_loops_clients():
+    async def run():
+        client = await _client()
+        await registry.aclose_clients()
+        return client
+
+    assert asyncio.run(run()).closed
+
+
+def test_query_engine_stop_closes_its_clients():
+    engine = QueryEngine()
+    client = engine.submit(_client()).result()
+
+    engine.stop()
+    assert client.closed
+    assert engine.loop.is_closed()
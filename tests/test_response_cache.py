@@ -0,0 +1,36 @@
+import pytest
+
+from llm.cache import ResponseCache, make_cache_key, normalize_question
+
+
+def _key(question):
+    return make_cache_key(question, "openai", "gpt-4o", "prompt", "schema")
+
+
+@pytest.mark.parametrize("a, b", [
+    ("Tracks longer than 300000 ms", "tracks  longer than 300000 MS?"),
+    ("How many customers are there?", "how many customers are there"),
+    ("Top 5 artists by sales.", " Top 5 artists   by sales!"),
+])
+def test_equivalent_phrasings_share_a_key(a, b):
+    assert _key(a) == _key(b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("Invoices with total > 10", "Invoices with total < 10"),
+    ("Customers with balance -5", "Customers with balance 5"),
+    ("Tracks priced 1.5 or more", "Tracks priced 1 5 or more"),
+])
+def test_operators_signs_and_decimals_are_kept(a, b):
+    assert normalize_question(a) != normalize_question(b)
+    assert _key(a) != _key(b)
+
+
+def test_cache_does_not_serve_the_opposite_comparison(tmp_path):
+    cache = ResponseCache(path=tmp_path / "responses.db")
+    greater = _key("Invoices with total > 10")
+    cache.put(greater, "Invoices with total > 10", "openai", "gpt-4o", "schema",
+              {"sql": "SELECT * FROM invoices WHERE Total > 10"})
+
+    assert cache.get(_key("Invoices with total < 10")) is None
+    assert cache.get(greater)["sql"] == "SELECT * FROM invoices WHERE Total > 10"
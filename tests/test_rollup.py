@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+
+from database.connection import get_database_version, read_frame
+from database.rollup import RollupStore
+
+ELIGIBLE = [
+    ("invoice_rollup",
+     "SELECT BillingCountry AS country, SUM(Total) AS revenue, COUNT(*) AS invoices "
+     "FROM invoices GROUP BY BillingCountry ORDER BY revenue DESC"),
+    ("invoice_rollup",
+     "SELECT strftime('%Y', InvoiceDate) AS year, AVG(Total) AS average, MIN(Total) AS smallest, "
+     "MAX(Total) AS largest FROM invoices GROUP BY year ORDER BY year"),
+    ("invoice_rollup",
+     "SELECT strftime('%Y-%m', i.InvoiceDate) AS month, SUM(i.Total) AS total_sales "
+     "FROM invoices i WHERE strftime('%Y', i.InvoiceDate) = '2010' GROUP BY month ORDER BY month"),
+    ("invoice_rollup",
+     "SELECT BillingCountry, COUNT(InvoiceId) AS n FROM invoices GROUP BY BillingCountry "
+     "HAVING COUNT(InvoiceId) > 10 ORDER BY n DESC, BillingCountry LIMIT 5"),
+    ("sales_rollup",
+     "SELECT g.Name AS genre, SUM(ii.UnitPrice * ii.Quantity) AS revenue "
+     "FROM invoice_items ii JOIN tracks t ON t.TrackId = ii.TrackId "
+     "JOIN genres g ON g.GenreId = t.GenreId GROUP BY g.Name ORDER BY revenue DESC, genre"),
+    ("sales_rollup",
+     "SELECT ar.Name AS artist, SUM(ii.Quantity) AS units FROM invoice_items ii "
+     "JOIN tracks t ON t.TrackId = ii.TrackId JOIN albums al ON al.AlbumId = t.AlbumId "
+     "JOIN artists ar ON ar.ArtistId = al.ArtistId GROUP BY ar.ArtistId, ar.Name "
+     "ORDER BY units DESC, artist LIMIT 10"),
+    ("sales_rollup",
+     "SELECT i.BillingCountry AS country, g.Name AS genre, COUNT(*) AS lines "
+     "FROM invoice_items ii JOIN invoices i ON i.InvoiceId = ii.InvoiceId "
+     "JOIN tracks t ON t.TrackId = ii.TrackId JOIN genres g ON g.GenreId = t.GenreId "
+     "WHERE i.BillingCountry IN ('USA', 'Canada') GROUP BY country, genre ORDER BY country, genre"),
+]
+
+INELIGIBLE = [
+    "SELECT Name FROM tracks",
+    "SELECT g.Name, AVG(t.Milliseconds) FROM tracks t JOIN genres g ON g.GenreId = t.GenreId GROUP BY g.Name",
+    "SELECT BillingCity, SUM(Total) FROM invoices GROUP BY BillingCity",
+    "SELECT BillingCountry, SUM(Total) FROM invoices WHERE CustomerId IN (SELECT CustomerId FROM customers) "
+    "GROUP BY BillingCountry",
+]
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    return RollupStore(path=tmp_path_factory.mktemp("rollups") / "rollups.db")
+
+
+@pytest.mark.parametrize("rollup, sql", ELIGIBLE)
+def test_rewrite_matches_the_base_query(store, rollup, sql):
+    rewrite = store.rewrite(sql, get_database_version())
+    assert rewrite is not None and rewrite.rollup == rollup
+
+    expected = read_frame(sql)
+    actual = store.read(rewrite)
+    pd.testing.assert_frame_equal(
+        actual, expected, check_dtype=False, check_exact=False, rtol=1e-9, atol=1e-9
+    )
+    assert store.verify(rewrite, expected)
+
+
+@pytest.mark.parametrize("sql", INELIGIBLE)
+def test_ineligible_queries_are_not_rewritten(store, sql):
+    assert store.rewrite(sql, get_database_version()) is None
+
+
+def test_mismatched_rewrite_is_not_offered_again(store):
+    sql = "SELECT BillingCountry, SUM(Total) AS revenue FROM invoices GROUP BY BillingCountry"
+    version = get_database_version()
+    rewrite = store.rewrite(sql, version)
+
+    wrong = read_frame(sql).assign(revenue=0.0)
+    assert not store.verify(rewrite, wrong)
+    assert store.rewrite(sql, version) is None
@@ -0,0 +1,84 @@
+import pytest
+
+from utils import fingerprint_sql, sanitize_sql, validate_sql
+from utils.sql_lexer import limit_sql
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM tracks",
+    "select Name from artists;",
+    "SELECT * FROM customers WHERE Company = 'DROP TABLE; DELETE'",
+    'SELECT "update" FROM (SELECT 1 AS "update")',
+    "SELECT replace(Name, 'a', 'b') FROM artists",
+    "SELECT Name FROM artists -- then DROP TABLE artists\n",
+    "SELECT Name /* DELETE FROM artists */ FROM artists",
+    "SELECT Name FROM artists UNION ALL SELECT Title FROM albums",
+    "SELECT credit_limit, updated_at FROM (SELECT 1 AS credit_limit, 2 AS updated_at)",
+])
+def test_accepts(sql):
+    assert validate_sql(sql) == (True, "")
+
+
+@pytest.mark.parametrize("sql, error", [
+    ("", "SQL query cannot be empty"),
+    ("   ", "SQL query cannot be empty"),
+    ("DELETE FROM tracks", "Only SELECT queries are allowed"),
+    ("-- SELECT\nDROP TABLE tracks", "Only SELECT queries are allowed"),
+    ("SELECT 1; DROP TABLE tracks", "Multiple SQL statements are not allowed"),
+    ("SELECT 1; SELECT 2", "Multiple SQL statements are not allowed"),
+    ("SELECT * FROM tracks WHERE 1 = 1 OR DELETE", "Forbidden keyword detected: DELETE"),
+    ("SELECT * FROM (SELECT 1) REPLACE INTO t VALUES (1)", "Forbidden keyword detected: REPLACE"),
+    ("SELECT Name FROM artists UNION SELECT Title FROM albums", "Potentially unsafe SQL pattern detected"),
+    ("SELECT 'unterminated FROM tracks", "Unterminated string literal"),
+    ("SELECT Name /* open comment FROM artists", "Unterminated block comment"),
+])
+def test_rejects(sql, error):
+    assert validate_sql(sql) == (False, error)
+
+
+def test_sanitize_strips_comments_and_trailing_semicolons():
+    sql = "SELECT Name -- the artist\nFROM artists /* all */ ;;"
+    assert sanitize_sql(sql) == "SELECT Name FROM artists"
+
+
+def test_sanitize_keeps_whitespace_inside_literals():
+    assert sanitize_sql("SELECT  *  FROM artists WHERE Name = 'AC   DC'") == \
+        "SELECT * FROM artists WHERE Name = 'AC   DC'"
+
+
+def test_fingerprint_ignores_literals_case_and_comments():
+    a = fingerprint_sql("select * from tracks where Milliseconds > 300000 -- long")
+    b = fingerprint_sql("SELECT *\nFROM tracks WHERE Milliseconds > 1000")
+    assert a == b
+    assert a != fingerprint_sql("SELECT * FROM tracks WHERE Milliseconds < 1000")
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM tracks", "SELECT * FROM tracks LIMIT 100"),
+    ("SELECT * FROM tracks;", "SELECT * FROM tracks LIMIT 100"),
+    ("SELECT * FROM tracks -- note", "SELECT * FROM tracks LIMIT 100"),
+    ("SELECT * FROM tracks LIMIT 10", "SELECT * FROM tracks LIMIT 10"),
+    ("SELECT * FROM tracks LIMIT 5000", "SELECT * FROM tracks LIMIT 100"),
+    ("SELECT credit_limit FROM t", "SELECT credit_limit FROM t LIMIT 100"),
+    ("SELECT * FROM (SELECT * FROM tracks LIMIT 5000) t",
+     "SELECT * FROM (SELECT * FROM tracks LIMIT 5000) t LIMIT 100"),
+    ("SELECT * FROM tracks LIMIT 10 OFFSET 20",
+     "SELECT * FROM (SELECT * FROM tracks LIMIT 10 OFFSET 20) LIMIT 100"),
+    ("SELECT * FROM tracks LIMIT 20, 10",
+     "SELECT * FROM (SELECT * FROM tracks LIMIT 20, 10) LIMIT 100"),
+    ("SELECT * FROM tracks LIMIT 2 * 500",
+     "SELECT * FROM (SELECT * FROM tracks LIMIT 2 * 500) LIMIT 100"),
+])
+def test_limit_sql(sql, expected):
+    assert limit_sql(sql, 100) == expected
+
+
+def test_limit_sql_with_offset_pages_the_whole_statement():
+    assert limit_sql("SELECT * FROM tracks", 50, offset=100) == "SELECT * FROM tracks LIMIT 50 OFFSET 100"
+    assert limit_sql("SELECT * FROM tracks LIMIT 10", 50, offset=100) == \
+        "SELECT * FROM (SELECT * FROM tracks LIMIT 10) LIMIT 50 OFFSET 100"
+
+
+def test_limit_sql_rejects_an_empty_statement():
+    with pytest.raises(ValueError):
+        limit_sql(" ; -- nothing", 10)
@@ -1,5 +1,6 @@
 """Utility functions for the Text-to-SQL application."""
 
-from .validators import validate_sql, sanitize_sql
+from .sql_lexer import analyze_sql, tokenize
+from .validators import fingerprint_sql, validate_sql, sanitize_sql
 
-__all__ = ["validate_sql", "sanitize_sql"]
+__all__ = ["validate_sql", "sanitize_sql", "fingerprint_sql", "analyze_sql", "tokenize"]
@@ -0,0 +1,272 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import NamedTuple
+
+from config import FORBIDDEN_SQL_KEYWORDS
+
+# One alternation, tried left to right at each position, so the whole query is
+# scanned exactly once. Quoted strings and identifiers are consumed whole,
+# which keeps keywords and semicolons inside them from being seen as SQL.
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<blob>[xX]'[0-9a-fA-F]*')
+  | (?P<string>'[^']*(?:''[^']*)*')
+  | (?P<ident>"[^"]*(?:""[^"]*)*"|`[^`]*(?:``[^`]*)*`|\[[^\]]*\])
+  | (?P<number>0[xX][0-9a-fA-F]+|(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<param>\?\d*|[:@$][^\W\d]\w*)
+  | (?P<word>[^\W\d]\w*)
+  | (?P<unterminated>['"`\[]|/\*)
+  | (?P<op>\|\||->>|->|<<|>>|<=|>=|==|!=|<>|[-+*/%<>=~&|(),.;])
+  | (?P<invalid>.)
+""", re.VERBOSE | re.DOTALL)
+
+_LITERALS = frozenset(("string", "number", "blob"))
+_FORBIDDEN = frozenset(FORBIDDEN_SQL_KEYWORDS)
+
+_UNTERMINATED = {
+    "'": "Unterminated string literal",
+    '"': "Unterminated quoted identifier",
+    "`": "Unterminated quoted identifier",
+    "[": "Unterminated quoted identifier",
+    "/*": "Unterminated block comment"
+}
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+    start: int
+
+
+@dataclass(frozen=True)
+class SQLAnalysis:
+    valid: bool
+    error: str
+    sql: str
+    normalized: str
+    fingerprint: str
+    tokens: tuple
+
+
+def tokenize(sql):
+    # Yields every token, whitespace and comments included
+    for match in _TOKEN_RE.finditer(sql):
+        yield Token(match.lastgroup, match.group(), match.start())
+
+
+def analyze_sql(sql):
+    if not sql or not sql.strip():
+        return SQLAnalysis(False, "SQL query cannot be empty", "", "", "", ())
+
+    tokens = []
+    clean_parts = []
+    canonical_parts = []
+    error = ""
+    gap = False
+    statement_end = None   # index of the first ";" in tokens
+    pending = None         # keyword waiting on the next token (REPLACE / UNION)
+    union_without_all = False
+
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        if kind == "ws" or kind == "comment":
+            gap = True
+            continue
+
+        text = match.group()
+        if gap and tokens:
+            clean_parts.append(" ")
+            canonical_parts.append(" ")
+        gap = False
+        clean_parts.append(text)
+
+        if kind == "word":
+            upper = text.upper()
+            canonical_parts.append(upper)
+        else:
+            upper = text
+            canonical_parts.append("?" if kind in _LITERALS else text)
+
+        if not error:
+            if pending is not None:
+                if pending == "UNION":
+                    if upper != "ALL":
+                        union_without_all = True
+                # replace(x, y, z) is a scalar function, not REPLACE INTO;
+                # no other forbidden keyword is exempt, call syntax or not
+                elif not (pending == "REPLACE" and text == "("):
+                    error = f"Forbidden keyword detected: {pending}"
+                pending = None
+
+            if error:
+                pass
+            elif statement_end is not None and text != ";":
+                error = "Multiple SQL statements are not allowed"
+            elif not tokens and not (kind == "word" and upper == "SELECT"):
+                error = "Only SELECT queries are allowed"
+            elif kind == "word":
+                if upper in _FORBIDDEN or upper == "UNION":
+                    pending = upper
+                elif upper == "SELECT" and union_without_all:
+                    error = "Potentially unsafe SQL pattern detected"
+            elif kind == "unterminated":
+                error = _UNTERMINATED[text]
+            elif kind == "invalid":
+                error = f"Unexpected character: {text!r}"
+            elif text == ";" and statement_end is None:
+                statement_end = len(tokens)
+
+        tokens.append(Token(kind, text, match.start()))
+
+    if not error and pending is not None and pending != "UNION":
+        error = f"Forbidden keyword detected: {pending}"
+
+    # Trailing semicolons are dropped from the sanitised SQL and the fingerprint
+    while tokens and tokens[-1].text == ";":
+        tokens.pop()
+        clean_parts.pop()
+        canonical_parts.pop()
+        if clean_parts and clean_parts[-1] == " ":
+            clean_parts.pop()
+            canonical_parts.pop()
+
+    normalized = "".join(canonical_parts)
+    return SQLAnalysis(
+        valid=not error,
+        error=error,
+        sql="".join(clean_parts),
+        normalized=normalized,
+        fingerprint=hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16],
+        tokens=tuple(tokens)
+    )
+
+
+def sql_fingerprint(sql):
+    return analyze_sql(sql).fingerprint
+
+
+def _statement(sql):
+    # Significant tokens of the statement and its text without trailing
+    # semicolons or comments, so clauses can be appended safely
+    tokens = [t for t in tokenize(sql) if t.kind != "ws" and t.kind != "comment"]
+    while tokens and tokens[-1].text == ";":
+        tokens.pop()
+    if not tokens:
+        raise ValueError("SQL query cannot be empty")
+    last = tokens[-1]
+    return tokens, sql[:last.start + len(last.text)]
+
+
+def _top_level_limit(tokens):
+    depth = 0
+    for i, token in enumerate(tokens):
+        if token.text == "(":
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+        elif depth == 0 and token.kind == "word" and token.text.upper() == "LIMIT":
+            return i
+    return None
+
+
+def statement_body(sql):
+    return _statement(sql)[1]
+
+
+def limit_sql(sql, limit, offset=None):
+    # Caps the rows the outermost query can return. Only a LIMIT at
+    # parenthesis depth zero counts; one inside a subquery, or a column such
+    # as credit_limit, leaves the statement uncapped and gets a LIMIT appended.
+    tokens, body = _statement(sql)
+    clause = f"LIMIT {int(limit)}" + (f" OFFSET {int(offset)}" if offset else "")
+
+    position = _top_level_limit(tokens)
+    if position is None:
+        return f"{body} {clause}"
+
+    existing = tokens[position + 1:]
+    if offset is None and len(existing) == 1 and existing[0].text.isdigit():
+        token = existing[0]
+        if int(token.text) <= limit:
+            return body
+        return f"{body[:token.start]}{int(limit)}{body[token.start + len(token.text):]}"
+
+    # LIMIT with an OFFSET or an expression: cap the whole statement instead
+    return f"SELECT * FROM ({body}) {clause}"
+
+
+# Aggregates whose values can be summed across groups: the SUM of a
+# bucket's SUMs (or COUNTs) is the SUM over the bucket, unlike AVG or MAX
+_ADDITIVE_AGGREGATES = frozenset(("SUM", "TOTAL", "COUNT"))
+_SELECT_LIST_END = frozenset(("FROM", "WHERE", "GROUP", "ORDER", "LIMIT", "UNION", "EXCEPT", "INTERSECT"))
+
+
+def _select_items(tokens):
+    # The comma-separated result columns of the outermost SELECT
+    depth = 0
+    items = None
+    for token in tokens:
+        if token.text == "(":
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+        if depth == 0 and token.kind == "word":
+            keyword = token.text.upper()
+            if items is None:
+                if keyword == "SELECT":
+                    items = [[]]
+                continue
+            if keyword in _SELECT_LIST_END:
+                break
+            if keyword in ("DISTINCT", "ALL") and not items[-1]:
+                continue
+        if items is None:
+            continue
+        if depth == 0 and token.text == ",":
+            items.append([])
+        else:
+            items[-1].append(token)
+    return items or []
+
+
+def additive_columns(sql):
+    # Result column names (casefolded) of the outermost SELECT that are a
+    # bare SUM/TOTAL/COUNT, e.g. "SUM(il.UnitPrice) AS revenue" -> "revenue"
+    try:
+        tokens, body = _statement(sql)
+    except ValueError:
+        return frozenset()
+
+    names = set()
+    for item in _select_items(tokens):
+        expression = item
+        alias = None
+        if len(item) >= 2 and item[-1].kind in ("word", "ident", "string"):
+            if item[-2].kind == "word" and item[-2].text.upper() == "AS":
+                expression, alias = item[:-2], item[-1]
+            elif item[-2].text == ")":
+                expression, alias = item[:-1], item[-1]
+        if len(expression) < 3 or expression[0].kind != "word" or expression[1].text != "(":
+            continue
+        if expression[0].text.upper() not in _ADDITIVE_AGGREGATES or expression[-1].text != ")":
+            continue
+        # Distinct counts overlap between groups (a customer buying two genres)
+        if expression[2].kind == "word" and expression[2].text.upper() == "DISTINCT":
+            continue
+        # The call must span the whole expression: SUM(a) / COUNT(b) is a ratio
+        depth = 0
+        for i, token in enumerate(expression[1:], 1):
+            depth += (token.text == "(") - (token.text == ")")
+            if depth == 0:
+                break
+        if i != len(expression) - 1:
+            continue
+        if alias is not None:
+            name = alias.text[1:-1] if alias.kind != "word" else alias.text
+        else:
+            last = expression[-1]
+            name = body[expression[0].start:last.start + len(last.text)]
+        names.add(name.casefold())
+    return frozenset(names)
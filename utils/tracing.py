@@ -0,0 +1,219 @@
+import contextvars
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNTED_ATTRIBUTES = (
+    "rows", "input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens",
+    "vm_steps", "killed"
+)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self, origin):
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class Trace:
+    def __init__(self, name, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "attributes": self.attributes,
+            "spans": [s.to_dict(self.origin) for s in spans]
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._attributes = {}
+        self._errors = {}
+
+    def observe(self, span):
+        seconds = span.duration_ms / 1000
+        with self._lock:
+            hist = self._durations.setdefault(
+                span.name, {"count": 0, "sum": 0.0, "buckets": [0] * len(DURATION_BUCKETS)}
+            )
+            hist["count"] += 1
+            hist["sum"] += seconds
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    hist["buckets"][i] += 1
+            for attribute in COUNTED_ATTRIBUTES:
+                value = span.attributes.get(attribute)
+                if isinstance(value, (int, float)):
+                    key = (span.name, attribute)
+                    self._attributes[key] = self._attributes.get(key, 0) + value
+            if span.error:
+                self._errors[span.name] = self._errors.get(span.name, 0) + 1
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP text_to_sql_stage_duration_seconds Time spent in each pipeline stage.",
+            "# TYPE text_to_sql_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            for name, hist in sorted(self._durations.items()):
+                for bound, count in zip(DURATION_BUCKETS, hist["buckets"]):
+                    lines.append(f'text_to_sql_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'text_to_sql_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {hist["count"]}')
+                lines.append(f'text_to_sql_stage_duration_seconds_sum{{stage="{name}"}} {hist["sum"]:.6f}')
+                lines.append(f'text_to_sql_stage_duration_seconds_count{{stage="{name}"}} {hist["count"]}')
+
+            lines.append("# HELP text_to_sql_stage_attribute_total Rows, tokens and VM steps recorded by pipeline stages.")
+            lines.append("# TYPE text_to_sql_stage_attribute_total counter")
+            for (name, attribute), value in sorted(self._attributes.items()):
+                lines.append(f'text_to_sql_stage_attribute_total{{stage="{name}",attribute="{attribute}"}} {value}')
+
+            lines.append("# HELP text_to_sql_stage_errors_total Pipeline stages that raised.")
+            lines.append("# TYPE text_to_sql_stage_errors_total counter")
+            for name, value in sorted(self._errors.items()):
+                lines.append(f'text_to_sql_stage_errors_total{{stage="{name}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+_log_lock = threading.Lock()
+
+
+def _write_trace_log(trace):
+    if not config.TRACE_LOG_PATH:
+        return
+    line = json.dumps(trace.to_dict(), default=str)
+    with _log_lock:
+        config.TRACE_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(config.TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def start_trace(name, **attributes):
+    trace = Trace(name, **attributes)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        try:
+            _write_trace_log(trace)
+        except OSError:
+            pass
+
+
+@contextmanager
+def span(name, **attributes):
+    # Cheap enough to leave on everywhere: spans outside a trace still feed
+    # the Prometheus histograms, they just aren't attached to a trace.
+    parent = _current_span.get()
+    current = Span(name, parent.name if parent else None, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.duration_ms = round((time.perf_counter() - current.start) * 1000, 3)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(current)
+        metrics.observe(current)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def bind_context(func, *args, **kwargs):
+    # Executors don't inherit contextvars; bind them so spans recorded on a
+    # worker thread land in the caller's trace.
+    context = contextvars.copy_context()
+    return lambda: context.run(func, *args, **kwargs)
+
+
+def render_prometheus():
+    return metrics.render_prometheus()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server_lock = threading.Lock()
+_server = None
+
+
+def start_metrics_server(port=None, host=None):
+    global _server
+    port = port or config.METRICS_PORT
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host or config.METRICS_HOST, int(port)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    return _server
@@ -1,5 +1,6 @@
 """Visualization module for chart generation."""
 
 from .charts import create_chart, auto_detect_chart_type
+from .figure_cache import get_figure_cache_stats
 
-__all__ = ["create_chart", "auto_detect_chart_type"]
+__all__ = ["create_chart", "auto_detect_chart_type", "get_figure_cache_stats"]
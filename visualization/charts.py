@@ -1,6 +1,14 @@
+import json
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+
+import config
+from utils.tracing import span
+from .figure_cache import get_figure_cache, make_figure_key
+from .profile import profile_frame
+from .reduce import reduce_for_chart
 
 DARK_THEME = {
     "template": "plotly_dark",
@@ -20,29 +28,30 @@ def auto_detect_chart_type(df):
     if df.empty or len(df.columns) < 2:
         return None
 
-    numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-    non_numeric_cols = df.select_dtypes(exclude=['number']).columns.tolist()
-
+    profile = profile_frame(df)
+    numeric_cols = [c for c, p in profile.items() if p["kind"] == "numeric"]
     if not numeric_cols:
         return None
 
-    if non_numeric_cols and numeric_cols:
-        x_col = non_numeric_cols[0]
-        y_col = numeric_cols[0]
+    time_cols = [c for c, p in profile.items() if p["kind"] == "datetime"]
+    category_cols = [c for c, p in profile.items() if p["kind"] in ("text", "boolean")]
 
-        x_sample = str(df[x_col].iloc[0]) if len(df) > 0 else ""
-        is_time_series = any(pattern in x_sample for pattern in ['-', '/', '20', '19'])
+    if time_cols:
+        x_col = time_cols[0]
+        y_col = numeric_cols[0]
+        return {
+            "chart_type": "line",
+            "x_column": x_col,
+            "y_column": y_col,
+            "title": f"{y_col} over {x_col}"
+        }
 
-        if is_time_series:
-            return {
-                "chart_type": "line",
-                "x_column": x_col,
-                "y_column": y_col,
-                "title": f"{y_col} over {x_col}"
-            }
+    if category_cols:
+        x_col = category_cols[0]
+        y_col = numeric_cols[0]
 
-        unique_count = df[x_col].nunique()
-        if unique_count <= 10 and 'percent' in y_col.lower() or 'distribution' in y_col.lower():
+        share = "percent" in y_col.lower() or "distribution" in y_col.lower()
+        if share and profile[x_col]["distinct"] <= 10:
             return {
                 "chart_type": "pie",
                 "x_column": x_col,
@@ -60,78 +69,135 @@ def auto_detect_chart_type(df):
     return None
 
 
-def create_bar_chart(df, x_col, y_col, title="Bar Chart"):
-    fig = px.bar(
-        df, x=x_col, y=y_col, title=title,
-        template=DARK_THEME["template"]
-    )
+def _values(series):
+    # Plain NumPy arrays for the trace; nullable/Arrow columns become float or object
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy()
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        if series.hasnans:
+            return series.to_numpy(dtype=np.float64, na_value=np.nan)
+        return series.to_numpy()
+    return series.to_numpy(dtype=object, na_value=None)
 
-    fig.update_layout(
+
+@lru_cache(maxsize=1)
+def dark_template():
+    # Validated once; figures then reference it without re-validating.
+    # Plotly is imported on the first chart, not at app start.
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    template = go.layout.Template(pio.templates[DARK_THEME["template"]])
+    template.layout.update(
         paper_bgcolor=DARK_THEME["paper_bgcolor"],
         plot_bgcolor=DARK_THEME["plot_bgcolor"],
         font=dict(color=DARK_THEME["font_color"]),
-        xaxis_title=x_col.replace("_", " ").title(),
-        yaxis_title=y_col.replace("_", " ").title(),
-        showlegend=False
+        colorway=DARK_THEME["colorway"]
     )
+    return template
 
-    if len(df) > 8:
-        fig.update_xaxes(tickangle=45)
 
-    return fig
+def _figure(trace, layout):
+    # Traces and layout are built here from known-good properties, so skip
+    # plotly's per-property validation (most of a figure's construction time)
+    import plotly.graph_objects as go
 
+    layout["template"] = dark_template()
+    return go.Figure(data=[trace], layout=layout, _validate=False)
 
-def create_pie_chart(df, x_col, y_col, title="Pie Chart"):
-    fig = px.pie(
-        df, names=x_col, values=y_col, title=title,
-        template=DARK_THEME["template"]
-    )
 
-    fig.update_layout(
-        paper_bgcolor=DARK_THEME["paper_bgcolor"],
-        plot_bgcolor=DARK_THEME["plot_bgcolor"],
-        font=dict(color=DARK_THEME["font_color"]),
-        showlegend=True,
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=-0.2,
-            xanchor="center",
-            x=0.5
-        )
-    )
+def _axis_title(column):
+    return {"title": {"text": column.replace("_", " ").title()}}
 
-    fig.update_traces(textposition='inside', textinfo='percent+label')
 
-    return fig
+def create_bar_chart(df, x_col, y_col, title="Bar Chart"):
+    trace = {
+        "type": "bar", "x": _values(df[x_col]), "y": _values(df[y_col]),
+        "hovertemplate": f"{x_col}=%{{x}}<br>{y_col}=%{{y}}<extra></extra>"
+    }
+    xaxis = _axis_title(x_col)
+    if len(df) > 8:
+        xaxis["tickangle"] = 45
+    return _figure(trace, {
+        "title": {"text": title}, "xaxis": xaxis, "yaxis": _axis_title(y_col), "showlegend": False
+    })
 
 
-def create_line_chart(df, x_col, y_col, title="Line Chart"):
-    fig = px.line(
-        df, x=x_col, y=y_col, title=title,
-        template=DARK_THEME["template"],
-        markers=True
-    )
+def create_pie_chart(df, x_col, y_col, title="Pie Chart"):
+    trace = {
+        "type": "pie", "labels": _values(df[x_col]), "values": _values(df[y_col]),
+        "textposition": "inside", "textinfo": "percent+label",
+        "hovertemplate": f"{x_col}=%{{label}}<br>{y_col}=%{{value}}<extra></extra>"
+    }
+    return _figure(trace, {
+        "title": {"text": title}, "showlegend": True,
+        "legend": {"orientation": "h", "yanchor": "bottom", "y": -0.2, "xanchor": "center", "x": 0.5}
+    })
+
+
+def create_line_chart(df, x_col, y_col, title="Line Chart", webgl=False):
+    trace = {
+        "type": "scattergl" if webgl else "scatter",
+        "mode": "lines" if webgl else "lines+markers",
+        "x": _values(df[x_col]), "y": _values(df[y_col]),
+        "hovertemplate": f"{x_col}=%{{x}}<br>{y_col}=%{{y}}<extra></extra>"
+    }
+    grid = {"showgrid": True, "gridwidth": 1, "gridcolor": "rgba(128,128,128,0.2)"}
+    return _figure(trace, {
+        "title": {"text": title},
+        "xaxis": {**_axis_title(x_col), **grid},
+        "yaxis": {**_axis_title(y_col), **grid},
+        "showlegend": False
+    })
 
-    fig.update_layout(
-        paper_bgcolor=DARK_THEME["paper_bgcolor"],
-        plot_bgcolor=DARK_THEME["plot_bgcolor"],
-        font=dict(color=DARK_THEME["font_color"]),
-        xaxis_title=x_col.replace("_", " ").title(),
-        yaxis_title=y_col.replace("_", " ").title(),
-        showlegend=False
-    )
 
-    fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor='rgba(128,128,128,0.2)')
-    fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='rgba(128,128,128,0.2)')
+def figure_to_json(fig):
+    # The shared template is left out of the cached JSON and re-attached on load
+    import plotly.io as pio
 
-    return fig
+    payload = fig.to_plotly_json()
+    payload["layout"] = {k: v for k, v in payload["layout"].items() if k != "template"}
+    return pio.to_json(payload, validate=False)
+
+
+def figure_from_json(text):
+    payload = json.loads(text)
+    return _figure(payload["data"][0], payload["layout"])
+
+
+def _worth_caching(df, viz_config):
+    # A hit still parses the JSON and constructs a Figure, so it only beats a
+    # rebuild when the build had to downsample or bucket the data first
+    limit = {
+        "line": config.CHART_MAX_POINTS,
+        "bar": config.CHART_BAR_TOP_N,
+        "pie": config.CHART_PIE_TOP_N
+    }.get(viz_config.get("chart_type"))
+    return limit is not None and len(df) > limit
 
 
-def create_chart(df, viz_config):
+def create_chart(df, viz_config, use_cache=True):
     if not viz_config.get("needed", False):
         return None
 
+    with span("chart.build", rows=len(df), cached=False) as current:
+        use_cache = use_cache and config.FIGURE_CACHE_ENABLED and _worth_caching(df, viz_config)
+        cache = get_figure_cache() if use_cache else None
+        key = make_figure_key(df, viz_config) if cache else None
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                current.set(chart_type=viz_config.get("chart_type"), built=True, cached=True)
+                return figure_from_json(cached)
+
+        fig = _create_chart(df, viz_config)
+        current.set(chart_type=viz_config.get("chart_type"), built=fig is not None)
+        if key is not None and fig is not None:
+            cache.put(key, figure_to_json(fig))
+        return fig
+
+
+def _create_chart(df, viz_config):
     chart_type = viz_config.get("chart_type")
     x_col = viz_config.get("x_column")
     y_col = viz_config.get("y_column")
@@ -162,7 +228,11 @@ def create_chart(df, viz_config):
     }
 
     creator = chart_creators.get(chart_type)
-    if creator:
-        return creator(df, x_col, y_col, title)
+    if not creator:
+        return None
 
-    return None
+    df, reduction, webgl = reduce_for_chart(df, chart_type, x_col, y_col, viz_config.get("additive", False))
+    fig = creator(df, x_col, y_col, title, webgl=True) if webgl else creator(df, x_col, y_col, title)
+    if reduction:
+        fig.update_layout(meta={"reduction": reduction})
+    return fig
@@ -0,0 +1,94 @@
+import json
+import threading
+from collections import OrderedDict
+
+import config
+
+
+def make_figure_key(df, viz_config):
+    # Keyed on the result-cache key execute_query leaves in df.attrs (SQL,
+    # row limit, database version) rather than on a hash of the frame, which
+    # cost as much as building the figure. Frames without one are not cached.
+    result_key = df.attrs.get("result_key")
+    if result_key is None:
+        return None
+    source = json.dumps([result_key, len(df), [str(c) for c in df.columns]], default=str)
+    return source, json.dumps(viz_config, sort_keys=True, default=str)
+
+
+class FigureCache:
+    # Serialised figure JSON by (result key, viz config), LRU-evicted by size.
+    # Storing JSON rather than figures means a hit can never hand out a figure
+    # another caller has since mutated.
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or config.FIGURE_CACHE_MAX_BYTES
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return text
+
+    def put(self, key, text):
+        size = len(text)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+
+            self._entries[key] = text
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_ratio": self._hits / lookups if lookups else 0.0
+            }
+
+
+_cache_lock = threading.Lock()
+_cache = None
+
+
+def get_figure_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = FigureCache()
+    return _cache
+
+
+def get_figure_cache_stats():
+    return get_figure_cache().stats()
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+import config
+
+PROFILE_ATTR = "column_profile"
+
+
+def _sample_positions(rows, size, seed=0):
+    # Positions drawn with replacement: O(size) however many rows there are
+    if rows <= size:
+        return None
+    rng = np.random.default_rng(seed)
+    return np.unique(rng.integers(0, rows, size))
+
+
+def estimate_distinct(values, rows):
+    # GEE estimator: values seen once in the sample are scaled up by
+    # sqrt(rows / sample), values seen more often are counted as-is
+    counts = values.value_counts(dropna=True).to_numpy()
+    sampled = len(values)
+    if sampled == 0:
+        return 0
+    if sampled >= rows:
+        return len(counts)
+    singletons = int((counts == 1).sum())
+    return int(round(np.sqrt(rows / sampled) * singletons + (len(counts) - singletons)))
+
+
+def _profile_column(values, rows):
+    non_null = values.dropna()
+    profile = {
+        "kind": "text",
+        "null_ratio": round(1 - len(non_null) / len(values), 4) if len(values) else 0.0,
+        "distinct": estimate_distinct(non_null, rows),
+        "numeric_ratio": 0.0,
+        "datetime_ratio": 0.0,
+    }
+    if pd.api.types.is_bool_dtype(values):
+        profile["kind"] = "boolean"
+    elif pd.api.types.is_datetime64_any_dtype(values):
+        profile["kind"] = "datetime"
+        profile["datetime_ratio"] = 1.0
+    elif pd.api.types.is_numeric_dtype(values):
+        profile["kind"] = "numeric"
+        profile["numeric_ratio"] = 1.0
+    elif len(non_null):
+        text = non_null.astype(str)
+        profile["numeric_ratio"] = round(float(pd.to_numeric(text, errors="coerce").notna().mean()), 4)
+        # ISO 8601 only: '2010-01' and '2010' parse, 'AC/DC 2019' and 'March' do not
+        parsed = pd.to_datetime(text, errors="coerce", format="ISO8601")
+        profile["datetime_ratio"] = round(float(parsed.notna().mean()), 4)
+        if profile["datetime_ratio"] >= config.PROFILE_DATETIME_RATIO:
+            profile["kind"] = "datetime"
+    return profile
+
+
+def profile_frame(df):
+    # Column kinds, coercion success rates and approximate cardinality from a
+    # bounded random sample; kept in df.attrs so each result is profiled once
+    columns = [str(c) for c in df.columns]
+    cached = df.attrs.get(PROFILE_ATTR)
+    if cached and cached["rows"] == len(df) and cached["columns"] == columns:
+        return cached["profile"]
+
+    rows = len(df)
+    positions = _sample_positions(rows, config.PROFILE_SAMPLE_ROWS)
+    sample = df if positions is None else df.iloc[positions]
+    profile = {
+        str(column): _profile_column(sample.iloc[:, i], rows)
+        for i, column in enumerate(df.columns)
+    }
+    df.attrs[PROFILE_ATTR] = {"rows": rows, "columns": columns, "profile": profile}
+    return profile
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+import config
+from utils.tracing import span
+
+OTHER_LABEL = "Other"
+
+
+def _payload_bytes(df, x_col, y_col):
+    # Roughly what Plotly will ship to the browser for these two columns
+    return len(df[[x_col, y_col]].to_json(orient="values", date_format="iso"))
+
+
+def _numeric_x(x):
+    if pd.api.types.is_datetime64_any_dtype(x):
+        return x.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+    if pd.api.types.is_numeric_dtype(x):
+        return x.to_numpy(dtype=np.float64, na_value=np.nan)
+    # Categorical or string x (e.g. '2010-01'): rows are evenly spaced as drawn
+    return np.arange(len(x), dtype=np.float64)
+
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keep the first and last points and, from
+    # each bucket in between, the point forming the largest triangle with the
+    # previously kept point and the average of the next bucket.
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    counts = np.diff(np.append(edges, n))
+    averages_x = np.add.reduceat(x, edges) / counts
+    averages_y = np.add.reduceat(y, edges) / counts
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - averages_x[i + 1]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (averages_y[i + 1] - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, threshold):
+    # The minimum and maximum of each of threshold/2 buckets, in order;
+    # keeps every spike, unlike LTTB which may smooth over one.
+    n = len(y)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return np.arange(n)
+
+    # Edges as in lttb_indices: every bucket holds at least one row
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    bucket_of = np.repeat(np.arange(buckets), np.diff(edges))
+    nan = np.isnan(y)
+    # Sorted by (bucket, value), each bucket keeps its slice edges[b]:edges[b+1];
+    # NaNs sort past the extremes so they are only picked from all-NaN buckets
+    lows = np.lexsort((np.where(nan, np.inf, y), bucket_of))[edges[:-1]]
+    highs = np.lexsort((np.where(nan, np.inf, -y), bucket_of))[edges[:-1]]
+    return np.unique(np.concatenate(([0, n - 1], lows, highs)))
+
+
+def downsample_line(df, x_col, y_col, threshold=None, method=None):
+    threshold = threshold or config.CHART_MAX_POINTS
+    method = method or config.CHART_LINE_DOWNSAMPLER
+    if len(df) <= threshold:
+        return df
+
+    y = df[y_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    finite = np.flatnonzero(np.isfinite(y))
+    if len(finite) <= threshold:
+        return df
+
+    if method == "minmax":
+        keep = minmax_indices(y[finite], threshold)
+    else:
+        keep = lttb_indices(_numeric_x(df[x_col])[finite], y[finite], threshold)
+    return df.iloc[finite[keep]]
+
+
+def top_n(df, x_col, y_col, n, additive=False):
+    # The n-1 largest categories in their original order. Only an additive
+    # measure (a SUM or COUNT) has the rest summed into a final "Other"
+    # slice/bar; summing averages, maxima or ratios would be meaningless.
+    if len(df) <= n or n < 2:
+        return df
+    y = df[y_col]
+    if not pd.api.types.is_numeric_dtype(y) or pd.api.types.is_bool_dtype(y):
+        return df
+
+    if not additive:
+        values = y.to_numpy(dtype=np.float64, na_value=np.nan)
+        keep = np.sort(np.argsort(-np.nan_to_num(values, nan=-np.inf), kind="stable")[:n - 1])
+        return df.iloc[keep]
+
+    totals = df.groupby(x_col, sort=False, dropna=False)[y_col].sum()
+    if len(totals) <= n:
+        return totals.reset_index()
+
+    values = totals.to_numpy(dtype=np.float64, na_value=0.0)
+    keep = np.sort(np.argpartition(-values, n - 2)[:n - 1])
+    rest = np.ones(len(values), dtype=bool)
+    rest[keep] = False
+
+    labels = totals.index.to_numpy()[keep].astype(str).tolist() + [OTHER_LABEL]
+    return pd.DataFrame({x_col: labels, y_col: np.append(values[keep], values[rest].sum())})
+
+
+def reduce_for_chart(df, chart_type, x_col, y_col, additive=False):
+    # Returns the frame to plot, a summary of what was dropped (None when the
+    # frame is plotted as-is) and whether the trace should render with WebGL
+    rows = len(df)
+    with span("chart.reduce", rows=rows) as current:
+        if chart_type == "line":
+            reduced = downsample_line(df, x_col, y_col)
+            method = config.CHART_LINE_DOWNSAMPLER
+        elif chart_type in ("bar", "pie"):
+            limit = config.CHART_PIE_TOP_N if chart_type == "pie" else config.CHART_BAR_TOP_N
+            reduced = top_n(df, x_col, y_col, limit, additive)
+            method = "top_n" if additive else "top_rows"
+        else:
+            reduced = df
+
+        webgl = chart_type == "line" and len(reduced) > config.CHART_WEBGL_THRESHOLD
+        current.set(points=len(reduced), webgl=webgl)
+        if len(reduced) == rows:
+            return df, None, webgl
+
+        summary = {
+            "method": method,
+            "rows": rows,
+            "points": len(reduced),
+            "bytes_before": _payload_bytes(df, x_col, y_col),
+            "bytes_after": _payload_bytes(reduced, x_col, y_col),
+        }
+        current.set(method=method, bytes_before=summary["bytes_before"], bytes_after=summary["bytes_after"])
+        return reduced, summary, webgl